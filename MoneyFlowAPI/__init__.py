@@ -19,6 +19,53 @@ def default_config(config_path: Path) -> ConfigParser:
         "engine": 'sqlite',
         "name": os.path.join(config_path, "moneyflow.sqlite3"),
     }
+    def_conf["Profiling"] = {
+        "enabled": "false",
+        "slow_request_ms": "500",
+        "sample_rate": "0",
+        "profile_dir": os.path.join(config_path, "profiles"),
+    }
+    def_conf["Cache"] = {
+        "backend": "locmem",
+        "location": os.path.join(config_path, "cache"),
+        "timeout": "300",
+    }
+    # Uploaded statements are kept in store_dir to be reprocessed, decrypted for password protected parsers, until
+    # every file uploaded with them is deleted
+    def_conf["Uploads"] = {
+        "store_dir": os.path.join(config_path, "uploads"),
+        "lock_expiry": "900",
+    }
+    def_conf["Auth"] = {
+        "user_cache_ttl": "30",
+        "user_cache_size": "1024",
+    }
+    def_conf["Metrics"] = {
+        "enabled": "true",
+        "store_dir": os.path.join(config_path, "metrics"),
+        "endpoint": "false",
+        "allowed_ips": "",
+    }
+    def_conf["Transfers"] = {
+        "window_days": "3",
+    }
+    def_conf["Analytics"] = {
+        "columnar_cache": "false",
+        "memory_mb": "256",
+    }
+    def_conf["Anomalies"] = {
+        "window": "30",
+        "min_history": "5",
+        "threshold": "3.5",
+        "duplicate_hours": "24",
+    }
+    def_conf["Recurring"] = {
+        "min_txns": "3",
+        "min_period_days": "6",
+        "max_period_days": "400",
+        "period_tolerance": "0.2",
+        "amount_tolerance": "0.1",
+    }
 
     return def_conf
 
@@ -87,3 +134,12 @@ db_engine_mapping = {
 
 if USER_SETTINGS.get('DB', 'engine') not in db_engine_mapping.keys():
     raise ImproperlyConfigured(f"{USER_SETTINGS.get('DB', 'engine')} is not supported!")
+
+cache_backend_mapping = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'none': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+if USER_SETTINGS.get('Cache', 'backend') not in cache_backend_mapping.keys():
+    raise ImproperlyConfigured(f"{USER_SETTINGS.get('Cache', 'backend')} cache is not supported!")
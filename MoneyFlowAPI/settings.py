@@ -14,7 +14,7 @@ from pathlib import Path
 
 from corsheaders.defaults import default_headers
 
-from . import USER_SETTINGS, db_engine_mapping
+from . import USER_SETTINGS, cache_backend_mapping, db_engine_mapping
 
 db_config = {
     'ENGINE': db_engine_mapping[USER_SETTINGS.get('DB', 'engine')],
@@ -75,6 +75,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if USER_SETTINGS.getboolean('Profiling', 'enabled'):
+    MIDDLEWARE.insert(0, 'core.middleware.ProfilingMiddleware')
+
+if USER_SETTINGS.getboolean('Metrics', 'enabled'):
+    MIDDLEWARE.insert(0, 'core.middleware.MetricsMiddleware')
+
 ROOT_URLCONF = 'MoneyFlowAPI.urls'
 
 TEMPLATES = [
@@ -103,6 +109,18 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': cache_backend_mapping[USER_SETTINGS.get('Cache', 'backend')],
+        'LOCATION': USER_SETTINGS.get('Cache', 'location'),
+        'TIMEOUT': USER_SETTINGS.getint('Cache', 'timeout'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -161,7 +179,7 @@ CORS_ALLOW_CREDENTIALS = True
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication'
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .authentication import invalidate_user
+
+        post_save.connect(invalidate_user, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(invalidate_user, sender=settings.AUTH_USER_MODEL)
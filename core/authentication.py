@@ -0,0 +1,112 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .metrics import AUTH_USER_CACHE
+
+
+class UserCache:
+    """
+    Per-process LRU cache of the users resolved from access tokens, each kept for `ttl` seconds. Saving or
+    deleting a user, and logging out, drops them from the cache of the process handling it; other processes
+    see the change once their entry expires, as they do for bulk updates that send no signals.
+    """
+
+    def __init__(self, ttl: float, max_users: int):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.users: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self.lock:
+            entry = self.users.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.users.move_to_end(key)
+                AUTH_USER_CACHE.inc(result='hit')
+                return entry[1]
+            self.users.pop(key, None)
+
+        AUTH_USER_CACHE.inc(result='miss')
+        return None
+
+    def put(self, user_id, user) -> None:
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.users[str(user_id)] = (time.monotonic() + self.ttl, user)
+            self.users.move_to_end(str(user_id))
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+
+    def invalidate(self, user_id) -> None:
+        with self.lock:
+            self.users.pop(str(user_id), None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.users.clear()
+
+
+USERS = UserCache(settings.USER_SETTINGS.getfloat('Auth', 'user_cache_ttl'),
+                  settings.USER_SETTINGS.getint('Auth', 'user_cache_size'))
+
+
+def invalidate_user(sender, instance, **kwargs) -> None:
+    """
+    Signal receiver dropping a saved or deleted user from the cache, so password changes and deactivations
+    apply to the next request.
+    """
+    USERS.invalidate(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    simplejwt's `JWTAuthentication` resolving the token's user from `USERS`, so that only the first request of
+    a user within `[Auth] user_cache_ttl` seconds loads them from the database. Each request gets its own copy
+    of the cached user.
+    """
+
+    def get_user(self, validated_token: Token):
+        user = self.get_cached_user(validated_token)
+        if user is None:
+            user = super().get_user(validated_token)
+            USERS.put(validated_token[api_settings.USER_ID_CLAIM], user)
+        return copy.copy(user)
+
+    async def aget_user(self, validated_token: Token):
+        """
+        Async variant of `get_user`, for the async views.
+        """
+        user = self.get_cached_user(validated_token)
+        if user is None:
+            user = await sync_to_async(super().get_user)(validated_token)
+            USERS.put(validated_token[api_settings.USER_ID_CLAIM], user)
+        return copy.copy(user)
+
+    @staticmethod
+    def get_cached_user(validated_token: Token):
+        """
+        The cached user of the token. Users are only cached once `JWTAuthentication.get_user` accepted them,
+        so only the token's password hash still needs checking.
+        """
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken("Token contained no recognizable user identification") from e
+
+        user = USERS.get(user_id)
+        if user is not None and api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+        return user
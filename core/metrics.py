@@ -0,0 +1,254 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+
+class MetricsRegistry:
+    """
+    Low-overhead in-process metric registry that is shared across worker processes through the filesystem.
+
+    Every process keeps its samples in plain dicts and periodically writes them to ``<store_dir>/<pid>.json``.
+    A scrape merges the files of all processes, so counters add up across workers without any locking between
+    processes. Files of dead processes are pruned when a process starts, see `prune`.
+    """
+
+    def __init__(self, store_dir: str, flush_interval: float = 1.0):
+        self.store_dir = store_dir
+        self.flush_interval = flush_interval
+        self.metrics: dict[str, '_Metric'] = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+        self.reset()
+
+    def reset(self) -> None:
+        self.counters: dict[tuple, float] = defaultdict(float)
+        self.histograms: dict[tuple, list] = {}
+        self.last_flush = 0.0
+        self.pid = os.getpid()
+        self.prune()
+
+    def prune(self) -> None:
+        """
+        Removes the files of processes that are gone, including the one left under this process' PID by an
+        earlier process, which this one would otherwise overwrite. Their samples drop out of the scrapes, which
+        Prometheus handles as a counter reset.
+        """
+        for file_name in os.listdir(self.store_dir):
+            pid = file_name.split('.', 1)[0]
+            if not pid.isdigit() or not (int(pid) == self.pid or not pid_alive(int(pid))):
+                continue
+            try:
+                os.remove(os.path.join(self.store_dir, file_name))
+            except FileNotFoundError:
+                # Pruned concurrently by another process
+                pass
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> 'Counter':
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> 'Histogram':
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric: '_Metric') -> '_Metric':
+        self.metrics[metric.name] = metric
+        return metric
+
+    def _changed(self) -> None:
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            payload = {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), values] for (name, labels), values in self.histograms.items()],
+            }
+            self.last_flush = time.monotonic()
+        path = os.path.join(self.store_dir, f"{self.pid}.json")
+        with self.flush_lock:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(payload, f)
+            os.replace(path + '.tmp', path)
+
+    def collect(self) -> tuple[dict, dict]:
+        """
+        Merges the samples of every process that has written to the store.
+        """
+        self.flush()
+        counters = defaultdict(float)
+        histograms = {}
+        for file_name in os.listdir(self.store_dir):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.store_dir, file_name)) as f:
+                    payload = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in payload['counters']:
+                counters[(name, tuple(labels))] += value
+            for name, labels, values in payload['histograms']:
+                key = (name, tuple(labels))
+                if key in histograms:
+                    histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+                else:
+                    histograms[key] = values
+        return counters, histograms
+
+    def render(self) -> str:
+        """
+        Renders all samples in the Prometheus text exposition format.
+        """
+        counters, histograms = self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            samples = counters if isinstance(metric, Counter) else histograms
+            series = sorted((labels, value) for (name, labels), value in samples.items() if name == metric.name)
+            if not series:
+                continue
+            lines.append(f"# HELP {metric.family} {metric.documentation}")
+            lines.append(f"# TYPE {metric.family} {metric.kind}")
+            for labels, value in series:
+                lines.extend(metric.expose(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def pid_alive(pid: int) -> bool:
+    if os.name == 'nt':
+        # Signal 0 is CTRL_C_EVENT on Windows, only the files of reused PIDs are pruned there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def format_labels(labelnames: tuple[str, ...], labels: tuple, **extra) -> str:
+    pairs = list(zip(labelnames, labels)) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry: MetricsRegistry, name: str, documentation: str, labelnames: tuple[str, ...]):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    @property
+    def family(self) -> str:
+        return self.name
+
+    def key(self, labels: dict) -> tuple:
+        return self.name, tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    @property
+    def family(self) -> str:
+        return self.name + '_total'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        with self.registry.lock:
+            self.registry.counters[self.key(labels)] += amount
+        self.registry._changed()
+
+    def expose(self, labels: tuple, value: float) -> list[str]:
+        return [f"{self.family}{format_labels(self.labelnames, labels)} {format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry: MetricsRegistry, name: str, documentation: str, labelnames: tuple[str, ...],
+                 buckets: tuple[float, ...]):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels) -> None:
+        key = self.key(labels)
+        with self.registry.lock:
+            # Layout: one non-cumulative count per bucket, followed by the sum and the count
+            values = self.registry.histograms.get(key)
+            if values is None:
+                values = self.registry.histograms[key] = [0] * (len(self.buckets) + 2)
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[idx] += 1
+                    break
+            values[-2] += value
+            values[-1] += 1
+        self.registry._changed()
+
+    def expose(self, labels: tuple, values: list) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, values):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le=format_value(bound))} "
+                         f"{cumulative}")
+        lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(values[-2])}")
+        lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {values[-1]}")
+        return lines
+
+
+def format_gauge(name: str, documentation: str, samples: list[tuple[dict, float]]) -> str:
+    """
+    Renders a gauge computed at scrape time, which does not need to live in the shared registry.
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{format_labels(tuple(labels), tuple(labels.values()))} {format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry(settings.USER_SETTINGS.get('Metrics', 'store_dir'))
+os.register_at_fork(after_in_child=REGISTRY.reset)
+atexit.register(REGISTRY.flush)
+
+REQUEST_LATENCY = REGISTRY.histogram('moneyflow_request_duration_seconds', "Request latency by view.",
+                                     ('view', 'method'))
+REQUEST_QUERIES = REGISTRY.counter('moneyflow_request_db_queries', "Database queries executed by view.",
+                                   ('view',))
+UPLOADS = REGISTRY.counter('moneyflow_uploads', "Uploaded transaction files by parser and final status.",
+                           ('parser', 'status'))
+UPLOAD_ROWS = REGISTRY.counter('moneyflow_upload_rows', "Transactions inserted from uploaded files by parser.",
+                               ('parser',))
+UPLOAD_SECONDS = REGISTRY.counter('moneyflow_upload_seconds', "Time spent ingesting uploaded files by parser.",
+                                  ('parser',))
+GROUPER_RENDERS = REGISTRY.counter('moneyflow_grouper_renders', "Grouper template renders by grouper.",
+                                   ('grouper',))
+RESPONSE_CACHE = REGISTRY.counter('moneyflow_response_cache_requests', "Response cache lookups by view and result.",
+                                  ('view', 'result'))
+COLUMNAR_CACHE = REGISTRY.counter('moneyflow_columnar_cache_events', "Columnar analytics cache lookups and evictions.",
+                                  ('result',))
+AUTH_USER_CACHE = REGISTRY.counter('moneyflow_auth_user_cache_requests', "Token user cache lookups by result.",
+                                   ('result',))
+INGESTION_LOCK_WAIT = REGISTRY.histogram('moneyflow_ingestion_lock_wait_seconds',
+                                         "Time uploads waited for the lock of their account or card.", ('source',))
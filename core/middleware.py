@@ -0,0 +1,168 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+
+from .metrics import REQUEST_LATENCY, REQUEST_QUERIES
+
+logger = logging.getLogger(__name__)
+
+# cProfile runs on sys.monitoring from Python 3.12, which allows a single profiler per process, so one sampled
+# request is profiled at a time and the others run unprofiled
+PROFILER_LOCK = threading.Lock()
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that records every query run on a connection along with its duration.
+    """
+
+    def __init__(self):
+        self.queries: list[tuple[str, float]] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def duration(self) -> float:
+        return sum(duration for _, duration in self.queries)
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that only counts queries, for use on every request.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Records request latency and query counts per resolved view name into the shared metrics registry.
+    Enabled with ``enabled = true`` in the ``[Metrics]`` section of ``config.ini``.
+
+    The middleware is async capable, so ASGI deployments don't hand every request to a thread. Queries of async
+    requests run on the connections of the ORM's worker threads and are not counted, only their latency is.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(counter))
+            response = self.get_response(request)
+
+        self.record(request, time.perf_counter() - start, counter.count)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        start = time.perf_counter()
+        response = await self.get_response(request)
+
+        self.record(request, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def record(request: HttpRequest, elapsed: float, queries: int = 0) -> None:
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        REQUEST_LATENCY.observe(elapsed, view=view, method=request.method)
+        REQUEST_QUERIES.inc(queries, view=view)
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in per-request profiler, enabled with ``enabled = true`` in the ``[Profiling]`` section of ``config.ini``.
+
+    Every request gets a ``Server-Timing`` header with the wall time, DB time and query count. Requests slower
+    than ``slow_request_ms`` are logged together with their SQL, and a ``sample_rate`` fraction of requests is
+    run under cProfile with the stats dumped to ``profile_dir``. Requests sampled while another one is being
+    profiled are not profiled.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_request_ms = settings.USER_SETTINGS.getfloat('Profiling', 'slow_request_ms')
+        self.sample_rate = settings.USER_SETTINGS.getfloat('Profiling', 'sample_rate')
+        self.profile_dir = settings.USER_SETTINGS.get('Profiling', 'profile_dir')
+        if self.sample_rate > 0:
+            os.makedirs(self.profile_dir, exist_ok=True)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        recorder = QueryRecorder()
+        profiler = None
+        if random.random() < self.sample_rate and PROFILER_LOCK.acquire(blocking=False):
+            profiler = cProfile.Profile()
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            if profiler:
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Another profiling tool, like a debugger, is active in the process
+                    profiler = None
+                    PROFILER_LOCK.release()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+                    PROFILER_LOCK.release()
+        wall_ms = (time.perf_counter() - start) * 1000
+        db_ms = recorder.duration * 1000
+
+        response['Server-Timing'] = (f'app;dur={wall_ms:.1f}, '
+                                     f'db;dur={db_ms:.1f};desc="{recorder.count} queries"')
+
+        if wall_ms >= self.slow_request_ms:
+            logger.warning(
+                "Slow request %s %s: %.1fms (db %.1fms, %d queries)\n%s",
+                request.method, request.get_full_path(), wall_ms, db_ms, recorder.count,
+                '\n'.join(f"  [{duration * 1000:.1f}ms] {sql}" for sql, duration in recorder.queries)
+            )
+
+        if profiler:
+            self.dump_profile(profiler, request)
+
+        return response
+
+    def dump_profile(self, profiler: cProfile.Profile, request: HttpRequest) -> None:
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+        file_name = f"{time.strftime('%Y%m%d-%H%M%S')}_{request.method}_{slug}_{os.getpid()}.prof"
+        profiler.dump_stats(os.path.join(self.profile_dir, file_name))
@@ -1,3 +1,91 @@
-from django.test import TestCase
+import cProfile
+import json
+import os
+import tempfile
+import threading
 
-# Create your tests here.
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from .metrics import MetricsRegistry
+from .middleware import PROFILER_LOCK, ProfilingMiddleware
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+
+    def write(self, pid: int, value: float) -> None:
+        with open(os.path.join(self.store_dir, f"{pid}.json"), 'w') as f:
+            json.dump({'counters': [['renders', [], value]], 'histograms': []}, f)
+
+    def test_merges_the_samples_of_live_processes(self):
+        registry = MetricsRegistry(self.store_dir)
+        counter = registry.counter('renders', "Renders.")
+        self.write(os.getppid(), 5)
+
+        counter.inc(2)
+        counters, _ = registry.collect()
+
+        self.assertEqual(counters[('renders', ())], 7)
+
+    def test_prunes_the_files_of_dead_and_reused_pids(self):
+        dead_pid = 2 ** 22 + 1  # Above the default pid_max, never a live process
+        self.write(dead_pid, 5)
+        self.write(os.getpid(), 3)
+        self.write(os.getppid(), 1)
+
+        registry = MetricsRegistry(self.store_dir)
+        registry.counter('renders', "Renders.").inc()
+        counters, _ = registry.collect()
+
+        self.assertEqual(sorted(os.listdir(self.store_dir)), sorted([f"{os.getpid()}.json", f"{os.getppid()}.json"]))
+        self.assertEqual(counters[('renders', ())], 2)
+
+
+class ProfilingMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.profile_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.both_in_view = threading.Barrier(2, timeout=5)
+
+    def middleware(self, view) -> ProfilingMiddleware:
+        middleware = ProfilingMiddleware(view)
+        middleware.sample_rate = 1
+        middleware.profile_dir = self.profile_dir
+        return middleware
+
+    def test_concurrent_sampled_requests_are_served(self):
+        def view(_request):
+            self.both_in_view.wait()
+            return HttpResponse()
+
+        middleware = self.middleware(view)
+        responses = []
+
+        def serve():
+            responses.append(middleware(RequestFactory().get('/')).status_code)
+
+        threads = [threading.Thread(target=serve) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(responses, [200, 200])
+        self.assertEqual(len(os.listdir(self.profile_dir)), 1)
+        self.assertFalse(PROFILER_LOCK.locked())
+
+    def test_requests_are_served_while_another_profiler_is_active(self):
+        def view(_request):
+            return HttpResponse()
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = self.middleware(view)(RequestFactory().get('/'))
+        finally:
+            profiler.disable()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+        self.assertFalse(PROFILER_LOCK.locked())
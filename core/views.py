@@ -7,6 +7,7 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from .authentication import USERS
 from .serializers import UserSerializer
 
 
@@ -24,12 +25,14 @@ def check_conn(_request: Request) -> Response:
 @api_view(['POST'])
 def logout_user(request: Request) -> Response:
     """
-    Handles user logout by deleting the authentication cookie and returning a success response.
+    Handles user logout by deleting the authentication cookie, and the user from the token user cache, and
+    returning a success response.
 
     :param request: The HTTP request object representing the incoming request to log out a user.
     :return: A response object containing a success message indicating the user has been
              successfully logged out.
     """
+    USERS.invalidate(request.user.pk)
     response = Response({"message": "Successfully logged out"}, status=status.HTTP_200_OK)
     response.delete_cookie(
         settings.SIMPLE_JWT['AUTH_COOKIE'],
@@ -0,0 +1,213 @@
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, QuerySet, Window
+from django.db.models.functions import RowNumber
+
+from .columnar import to_amount
+from .models import Anomaly, CreditTransaction, FileAudit, Transaction
+from .reconciliation import EpochSeconds, paise
+from .recurring import epoch_date, owner_field
+
+# Rows scored per vectorized step, bounding the (rows x window) matrices to a few tens of MB
+CHUNK_SIZE = 100_000
+# Scales the MAD to the standard deviation of normally distributed amounts
+MAD_SCALE = 1.4826
+
+
+def debits(user, source: str) -> QuerySet:
+    """
+    The user's bank or card debits, the only transactions scored.
+    """
+    if source == 'ACC':
+        return Transaction.objects.filter(account__user=user, dbt_amount__gt=0)
+    return CreditTransaction.objects.filter(credit_card__user=user, is_credit=False)
+
+
+def load_debits(queryset: QuerySet, source: str) -> dict[str, np.ndarray | tuple]:
+    """
+    Loads debits as arrays of id, owner (account or card), epoch seconds and amount in hundredths, along with
+    their groups.
+    """
+    queryset = queryset.order_by().annotate(
+        ts=EpochSeconds('txn_date'), cents=paise('dbt_amount' if source == 'ACC' else 'amt'),
+    ).values_list('id', owner_field(source), 'ts', 'cents', 'grp_name')
+
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    ids, owner, ts, cents, grp_name = zip(*rows) if rows else ((),) * 5
+    return {
+        'id': np.array(ids, dtype=np.int64),
+        'owner': np.array(owner, dtype=np.int64),
+        'ts': np.array(ts, dtype=np.int64),
+        'cents': np.array(cents, dtype=np.float64),
+        'grp_name': grp_name,
+    }
+
+
+def rolling_median_mad(codes: np.ndarray, values: np.ndarray, window: int,
+                       chunk_size: int = CHUNK_SIZE) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The median and median absolute deviation of the (up to) `window` values preceding every value of its
+    group, with `codes` sorted. Every row of a chunk is handled at once: its previous values are gathered into
+    a row of a matrix, padded with infinities past the start of the group, and the matrix is sorted row-wise,
+    so that the medians are read at the middle positions of each row's valid prefix.
+
+    :return: The medians, the MADs and the number of values each was computed from.
+    """
+    n = len(values)
+    positions = np.arange(n)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if n else np.zeros(0, dtype=np.int64)
+    history = np.minimum(positions - starts[np.searchsorted(starts, positions, side='right') - 1], window)
+    offsets = np.arange(1, window + 1)
+
+    median, mad = np.zeros(n), np.zeros(n)
+    for low in range(0, n, chunk_size):
+        rows = positions[low:low + chunk_size]
+        k = history[rows]
+        valid = offsets <= k[:, None]
+        prior = np.where(valid, values[np.maximum(rows[:, None] - offsets, 0)], np.inf)
+        prior.sort(axis=1)
+
+        at = np.arange(len(rows)), np.maximum((k - 1) // 2, 0), k // 2
+        middle = np.where(k > 0, (prior[at[0], at[1]] + prior[at[0], at[2]]) / 2, 0)
+        deviations = np.abs(prior - middle[:, None])
+        deviations.sort(axis=1)
+        median[rows] = middle
+        mad[rows] = np.where(k > 0, (deviations[at[0], at[1]] + deviations[at[0], at[2]]) / 2, 0)
+    return median, mad, history
+
+
+def find_duplicates(codes: np.ndarray, rows: dict, hours: int) -> np.ndarray:
+    """
+    Marks the debits following a debit of the same group and amount by less than `hours`, by sorting the rows by
+    (group, amount, date) and comparing every row with the one before it. Statements mostly carry dates only, so
+    with the default of 24 hours a charge repeated the next day isn't a duplicate.
+
+    :param codes: The (owner, group) code of every row.
+    :return: A mask in row order.
+    """
+    order = np.lexsort((rows['id'], rows['ts'], rows['cents'], codes))
+    codes, cents, ts = codes[order], rows['cents'][order], rows['ts'][order]
+    repeats = (codes[1:] == codes[:-1]) & (cents[1:] == cents[:-1]) & (ts[1:] - ts[:-1] < hours * 3600)
+    duplicate = np.zeros(len(order), dtype=bool)
+    duplicate[order[1:][repeats]] = True
+    return duplicate
+
+
+def score_debits(rows: dict) -> dict[str, np.ndarray]:
+    """
+    Scores every debit against the rolling median and MAD of the previous debits of its group in its account or
+    card, in (owner, group, date) order, flagging the ones with enough history and a score of at least the
+    configured threshold, and the duplicates of a debit made within the configured hours before them.
+
+    The MAD is floored at 1% of the median, so that a group of identical amounts doesn't flag every change.
+
+    :return: The row order, and in that order the medians, MADs, scores, duplicate marks and flags.
+    """
+    conf = settings.USER_SETTINGS['Anomalies']
+    groups = {}
+    keys = zip(rows['owner'].tolist(), rows['grp_name'])
+    codes = np.fromiter((groups.setdefault(key, len(groups)) for key in keys), dtype=np.int64, count=len(rows['id']))
+    order = np.lexsort((rows['id'], rows['ts'], codes))
+    values = rows['cents'][order]
+
+    median, mad, history = rolling_median_mad(codes[order], values, conf.getint('window'))
+    scale = np.maximum(MAD_SCALE * mad, np.maximum(0.01 * median, 1))
+    score = np.abs(values - median) / scale
+    duplicate = find_duplicates(codes, rows, conf.getint('duplicate_hours'))[order]
+    flagged = ((history >= conf.getint('min_history')) & (score >= conf.getfloat('threshold'))) | duplicate
+    return {'order': order, 'median': median, 'mad': mad, 'score': score, 'duplicate': duplicate,
+            'flagged': flagged}
+
+
+def build_anomalies(user, source: str, rows: dict, scores: dict, new: np.ndarray = None) -> list[Anomaly]:
+    """
+    Builds the anomalies of the flagged rows, only among the `new` ones when given (a mask in row order).
+    """
+    flagged = scores['flagged'] if new is None else scores['flagged'] & new[scores['order']]
+    txn_field = 'txn_id' if source == 'ACC' else 'card_txn_id'
+    anomalies = []
+    for position in np.flatnonzero(flagged):
+        row = scores['order'][position]
+        anomalies.append(Anomaly(
+            user=user, kind=Anomaly.DUPLICATE if scores['duplicate'][position] else Anomaly.AMOUNT,
+            grp_name=rows['grp_name'][row], txn_date=epoch_date(rows['ts'][row]),
+            amount=to_amount(rows['cents'][row]), median=to_amount(np.rint(scores['median'][position])),
+            mad=to_amount(np.rint(scores['mad'][position])), score=round(float(scores['score'][position]), 4),
+            **{txn_field: int(rows['id'][row])},
+        ))
+    return anomalies
+
+
+def stored(user, source: str) -> QuerySet:
+    return Anomaly.objects.filter(user=user, **{'txn__isnull' if source == 'ACC' else 'card_txn__isnull': False})
+
+
+@transaction.atomic
+def refresh_anomalies(user, source: str = None, groups: list[str] = None) -> int:
+    """
+    Scores the user's debits from scratch, replacing the stored anomalies.
+
+    :param user: The user whose debits are scored.
+    :param source: Only score the bank (`ACC`) or the card (`CC`) debits.
+    :param groups: Only score the debits of these groups.
+    :return: The number of anomalies found.
+    """
+    if groups is not None and not groups:
+        return 0
+    found = 0
+    for each in [source] if source else ['ACC', 'CC']:
+        queryset, existing = debits(user, each), stored(user, each)
+        if groups is not None:
+            queryset, existing = queryset.filter(grp_name__in=groups), existing.filter(grp_name__in=groups)
+        existing.delete()
+
+        rows = load_debits(queryset, each)
+        if len(rows['id']) == 0:
+            continue
+        anomalies = build_anomalies(user, each, rows, score_debits(rows))
+        Anomaly.objects.bulk_create(anomalies, batch_size=1000)
+        found += len(anomalies)
+    return found
+
+
+def update_anomalies(src_file: FileAudit) -> int:
+    """
+    Scores the debits of a newly loaded file, from those rows and the last `window` earlier debits of each
+    group they touch in its account or card, fetched with a window function rather than the whole history. A
+    file going back before debits loaded earlier changes their history too, and triggers a `refresh_anomalies`
+    of its groups instead.
+
+    :param src_file: The loaded file.
+    :return: The number of anomalies found in the file, or in its groups after a refresh.
+    """
+    source = 'ACC' if src_file.op_desc == 'ACC_TXN_UPLOAD' else 'CC'
+    user = src_file.user
+    rows = load_debits(debits(user, source).filter(src_file=src_file), source)
+    if len(rows['id']) == 0:
+        return 0
+
+    groups = sorted(set(rows['grp_name']))
+    start = epoch_date(rows['ts'].min())
+    others = debits(user, source).filter(grp_name__in=groups, **{owner_field(source): src_file.to_id}).exclude(
+        src_file=src_file)
+    if others.filter(txn_date__gt=start).exists():
+        refresh_anomalies(user, source, groups)
+        return stored(user, source).filter(grp_name__in=groups).count()
+
+    window = settings.USER_SETTINGS.getint('Anomalies', 'window')
+    prior = load_debits(others.filter(txn_date__lte=start).annotate(
+        rank=Window(RowNumber(), partition_by=F('grp_name'), order_by=[F('txn_date').desc(), F('id').desc()]),
+    ).filter(rank__lte=window), source)
+
+    combined = {key: np.concatenate((prior[key], rows[key])) for key in ('id', 'owner', 'ts', 'cents')}
+    combined['grp_name'] = prior['grp_name'] + rows['grp_name']
+    new = np.r_[np.zeros(len(prior['id']), dtype=bool), np.ones(len(rows['id']), dtype=bool)]
+
+    anomalies = build_anomalies(user, source, combined, score_debits(combined), new)
+    Anomaly.objects.bulk_create(anomalies, batch_size=1000)
+    return len(anomalies)
@@ -0,0 +1,139 @@
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db.models import Count, DateField, F, Max, Min, Window
+from django.db.models.functions import RowNumber, Trunc
+
+from .models import Account, Transaction
+
+SQLITE_TRUNC_MODIFIERS = {
+    'day': (),
+    'week': ("'-6 days'", "'weekday 1'"),
+    'month': ("'start of month'",),
+    'year': ("'start of year'",),
+}
+
+
+def utc_offsets(tz: ZoneInfo, start: datetime, end: datetime) -> list[tuple[datetime, timedelta]]:
+    """
+    Lists the UTC offsets of a time zone in force between two instants as (effective from, offset)
+    pairs, the first one being effective from `start`. Transitions are located to the second.
+    """
+    offsets = [(start, start.astimezone(tz).utcoffset())]
+    day = start
+    while day < end:
+        next_day = min(day + timedelta(days=1), end)
+        if next_day.astimezone(tz).utcoffset() != offsets[-1][1]:
+            low, high = day, next_day
+            while high - low > timedelta(seconds=1):
+                mid = low + (high - low) / 2
+                if mid.astimezone(tz).utcoffset() == offsets[-1][1]:
+                    low = mid
+                else:
+                    high = mid
+            offsets.append((high, high.astimezone(tz).utcoffset()))
+        day = next_day
+    return offsets
+
+
+class LocalTrunc(Trunc):
+    """
+    Trunc to a DateField in a local time zone that SQLite evaluates natively.
+
+    Django's SQLite backend implements time zone aware truncation with a Python function called for
+    every row, which dominates the cost of bucketing large histories. Given the time span of the data,
+    the UTC offsets in force are known up front and the truncation is expressed with SQLite's own
+    date functions instead. Other backends use the regular Trunc.
+    """
+
+    def __init__(self, expression, kind: str, tzinfo: ZoneInfo, start: datetime, end: datetime, **extra):
+        super().__init__(expression, kind, output_field=DateField(), tzinfo=tzinfo, **extra)
+        self.start = start
+        self.end = end
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        if self.kind not in SQLITE_TRUNC_MODIFIERS:
+            return self.as_sql(compiler, connection, **extra_context)
+
+        lhs_sql, lhs_params = compiler.compile(self.lhs)
+        offsets = utc_offsets(self.tzinfo, self.start, self.end)
+
+        def modifier(offset: timedelta) -> str:
+            return f"{int(offset.total_seconds()) // 60:+d} minutes"
+
+        if len(offsets) == 1:
+            offset_sql, offset_params = '%s', [modifier(offsets[0][1])]
+        else:
+            whens, offset_params = [], []
+            for (_, offset), (until, _) in zip(offsets, offsets[1:]):
+                whens.append(f"WHEN {lhs_sql} < %s THEN %s")
+                offset_params += [*lhs_params, connection.ops.adapt_datetimefield_value(until), modifier(offset)]
+            offset_sql = f"CASE {' '.join(whens)} ELSE %s END"
+            offset_params.append(modifier(offsets[-1][1]))
+
+        sql = ', '.join((lhs_sql, offset_sql, *SQLITE_TRUNC_MODIFIERS[self.kind]))
+        return f"date({sql})", [*lhs_params, *offset_params]
+
+
+def balance_history(acc: Account, from_date: date = None, to_date: date = None, interval: str = 'day') -> list[dict]:
+    """
+    Computes the closing balance of an account for every day, week or month that has transactions.
+
+    Everything happens in a single SQL query: the transactions are bucketed in the home time zone,
+    window functions number the rows of each bucket from the latest one and compute the bucket's
+    lowest running balance and size, and only the latest row of each bucket is kept.
+    """
+    tz = ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz"))
+    queryset = Transaction.objects.filter(account=acc)
+
+    if from_date:
+        queryset = queryset.filter(txn_date__gte=datetime.combine(from_date, time.min, tz))
+    if to_date:
+        queryset = queryset.filter(txn_date__lte=datetime.combine(to_date, time.max, tz))
+
+    span = queryset.aggregate(start=Min('txn_date'), end=Max('txn_date'))
+    if span['start'] is None:
+        return []
+
+    bucket = LocalTrunc('txn_date', interval, tz, span['start'].astimezone(dt_timezone.utc),
+                        span['end'].astimezone(dt_timezone.utc))
+    rows = (queryset
+            .annotate(bucket=bucket,
+                      row_no=Window(RowNumber(), partition_by=bucket, order_by=[F('txn_date').desc(), F('id').desc()]),
+                      low=Window(Min('cf_amt'), partition_by=bucket),
+                      txns=Window(Count('id'), partition_by=bucket))
+            .filter(row_no=1)
+            .order_by('bucket')
+            .values_list('bucket', 'cf_amt', 'low', 'txns'))
+
+    return [{
+        'date': bucket_date.isoformat(),
+        'balance': balance,
+        'low': low,
+        'txns': txns,
+        'below_min': low < acc.min_bal,
+        'below_desired': low < acc.dis_bal,
+    } for bucket_date, balance, low, txns in rows]
+
+
+def downsample(points: list[dict], size: int) -> list[dict]:
+    """
+    Reduces a balance history to at most `size` points by merging runs of consecutive buckets. A merged
+    point closes with the balance of its last bucket and keeps the lowest balance and the dip flags of
+    the whole run, so dips below the minimum balance are never lost when charting.
+    """
+    if len(points) <= size:
+        return points
+
+    merged = []
+    for idx in range(size):
+        run = points[idx * len(points) // size:(idx + 1) * len(points) // size]
+        merged.append({
+            **run[-1],
+            'low': min(point['low'] for point in run),
+            'txns': sum(point['txns'] for point in run),
+            'below_min': any(point['below_min'] for point in run),
+            'below_desired': any(point['below_desired'] for point in run),
+        })
+    return merged
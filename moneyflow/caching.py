@@ -0,0 +1,43 @@
+import hashlib
+from functools import wraps
+
+from django.core.cache import cache
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from core.metrics import RESPONSE_CACHE
+from .versioning import data_etag
+
+
+def response_cache_key(request: Request) -> str:
+    # The ETag covers the user, their data version and the normalized request. Paginated bodies carry absolute
+    # next and previous links, so the scheme and host the request came in on are part of the key too
+    uri = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f"moneyflow:response:{data_etag(request)}:{uri}"
+
+
+def cache_response(view_method):
+    """
+    Caches the data of successful read responses in the configured Django cache. Keys include the
+    user's data version, so every write that bumps it invalidates all of the user's cached responses
+    at once and stale entries simply expire.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request: Request, *args, **kwargs) -> Response:
+        key = response_cache_key(request)
+        view = request.resolver_match.view_name if request.resolver_match else view_method.__name__
+
+        data = cache.get(key)
+        if data is not None:
+            RESPONSE_CACHE.inc(view=view, result='hit')
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        RESPONSE_CACHE.inc(view=view, result='miss')
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    return wrapper
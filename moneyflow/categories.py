@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.db.models import QuerySet
+
+from .models import Category, CategoryClosure, CategoryGroup
+
+
+def insert_node(category: Category) -> None:
+    """
+    Adds the closure rows of a new leaf category: itself, and every ancestor of its parent one level deeper.
+    """
+    links = [CategoryClosure(ancestor=category, descendant=category, depth=0)]
+    if category.parent_id:
+        links += [CategoryClosure(ancestor_id=ancestor_id, descendant=category, depth=depth + 1)
+                  for ancestor_id, depth in CategoryClosure.objects.filter(
+                      descendant_id=category.parent_id).values_list('ancestor_id', 'depth')]
+    CategoryClosure.objects.bulk_create(links)
+
+
+@transaction.atomic
+def move_node(category: Category, parent: Category | None) -> None:
+    """
+    Moves a category with its subtree under another parent, or to the root: the links from the old ancestors
+    into the subtree are dropped, and every new ancestor is linked to every node of the subtree.
+
+    :raises ValueError: When the new parent is within the subtree itself.
+    """
+    subtree = dict(CategoryClosure.objects.filter(ancestor=category).values_list('descendant_id', 'depth'))
+    if parent is not None and parent.pk in subtree:
+        raise ValueError("A category can't be moved under itself")
+
+    CategoryClosure.objects.filter(descendant_id__in=list(subtree)).exclude(ancestor_id__in=list(subtree)).delete()
+    if parent is not None:
+        ancestors = CategoryClosure.objects.filter(descendant=parent).values_list('ancestor_id', 'depth')
+        CategoryClosure.objects.bulk_create([
+            CategoryClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=above + 1 + below)
+            for ancestor_id, above in ancestors
+            for descendant_id, below in subtree.items()
+        ], batch_size=1000)
+    category.parent = parent
+    category.save(update_fields=['parent'])
+
+
+def subtree_groups(user, category_id: int) -> QuerySet:
+    """
+    The names of the groups assigned to the category or any category below it, as one join on the closure.
+    """
+    return CategoryGroup.objects.filter(user=user, category__ancestor_links__ancestor_id=category_id).values(
+        'grp_name')
+
+
+def rollup(user, groups: list[dict], measures: tuple[str, ...], category_id: int = None) -> dict:
+    """
+    Rolls the per group totals of a summary up to the children of a category, or to the root categories.
+    Each group is attributed to the child whose subtree it is assigned to, found for all the groups with one
+    join on the closure, so a level costs the same however deep the tree below it is. Groups assigned to the
+    category itself, or at the root to no category, are totalled as `unassigned`.
+
+    :param user: The user whose categories are used.
+    :param groups: The groups of the summary, with their `txns` and `measures` totals.
+    :param measures: The names of the amount totals of the groups.
+    :param category_id: The category to drill into, the root when None.
+    :return: The category, its children with their totals ordered by the first measure, and the unassigned
+        totals.
+    """
+    children = Category.objects.filter(user=user, parent_id=category_id)
+    names = dict(children.values_list('id', 'name'))
+    child_of = dict(CategoryGroup.objects.filter(
+        user=user, category__ancestor_links__ancestor__in=children,
+    ).values_list('grp_name', 'category__ancestor_links__ancestor_id'))
+
+    def empty() -> dict:
+        return {'txns': 0, **{measure: 0 for measure in measures}}
+
+    totals = {child_id: empty() for child_id in names}
+    unassigned = empty()
+    for group in groups:
+        bucket = totals.get(child_of.get(group['grp_name']), unassigned)
+        bucket['txns'] += group['txns']
+        for measure in measures:
+            bucket[measure] += group[measure]
+
+    category = Category.objects.filter(user=user, pk=category_id).values('id', 'name', 'parent').first() \
+        if category_id else None
+    has_children = set(Category.objects.filter(parent__in=children).values_list('parent_id', flat=True))
+    return {
+        'category': category,
+        'categories': sorted((
+            {'id': child_id, 'name': names[child_id], 'has_children': child_id in has_children, **total}
+            for child_id, total in totals.items()
+        ), key=lambda item: (-item[measures[0]], item['name'])),
+        'unassigned': unassigned,
+    }
+
+
+def assign_groups(user, category: Category, grp_names: list[str]) -> int:
+    """
+    Assigns the groups to the category, moving them from any category they were assigned to.
+
+    :return: The number of groups assigned.
+    """
+    with transaction.atomic():
+        CategoryGroup.objects.filter(user=user, grp_name__in=grp_names).exclude(category=category).update(
+            category=category)
+        existing = set(CategoryGroup.objects.filter(user=user, grp_name__in=grp_names).values_list('grp_name',
+                                                                                                   flat=True))
+        CategoryGroup.objects.bulk_create([CategoryGroup(user=user, grp_name=grp_name, category=category)
+                                           for grp_name in dict.fromkeys(grp_names) if grp_name not in existing])
+    return len(set(grp_names))
@@ -0,0 +1,259 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, IntegerField, Model, QuerySet
+from django.db.models.functions import Cast
+
+from core.metrics import COLUMNAR_CACHE
+from .models import CreditTransaction, Transaction, TransferLink
+from .reconciliation import EpochSeconds, paise
+
+# The transaction ids each source has in the transfer links
+TRANSFER_LEGS = {'ACC': ('debit_txn_id', 'credit_txn_id'), 'CC': ('card_txn_id',)}
+
+# The integer columns of each source: dates as epoch seconds, amounts in hundredths and foreign keys as ids
+COLUMNS = {
+    'ACC': {
+        'id': F('id'), 'txn_date': EpochSeconds('txn_date'), 'opr_dt': EpochSeconds('opr_dt'),
+        'dbt_amount': paise('dbt_amount'), 'cr_amount': paise('cr_amount'), 'cf_amt': paise('cf_amt'),
+        'src_file': F('src_file_id'), 'account': F('account_id'),
+    },
+    'CC': {
+        'id': F('id'), 'txn_date': EpochSeconds('txn_date'), 'amt': paise('amt'),
+        'is_credit': Cast('is_credit', IntegerField()),
+        'src_file': F('src_file_id'), 'credit_card': F('credit_card_id'),
+    },
+}
+
+# The debit and credit totals of each source, named as in its summary
+MEASURES = {'ACC': ('dbt_amount', 'cr_amount'), 'CC': ('debit', 'credit')}
+
+SOURCE_MODELS: dict[str, type[Model]] = {'ACC': Transaction, 'CC': CreditTransaction}
+
+
+class ColumnarTable:
+    """
+    A user's bank or card transactions held as NumPy columns: dates as int64 epoch seconds, amounts as int64
+    hundredths, and group names dictionary encoded as indexes into `groups`.
+    """
+
+    def __init__(self, source: str, columns: dict[str, np.ndarray], codes: np.ndarray, groups: list[str],
+                 version: int = None):
+        self.source = source
+        self.columns = columns
+        self.codes = codes
+        self.groups = groups
+        self.version = version
+        self.nbytes = sum(column.nbytes for column in columns.values()) + codes.nbytes
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def measures(self, mask: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        The debit and credit amounts of the selected rows, named as in `MEASURES`.
+        """
+        debit, credit = MEASURES[self.source]
+        if self.source == 'ACC':
+            return {debit: self.columns['dbt_amount'][mask], credit: self.columns['cr_amount'][mask]}
+        amt, is_credit = self.columns['amt'][mask], self.columns['is_credit'][mask]
+        return {debit: amt * (1 - is_credit), credit: amt * is_credit}
+
+    def mask(self, filters: dict, file_ids: list = None) -> np.ndarray:
+        """
+        Evaluates the cleaned data of the source's filterset over the columns.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in filters.items():
+            if value is None or value == [] or value == '':
+                continue
+            if name == 'exclude_transfers':
+                if value:
+                    mask &= self.columns['transfer'] == 0
+                continue
+            field, _, lookup = name.partition('__')
+            column = self.columns[field]
+            if lookup == 'in':
+                mask &= np.isin(column, [getattr(item, 'pk', item) for item in value])
+                continue
+            if isinstance(value, datetime):
+                value = value.timestamp()
+            elif isinstance(value, Decimal):
+                value = float(value * 100)
+            if lookup == 'gte':
+                mask &= column >= value
+            elif lookup == 'lte':
+                mask &= column <= value
+            else:
+                mask &= column == value
+        if file_ids:
+            mask &= np.isin(self.columns['src_file'], [int(file_id) for file_id in file_ids])
+        return mask
+
+
+def load_table(user, queryset: QuerySet, source: str, version: int = None) -> ColumnarTable:
+    """
+    Loads transactions into a `ColumnarTable` with one query, straight from the cursor. Whether they are a
+    leg of one of the user's transfers is flagged from the link ids, rather than with a join per row.
+    """
+    columns = COLUMNS[source]
+    queryset = queryset.order_by().annotate(**{f'col_{name}': expression for name, expression in columns.items()})
+    queryset = queryset.values_list(*[f'col_{name}' for name in columns], 'grp_name')
+
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    values = list(zip(*rows)) if rows else [()] * (len(columns) + 1)
+    arrays = {name: np.array(column, dtype=np.int64) for name, column in zip(columns, values)}
+    legs = [leg for link in TransferLink.objects.filter(user=user).values_list(*TRANSFER_LEGS[source])
+            for leg in link if leg is not None]
+    arrays['transfer'] = np.isin(arrays['id'], np.array(legs, dtype=np.int64)).astype(np.int8)
+
+    groups = {}
+    codes = np.fromiter((groups.setdefault(grp_name, len(groups)) for grp_name in values[-1]), dtype=np.int32,
+                        count=len(rows))
+    return ColumnarTable(source, arrays, codes, list(groups), version)
+
+
+class ColumnarCache:
+    """
+    Per-process LRU cache of the users' `ColumnarTable`s, evicting the least recently used ones to stay within
+    `max_bytes`. A table is reloaded once the user's data version moves past the one it was loaded at.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.tables: OrderedDict[tuple[int, str], ColumnarTable] = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, user, source: str, version: int) -> ColumnarTable:
+        key = (user.pk, source)
+        with self.lock:
+            table = self.tables.get(key)
+            if table is not None and table.version == version:
+                self.tables.move_to_end(key)
+                COLUMNAR_CACHE.inc(result='hit')
+                return table
+
+        COLUMNAR_CACHE.inc(result='miss')
+        table = load_table(user, SOURCE_MODELS[source].objects.filter(src_file__user=user), source, version)
+        self.put(key, table)
+        return table
+
+    def put(self, key: tuple[int, str], table: ColumnarTable) -> None:
+        with self.lock:
+            stale = self.tables.pop(key, None)
+            if stale is not None:
+                self.nbytes -= stale.nbytes
+            if table.nbytes > self.max_bytes:
+                COLUMNAR_CACHE.inc(result='too_large')
+                return
+            self.tables[key] = table
+            self.nbytes += table.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.tables.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                COLUMNAR_CACHE.inc(result='evicted')
+
+    def clear(self) -> None:
+        with self.lock:
+            self.tables.clear()
+            self.nbytes = 0
+
+
+TABLES = ColumnarCache(settings.USER_SETTINGS.getint('Analytics', 'memory_mb') * 1024 * 1024)
+
+
+def columnar_cache_enabled() -> bool:
+    return settings.USER_SETTINGS.getboolean('Analytics', 'columnar_cache')
+
+
+def to_amount(cents) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def group_totals(table: ColumnarTable, mask: np.ndarray) -> tuple[dict, list[dict]]:
+    """
+    The transaction count and amount totals of the selection, overall and per group, like the summary
+    aggregates. Totals are `bincount`s over the group codes, exact below 2**53 hundredths.
+    """
+    codes = table.codes[mask]
+    measures = table.measures(mask)
+    txns = np.bincount(codes, minlength=len(table.groups))
+    sums = {name: np.rint(np.bincount(codes, values, len(table.groups))).astype(np.int64)
+            for name, values in measures.items()}
+
+    totals = {'txns': int(mask.sum()), **{name: to_amount(values.sum()) for name, values in measures.items()}}
+    groups = [
+        {'grp_name': table.groups[code], 'txns': int(txns[code]),
+         **{name: to_amount(sums[name][code]) for name in sums}}
+        for code in np.flatnonzero(txns)
+    ]
+    return totals, groups
+
+
+def summarize(table: ColumnarTable, mask: np.ndarray) -> dict:
+    totals, groups = group_totals(table, mask)
+    debit, _ = MEASURES[table.source]
+    groups.sort(key=lambda group: (-group[debit], group['grp_name']))
+    return {**totals, 'groups': groups}
+
+
+def top_groups(table: ColumnarTable, mask: np.ndarray, n: int, by: str) -> list[dict]:
+    """
+    The `n` groups with the largest `by` measure (`txns`, `debit` or `credit`).
+    """
+    _, groups = group_totals(table, mask)
+    key = {'txns': 'txns', 'debit': MEASURES[table.source][0], 'credit': MEASURES[table.source][1]}[by]
+    groups.sort(key=lambda group: (-group[key], group['grp_name']))
+    return groups[:n]
+
+
+def percentiles(table: ColumnarTable, mask: np.ndarray, q: list[float], measure: str, by_group: bool) -> dict:
+    """
+    Linearly interpolated percentiles of the debit or credit amounts of the selection, overall and optionally
+    per group. Every group is answered at once: the amounts are sorted by (group, amount) and each percentile
+    is read at its position within the group's run.
+    """
+    debit, credit = MEASURES[table.source]
+    amounts = table.measures(mask)[debit if measure == 'debit' else credit]
+    codes = table.codes[mask]
+    present = amounts > 0
+    amounts, codes = amounts[present], codes[present]
+
+    def at(values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> dict[str, np.ndarray]:
+        result = {}
+        for quantile in q:
+            position = starts + quantile / 100 * np.maximum(counts - 1, 0)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, starts + np.maximum(counts - 1, 0))
+            value = values[low] + (values[high] - values[low]) * (position - low)
+            result[f"{quantile:g}"] = np.round(value / 100, 2)
+        return result
+
+    if len(amounts) == 0:
+        response = {'txns': 0, 'percentiles': {f"{quantile:g}": None for quantile in q}}
+        return {**response, 'groups': []} if by_group else response
+
+    overall = at(np.sort(amounts), np.zeros(1, dtype=np.int64), np.array([len(amounts)]))
+    response = {'txns': len(amounts), 'percentiles': {key: float(value[0]) for key, value in overall.items()}}
+    if by_group:
+        order = np.lexsort((amounts, codes))
+        counts = np.bincount(codes, minlength=len(table.groups))
+        present_codes = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[present_codes]
+        per_group = at(amounts[order], starts, counts[present_codes])
+        response['groups'] = sorted((
+            {'grp_name': table.groups[code], 'txns': int(counts[code]),
+             'percentiles': {key: float(value[i]) for key, value in per_group.items()}}
+            for i, code in enumerate(present_codes)
+        ), key=lambda group: group['grp_name'])
+    return response
@@ -0,0 +1,199 @@
+import json
+from collections import defaultdict
+from functools import partial
+from typing import Iterator
+
+from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import CASCADE, DO_NOTHING, PROTECT, RESTRICT, SET_DEFAULT, SET_NULL, Count, Max, Min, Model, \
+    ProtectedError
+
+from .anomalies import refresh_anomalies
+from .models import CreditTransaction, FileAudit, Transaction
+from .recurring import refresh_series
+from .upload_store import release_blob
+from .versioning import bump_data_version
+
+DELETE_CHUNK_SIZE = 10_000
+
+TXN_MODELS: dict[str, type[Model]] = {
+    'ACC_TXN_UPLOAD': Transaction,
+    'CC_TXN_UPLOAD': CreditTransaction,
+}
+
+
+class FileDeletion:
+    """
+    Deletes the transactions loaded from files without going through Django's deletion collector.
+
+    ``QuerySet.delete()`` loads every cascaded transaction into memory to build its deletion report, which is
+    slow and memory hungry for large statements. Here the transactions of each file are removed with raw
+    ``DELETE`` statements over chunks of its id range, each in its own transaction, and counted from the
+    cursor's row counts. Rows of other models cascading from the transactions, and their tags, are deleted the
+    same way first, and those set to null or their default on delete are updated. Rows protecting the
+    transactions stop the deletion before anything is deleted, see `check`. The files themselves are kept as
+    the audit trail: they are marked ``DELETING`` up front, so an interrupted deletion can simply be retried,
+    and ``DELETED`` once their transactions are gone, when their stored uploads are released. The
+    recurring series of the accounts and cards involved are then detected again without the deleted
+    transactions, and the remaining debits of the groups involved scored again for anomalies.
+
+    Iterating over the deletion runs it and yields the progress after every chunk.
+    """
+
+    def __init__(self, audit_files: list[FileAudit], user, chunk_size: int = DELETE_CHUNK_SIZE):
+        self.audit_files = audit_files
+        self.user = user
+        self.chunk_size = chunk_size
+        self.total = 0
+        self.deleted = 0
+        self.details: dict[str, int] = defaultdict(int)
+
+    def __iter__(self) -> Iterator[dict]:
+        self.check()
+        FileAudit.objects.filter(pk__in=[audit_file.pk for audit_file in self.audit_files]).update(status='DELETING')
+
+        plans = []
+        groups: dict[str, set[str]] = defaultdict(set)
+        for audit_file in self.audit_files:
+            model, bounds = self.plan(audit_file)
+            plans.append((audit_file, model, bounds))
+            groups['ACC' if model is Transaction else 'CC'].update(
+                model.objects.filter(src_file=audit_file).order_by().values_list('grp_name', flat=True).distinct())
+            self.total += bounds['rows']
+
+        for audit_file, model, bounds in plans:
+            file_deleted = 0
+            for deleted in self.delete_transactions(audit_file, model, bounds):
+                file_deleted += deleted
+                yield self.progress(audit_file, file_deleted)
+
+            with transaction.atomic():
+                audit_file.status = 'DELETED'
+                audit_file.op_stats = {**audit_file.op_stats, 'rows_deleted': file_deleted}
+                audit_file.record_totals([])
+                audit_file.save(update_fields=['status', 'op_stats', 'txn_count', 'first_txn_date', 'last_txn_date',
+                                               'total_debit', 'total_credit', 'updt_dt'])
+                bump_data_version(self.user)
+                if audit_file.sha256:
+                    transaction.on_commit(partial(release_blob, audit_file.sha256))
+            yield self.progress(audit_file, file_deleted)
+
+        with transaction.atomic():
+            for op_desc, to_id in {(audit_file.op_desc, audit_file.to_id) for audit_file in self.audit_files}:
+                refresh_series(self.user, **{'account_id' if op_desc == 'ACC_TXN_UPLOAD' else 'credit_card_id': to_id})
+            for source, source_groups in groups.items():
+                refresh_anomalies(self.user, source, sorted(source_groups))
+            bump_data_version(self.user)
+
+    def delete_transactions(self, audit_file: FileAudit, model: type[Model], bounds: dict) -> Iterator[int]:
+        """
+        Deletes the transactions of a file, and the rows cascading from them, chunk by chunk. Each chunk is
+        deleted in its own transaction, or as part of the caller's one when called within a transaction.
+
+        :param bounds: The number of transactions of the file and their lowest and highest id.
+        :return: An iterator running the deletion, yielding the number of transactions each chunk deleted.
+        """
+        if not bounds['rows']:
+            return
+
+        qn = connection.ops.quote_name
+        chunk = "SELECT {} FROM {} WHERE {} = %s AND {} BETWEEN %s AND %s".format(
+            qn(model._meta.pk.column), qn(model._meta.db_table),
+            qn(model._meta.get_field('src_file').column), qn(model._meta.pk.column),
+        )
+        # Rows referencing the transactions go first, one statement per relation
+        dependents = []
+        for rel in model._meta.related_objects:
+            table, column = qn(rel.related_model._meta.db_table), qn(rel.field.column)
+            if rel.on_delete is CASCADE:
+                dependents.append((f"DELETE FROM {table} WHERE {column} IN ({chunk})", []))
+            elif rel.on_delete in (SET_NULL, SET_DEFAULT):
+                default = None if rel.on_delete is SET_NULL else rel.field.get_default()
+                dependents.append((f"UPDATE {table} SET {column} = %s WHERE {column} IN ({chunk})", [default]))
+        for field in model._meta.private_fields:
+            if isinstance(field, GenericRelation):
+                # Generic relations (tags) are matched on the content type of the transactions as well
+                dependents.append(("DELETE FROM {} WHERE {} = {:d} AND {} IN ({})".format(
+                    qn(field.related_model._meta.db_table), qn(field.content_type_field_name + '_id'),
+                    ContentType.objects.get_for_model(model).pk, qn(field.object_id_field_name), chunk), []))
+        sql = "DELETE FROM {} WHERE {} = %s AND {} BETWEEN %s AND %s".format(
+            qn(model._meta.db_table),
+            qn(model._meta.get_field('src_file').column),
+            qn(model._meta.pk.column),
+        )
+        for start in range(bounds['low'], bounds['high'] + 1, self.chunk_size):
+            params = [audit_file.pk, start, start + self.chunk_size - 1]
+            with transaction.atomic(), connection.cursor() as cursor:
+                for dependent, dependent_params in dependents:
+                    cursor.execute(dependent, dependent_params + params)
+                cursor.execute(sql, params)
+            self.deleted += cursor.rowcount
+            self.details[model._meta.label] += cursor.rowcount
+            yield cursor.rowcount
+
+    def check(self) -> None:
+        """
+        Verifies that nothing stops the transactions of the files from being deleted, before anything is.
+
+        :raises ProtectedError: When rows of other models protect some of the transactions.
+        :raises ValueError: When the transactions have a relation whose `on_delete` isn't supported.
+        """
+        for op_desc in {audit_file.op_desc for audit_file in self.audit_files}:
+            model = TXN_MODELS[op_desc]
+            files = [audit_file for audit_file in self.audit_files if audit_file.op_desc == op_desc]
+            for rel in model._meta.related_objects:
+                if rel.on_delete in (PROTECT, RESTRICT):
+                    protected = list(rel.related_model._base_manager.filter(
+                        **{f'{rel.field.name}__src_file__in': files})[:10])
+                    if protected:
+                        raise ProtectedError(
+                            f"Transactions of the files are referenced by {rel.related_model._meta.verbose_name}"
+                            f" rows through {rel.field.name}", set(protected))
+                elif rel.on_delete not in (CASCADE, SET_NULL, SET_DEFAULT, DO_NOTHING):
+                    raise ValueError(f"Deleting {model._meta.label} rows referenced by "
+                                     f"{rel.related_model._meta.label}.{rel.field.name} is not supported")
+
+    @staticmethod
+    def plan(audit_file: FileAudit) -> tuple[type[Model], dict]:
+        """
+        The transaction model of a file, and the number and id range of its transactions.
+        """
+        model = TXN_MODELS[audit_file.op_desc]
+        bounds = model.objects.filter(src_file=audit_file).aggregate(rows=Count('id'), low=Min('id'), high=Max('id'))
+        return model, bounds
+
+    def progress(self, audit_file: FileAudit, file_deleted: int) -> dict:
+        return {'file': audit_file.pk, 'file_deleted': file_deleted, 'deleted': self.deleted, 'total': self.total}
+
+    def run(self) -> dict:
+        """
+        Runs the deletion to completion.
+
+        :return: The deletion summary.
+        """
+        for _ in self:
+            pass
+        return self.result()
+
+    def stream(self) -> Iterator[str]:
+        """
+        Runs the deletion while streaming its progress as newline delimited JSON, the last line being the summary.
+        When the response is closed early, e.g. because the client disconnected, the deletion still runs to
+        completion instead of leaving the files `DELETING`.
+        """
+        steps = iter(self)
+        try:
+            for progress in steps:
+                yield json.dumps(progress) + '\n'
+            yield json.dumps(self.result()) + '\n'
+        finally:
+            for _ in steps:
+                pass
+
+    def result(self) -> dict:
+        return {
+            "message": f"Successfully deleted {self.deleted} entries(s).",
+            "details": dict(self.details),
+            "files": [audit_file.pk for audit_file in self.audit_files],
+        }
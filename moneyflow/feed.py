@@ -0,0 +1,134 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Case, CharField, DecimalField, ExpressionWrapper, F, Q, QuerySet, Value, When
+
+from .models import Account, CreditCard, CreditTransaction, Transaction
+
+FEED_FIELDS = ('txn_date', 'source', 'id', 'source_id', 'txn_desc', 'grp_name', 'amount', 'src_file_id')
+FEED_ORDERING = ('-txn_date', '-source', '-id')
+
+AMOUNT_FIELD = DecimalField(max_digits=17, decimal_places=2)
+CENTS = Decimal('0.01')
+
+
+def encode_cursor(row: dict) -> str:
+    key = json.dumps([row['txn_date'].isoformat(), row['source'], row['id']])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str, int]:
+    """
+    :raises ValueError: If the cursor was not produced by `encode_cursor`.
+    """
+    try:
+        txn_date, source, txn_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(txn_date), str(source), int(txn_id)
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def feed_branches(user, filters: dict) -> list[tuple[str, QuerySet]]:
+    """
+    Builds one queryset per account and credit card of the user, normalized to the same columns: bank
+    transactions carry `cr_amount - dbt_amount` and card transactions their amount negated unless it is a
+    credit, so that money coming in is always positive. Splitting per account and card lets every branch be
+    served in order by its `(account|credit_card, txn_date, id)` index.
+    """
+    accounts = Account.objects.filter(user=user)
+    cards = CreditCard.objects.filter(user=user)
+
+    if filters.get('source') == 'CC' or (filters.get('credit_card__in') and not filters.get('account__in')):
+        accounts = accounts.none()
+    if filters.get('source') == 'ACC' or (filters.get('account__in') and not filters.get('credit_card__in')):
+        cards = cards.none()
+    if filters.get('account__in'):
+        accounts = accounts.filter(id__in=filters['account__in'])
+    if filters.get('credit_card__in'):
+        cards = cards.filter(id__in=filters['credit_card__in'])
+
+    query = Q()
+    if filters.get('txn_date__gte'):
+        query &= Q(txn_date__gte=filters['txn_date__gte'])
+    if filters.get('txn_date__lte'):
+        query &= Q(txn_date__lte=filters['txn_date__lte'])
+    if filters.get('amount__gte') is not None:
+        query &= Q(amount__gte=filters['amount__gte'])
+    if filters.get('amount__lte') is not None:
+        query &= Q(amount__lte=filters['amount__lte'])
+    if filters.get('grp_name') is not None:
+        query &= Q(grp_name=filters['grp_name'])
+    if filters.get('search'):
+        query &= Q(txn_desc__icontains=filters['search']) | Q(grp_name__icontains=filters['search'])
+
+    branches = []
+    for acc_id in accounts.values_list('id', flat=True):
+        branches.append(('ACC', Transaction.objects.filter(account_id=acc_id).annotate(
+            source=Value('ACC', output_field=CharField()),
+            source_id=F('account_id'),
+            amount=ExpressionWrapper(F('cr_amount') - F('dbt_amount'), output_field=AMOUNT_FIELD),
+        ).filter(query)))
+    for cc_id in cards.values_list('id', flat=True):
+        branches.append(('CC', CreditTransaction.objects.filter(credit_card_id=cc_id).annotate(
+            source=Value('CC', output_field=CharField()),
+            source_id=F('credit_card_id'),
+            amount=Case(When(is_credit=True, then=F('amt')), default=-F('amt'), output_field=AMOUNT_FIELD),
+        ).filter(query)))
+    return branches
+
+
+def after_cursor(source: str, cursor: tuple[datetime, str, int]) -> Q:
+    """
+    The keyset condition `(txn_date, source, id) < cursor` for the rows of one source. The source is a
+    constant within a branch, so the condition reduces to a plain comparison on the indexed columns.
+    """
+    txn_date, cursor_source, txn_id = cursor
+    if source < cursor_source:
+        return Q(txn_date__lte=txn_date)
+    if source > cursor_source:
+        return Q(txn_date__lt=txn_date)
+    return Q(txn_date__lt=txn_date) | Q(txn_date=txn_date, id__lt=txn_id)
+
+
+def feed_page(user, filters: dict, size: int, cursor: tuple[datetime, str, int] = None) -> tuple[list[dict], bool]:
+    """
+    Fetches one page of the user's bank and card transactions merged into a single timeline, newest first,
+    with one `UNION ALL` query.
+
+    Every branch is limited to the page size on its own before the union, so each one is an indexed top-N
+    scan and the database merges at most a page worth of rows per account and card. Backends that can't order
+    and slice the parts of a compound query get the limit through an `id IN (... LIMIT n)` subquery instead.
+
+    :param user: The user whose transactions are listed.
+    :param filters: The validated feed filters.
+    :param size: The page size.
+    :param cursor: The decoded cursor of the last row of the previous page.
+    :return: The rows of the page and whether there are more.
+    """
+    branches = feed_branches(user, filters)
+    if cursor:
+        branches = [(source, queryset.filter(after_cursor(source, cursor))) for source, queryset in branches]
+
+    if not branches:
+        return [], False
+    if len(branches) == 1:
+        feed = branches[0][1].values(*FEED_FIELDS)
+    else:
+        parts = []
+        for _, queryset in branches:
+            top = queryset.order_by('-txn_date', '-id')
+            if connection.features.supports_slicing_ordering_in_compound:
+                parts.append(top.values(*FEED_FIELDS)[:size + 1])
+            else:
+                parts.append(queryset.filter(pk__in=top.values('pk')[:size + 1]).values(*FEED_FIELDS))
+        feed = parts[0].union(*parts[1:], all=True)
+
+    rows = list(feed.order_by(*FEED_ORDERING)[:size + 1])
+    for row in rows:
+        # Converters are not applied uniformly to the columns of a compound query
+        row['amount'] = Decimal(row['amount']).quantize(CENTS)
+    return rows[:size], len(rows) > size
@@ -1,27 +1,81 @@
 import csv
 import io
+import time
+from contextlib import contextmanager
 from csv import DictReader
 from io import BufferedReader
 
 from jinja2 import Template
 
+from core.metrics import GROUPER_RENDERS
 from .parsers import HDFC, ICICI, KTKB, SBI
+from .upload_store import store_blob
 
 PARSER_MAPPING = {
     'HDFC_D': HDFC.parse_delimited,
     "HDFC_CC_CSV": HDFC.parse_cc_csv,
     "ICICI_XLS": ICICI.parse_xls,
     'KTKB_XLS': KTKB.parse_xls,
-    'SBI_XLSX': SBI.parse_xlsx,
+    'SBI_XLSX': SBI.read_xlsx,
 }
 
+# Parsers of password protected files, applied before the parser itself
+DECRYPTOR_MAPPING = {
+    'SBI_XLSX': SBI.unlock_file,
+}
+
+
+# Stages timed by StageTimer during an upload, 'total' being the whole ingestion
+INGEST_STAGES = ('decrypt', 'store', 'parse', 'lock', 'dates', 'group', 'tag', 'insert', 'reconcile', 'match',
+                 'recurring', 'anomalies', 'total')
+
+
+class StageTimer:
+    """
+    Accumulates the wall time spent in each named stage of a file ingestion.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
 
-def get_reader(file: BufferedReader, parser_name: str, pw: str = None) -> DictReader:
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def summary(self, **counts) -> dict:
+        timings = {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+        timings['total'] = round((time.perf_counter() - self.started) * 1000, 3)
+        return {**counts, 'timings_ms': timings}
+
+
+def get_reader(file: BufferedReader, parser_name: str, pw: str = None, timer: StageTimer = None,
+               lazy: bool = False, sha256: str = None) -> DictReader:
+    """
+    Parses the file into rows with the columns of `FILE_HEADER` or `CC_FILE_HEADER`.
+
+    :param lazy: Parse the lines of parsers yielding them only as the reader is iterated, so reading the first
+        rows stops parsing there. Otherwise the whole file is parsed upfront, timed as the 'parse' stage.
+    :param sha256: Stores the file, once decrypted, in the upload store as the blob of this hash.
+    """
+    timer = timer or StageTimer()
     if pw:
-        data = PARSER_MAPPING[parser_name](file, pw)
-    else:
+        with timer.stage('decrypt'):
+            file = DECRYPTOR_MAPPING[parser_name](file, pw)
+    if sha256:
+        with timer.stage('store'):
+            store_blob(sha256, file)
+    with timer.stage('parse'):
         data = PARSER_MAPPING[parser_name](file)
-    reader = csv.DictReader(io.StringIO(data))
+        if isinstance(data, str):
+            data = io.StringIO(data)
+        elif not lazy:
+            data = list(data)
+    reader = csv.DictReader(data)
     return reader
 
 
@@ -29,3 +83,11 @@ def get_group(template: Template, txn_desc: str) -> str:
     if template is None:
         return ''
     return template.render(txn_desc=txn_desc).strip()
+
+
+def count_renders(template: Template, renders: int) -> None:
+    """
+    Counts the renders of a grouper once per upload or regroup, instead of taking the metrics lock on every row.
+    """
+    if template is not None and renders:
+        GROUPER_RENDERS.inc(renders, grouper=template.name[2:-3])
@@ -1,17 +1,67 @@
-from django_filters.rest_framework import FilterSet
+from django.core.validators import EMPTY_VALUES
+from django_filters.rest_framework import BaseInFilter, BooleanFilter, CharFilter, ChoiceFilter, FilterSet, NumberFilter
+from django_filters.utils import translate_validation
 from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
 
-from .models import CreditTransaction, Transaction, FileAudit
+from tags.tagging import filter_tagged
+from .categories import subtree_groups
+from .models import Anomaly, CreditTransaction, Transaction, FileAudit
+
+# Viewset actions that search transactions instead of the accounts or cards themselves
+TRANSACTION_ACTIONS = ('all_transactions', 'summary', 'percentiles', 'top_groups')
+
+
+class NumberInFilter(BaseInFilter, NumberFilter):
+    pass
+
+
+# Filters of the transaction filtersets that can't be evaluated on the columnar tables
+NON_COLUMNAR_FILTERS = ('tag', 'category')
+
+
+class TransactionFilterSet(FilterSet):
+    tag = NumberInFilter(method='filter_tag', label="Tagged with any of the tags")
+    category = NumberFilter(method='filter_category', label="Grouped under the category")
+
+    def filter_tag(self, queryset, name, value):
+        return filter_tagged(queryset, [int(tag_id) for tag_id in value]) if value else queryset
+
+    def filter_category(self, queryset, name, value):
+        return queryset.filter(grp_name__in=subtree_groups(self.request.user, int(value))) if value else queryset
+
+
+def has_filters(view, request) -> bool:
+    """
+    Whether the request narrows the view's queryset down with a search or at least one filter of its
+    filterset. Other query parameters, like the page or the ordering, don't count.
+
+    :raises ValidationError: When the filters are invalid.
+    """
+    if request.query_params.get(api_settings.SEARCH_PARAM, '').strip():
+        return True
+
+    filterset = view.filterset_class(request.query_params, request=request, queryset=view.get_queryset().none())
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+    # The method filters ignore falsy values, e.g. `exclude_transfers=false`
+    return any(value not in EMPTY_VALUES and (value or not filterset.filters[name].method)
+               for name, value in filterset.form.cleaned_data.items())
 
 
 class CreditSearchFilter(SearchFilter):
     def get_search_fields(self, view, request):
-        if getattr(view, 'action', None) == 'all_transactions':
+        if getattr(view, 'action', None) in TRANSACTION_ACTIONS:
             return ['txn_desc', 'grp_name']
         return ['name', 'card_no']
 
 
-class CreditTransactionFilter(FilterSet):
+class CreditTransactionFilter(TransactionFilterSet):
+    exclude_transfers = BooleanFilter(method='filter_exclude_transfers', label="Exclude card payments")
+
+    def filter_exclude_transfers(self, queryset, name, value):
+        return queryset.filter(card_payment__isnull=True) if value else queryset
+
     class Meta:
         model = CreditTransaction
         fields = {
@@ -25,12 +75,17 @@ class CreditTransactionFilter(FilterSet):
 
 class AccSearchFilter(SearchFilter):
     def get_search_fields(self, view, request):
-        if getattr(view, 'action', None) == 'all_transactions':
+        if getattr(view, 'action', None) in TRANSACTION_ACTIONS:
             return ['txn_desc', 'grp_name']
         return ['name', 'acc_no', 'ifsc_code']
 
 
-class AccTransactionFilter(FilterSet):
+class AccTransactionFilter(TransactionFilterSet):
+    exclude_transfers = BooleanFilter(method='filter_exclude_transfers', label="Exclude transfers and card payments")
+
+    def filter_exclude_transfers(self, queryset, name, value):
+        return queryset.filter(transfer_out__isnull=True, transfer_in__isnull=True) if value else queryset
+
     class Meta:
         model = Transaction
         fields = {
@@ -45,8 +100,32 @@ class AccTransactionFilter(FilterSet):
 
 
 class AuditFileFilter(FilterSet):
+    parser = CharFilter(label="Parser")
+    grouper = CharFilter(label="Last grouper")
+    error_class = CharFilter(label="Error class")
+    row_count__gte = NumberFilter(field_name='row_count', lookup_expr='gte', label="Rows read from")
+    row_count__lte = NumberFilter(field_name='row_count', lookup_expr='lte', label="Rows read to")
+
     class Meta:
         model = FileAudit
         fields = {
             'isrt_dt': ['lte', 'gte'],
+            'status': ['exact'],
+        }
+
+
+class AnomalyFilter(FilterSet):
+    source = ChoiceFilter(choices=[('ACC', "Accounts"), ('CC', "Credit cards")], method='filter_source',
+                          label="Source")
+
+    def filter_source(self, queryset, name, value):
+        return queryset.filter(**{'txn__isnull' if value == 'ACC' else 'card_txn__isnull': False})
+
+    class Meta:
+        model = Anomaly
+        fields = {
+            'txn_date': ['lte', 'gte'],
+            'score': ['gte'],
+            'grp_name': ['exact'],
+            'kind': ['exact'],
         }
@@ -0,0 +1,77 @@
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Iterator
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.utils import timezone
+
+from core.metrics import INGESTION_LOCK_WAIT
+from .file_actions import StageTimer
+from .models import Account, CreditCard, IngestionLock
+
+# Seconds between attempts to take an advisory lock held by another upload
+POLL_INTERVAL = 0.05
+
+
+@contextmanager
+def ingestion_lock(owner: Account | CreditCard, timer: StageTimer) -> Iterator[float]:
+    """
+    Runs the block in a database transaction holding the ingestion lock of an account or card, so that uploads
+    into the same account or card run one after the other while uploads into different ones run in parallel.
+    Reads of the existing transactions, like the latest one for `is_future_only`, must be made within the block.
+
+    Databases with row level locks lock the row of the account or card with `SELECT ... FOR UPDATE` for the
+    length of the transaction. Others (SQLite) take an `IngestionLock` row in its own transaction before
+    starting it, and delete it within it. Locks left by crashed processes expire after `[Uploads] lock_expiry`
+    seconds. SQLite still runs one write transaction at a time, so there only the reading and parsing of
+    uploads into different accounts run in parallel.
+
+    :param owner: The account or card the transactions are loaded into.
+    :param timer: Records the wait as the 'lock' stage.
+    :return: A context manager giving the milliseconds waited for the lock.
+    """
+    source = 'ACC' if isinstance(owner, Account) else 'CC'
+    start = time.perf_counter()
+    if connection.features.has_select_for_update:
+        with transaction.atomic():
+            with timer.stage('lock'):
+                type(owner).objects.select_for_update().get(pk=owner.pk)
+            waited = time.perf_counter() - start
+            INGESTION_LOCK_WAIT.observe(waited, source=source)
+            yield round(waited * 1000, 3)
+        return
+
+    key = f"{source}:{owner.pk}"
+    token = uuid.uuid4().hex
+    expiry = timedelta(seconds=settings.USER_SETTINGS.getint('Uploads', 'lock_expiry'))
+    with timer.stage('lock'):
+        while True:
+            now = timezone.now()
+            # Polled with reads only, which don't hold up the upload holding the lock
+            held = IngestionLock.objects.filter(key=key).values_list('acquired_dt', flat=True).first()
+            try:
+                if held is not None and held < now - expiry:
+                    IngestionLock.objects.filter(key=key, acquired_dt=held).delete()
+                    held = None
+                if held is None:
+                    with transaction.atomic():
+                        IngestionLock.objects.create(key=key, token=token, acquired_dt=now)
+                    break
+            except (IntegrityError, OperationalError):
+                # Taken by another upload in between, or the database is busy with another write
+                pass
+            time.sleep(POLL_INTERVAL)
+    waited = time.perf_counter() - start
+    INGESTION_LOCK_WAIT.observe(waited, source=source)
+    try:
+        with transaction.atomic():
+            # Deleting the lock first makes the transaction a write transaction from its start, so it can't
+            # deadlock upgrading from a read, and releases the lock when it commits
+            IngestionLock.objects.filter(key=key, token=token).delete()
+            yield round(waited * 1000, 3)
+    finally:
+        # After a rollback
+        IngestionLock.objects.filter(key=key, token=token).delete()
@@ -0,0 +1,151 @@
+import http.client
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+User = get_user_model()
+
+DEFAULT_PATHS = ('parsers/', 'files/', 'accounts/all-txns/', 'accounts/summary/', 'creditcards/all-txns/',
+                 'creditcards/summary/')
+
+# The command line serving the app on a port with a single worker process
+SERVERS = {
+    'wsgi': ('gunicorn', ['MoneyFlowAPI.wsgi:application', '--workers', '1', '--threads', '{threads}',
+                          '--bind', '127.0.0.1:{port}']),
+    'asgi': ('uvicorn', ['MoneyFlowAPI.asgi:application', '--workers', '1', '--no-access-log', '--host',
+                         '127.0.0.1', '--port', '{port}']),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ("Compare the read throughput of a WSGI and an ASGI deployment. Concurrent clients request the sync "
+            "endpoints from the WSGI server and their async variants under `async/` from the ASGI server, each "
+            "served by a single worker process. Servers are started with gunicorn and uvicorn unless their URLs "
+            "are given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default=None, help="Username to authenticate as (default: the first user).")
+        parser.add_argument('--concurrency', type=int, default=32, help="Number of concurrent clients.")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds to run each deployment for.")
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS,
+                            help="Endpoints under `moneyflow/` the clients request in turn.")
+        parser.add_argument('--wsgi-url', default=None, help="Base URL of a running WSGI deployment.")
+        parser.add_argument('--asgi-url', default=None, help="Base URL of a running ASGI deployment.")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['duration'] <= 0:
+            raise CommandError("--concurrency and --duration must be positive.")
+
+        users = User.objects.order_by('id')
+        user = users.filter(username=options['user']).first() if options['user'] else users.first()
+        if user is None:
+            raise CommandError("No user to authenticate as.")
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(user)}"}
+
+        for kind, prefix in (('wsgi', '/moneyflow/'), ('asgi', '/moneyflow/async/')):
+            paths = [prefix + path.lstrip('/') for path in options['paths']]
+            base_url = options[f'{kind}_url']
+            server = None
+            if base_url is None:
+                server, base_url = self.start_server(kind, options['concurrency'])
+            try:
+                self.wait_ready(base_url, prefix + 'parsers/')
+                self.stdout.write(f"Benchmarking {kind.upper()} at {base_url} with {options['concurrency']} "
+                                  f"clients for {options['duration']:g}s...")
+                self.report(kind, *self.run(base_url, paths, headers, options['concurrency'], options['duration']))
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait()
+
+    def start_server(self, kind: str, threads: int) -> tuple[subprocess.Popen, str]:
+        program, arguments = SERVERS[kind]
+        if shutil.which(program) is None:
+            raise CommandError(f"{program} is not installed; install it or pass --{kind}-url.")
+
+        port = free_port()
+        server = subprocess.Popen([program, *(argument.format(threads=threads, port=port) for argument in arguments)],
+                                  stdout=subprocess.DEVNULL, stderr=sys.stderr)
+        return server, f"http://127.0.0.1:{port}"
+
+    @staticmethod
+    def wait_ready(base_url: str, path: str, timeout: float = 30) -> None:
+        url = urlsplit(base_url)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                conn = http.client.HTTPConnection(url.hostname, url.port, timeout=5)
+                conn.request('GET', path)
+                if conn.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f"{base_url} did not come up within {timeout:g}s.")
+
+    @staticmethod
+    def run(base_url: str, paths: list[str], headers: dict, concurrency: int,
+            duration: float) -> tuple[np.ndarray, int, float]:
+        """
+        Runs the clients, each over its own keep-alive connection, until the duration is over.
+
+        :return: The latencies of the successful requests, the number of failed requests and the elapsed time.
+        """
+        url = urlsplit(base_url)
+        latencies, lock = [], threading.Lock()
+        errors = 0
+        deadline = time.monotonic() + duration
+
+        def client(offset: int) -> None:
+            nonlocal errors
+            conn = http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+            timings, failed, index = [], 0, offset
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    conn.request('GET', paths[index % len(paths)], headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status == 200:
+                        timings.append(time.perf_counter() - start)
+                    else:
+                        failed += 1
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    conn.close()
+                index += 1
+            conn.close()
+            with lock:
+                latencies.extend(timings)
+                errors += failed
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(client, range(concurrency)))
+        return np.array(latencies), errors, time.perf_counter() - start
+
+    def report(self, kind: str, latencies: np.ndarray, errors: int, elapsed: float) -> None:
+        if not len(latencies):
+            self.stdout.write(self.style.ERROR(f"{kind.upper()}: no successful requests, {errors} failed."))
+            return
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind.upper()}: {len(latencies) / elapsed:.1f} req/s, {len(latencies)} requests, {errors} failed, "
+            f"latency p50 {p50:.1f}ms p95 {p95:.1f}ms p99 {p99:.1f}ms"))
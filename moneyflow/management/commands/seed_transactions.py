@@ -0,0 +1,320 @@
+import calendar
+import heapq
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+from typing import Iterable, Iterator
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Model, Q, Sum
+
+from ...anomalies import refresh_anomalies
+from ...models import Account, CreditCard, CreditTransaction, FileAudit, Transaction
+from ...recurring import refresh_series
+from ...transfers import match_transfers
+from ...versioning import bump_data_version
+
+User = get_user_model()
+
+UPI_MERCHANTS = ('SWIGGY', 'ZOMATO', 'BLINKIT', 'ZEPTO', 'UBER', 'OLA', 'RAPIDO', 'BIGBASKET', 'IRCTC', 'AMAZON',
+                 'FLIPKART', 'MYNTRA', 'BOOKMYSHOW', 'DMART', 'APOLLO PHARMACY', 'JIO PREPAID', 'AIRTEL')
+POS_MERCHANTS = ('RELIANCE SMART', 'SHOPPERS STOP', 'DECATHLON', 'CROMA', 'MORE RETAIL', 'INDIAN OIL', 'HP PETROL')
+CITIES = ('BANGALORE', 'MUMBAI', 'CHENNAI', 'PUNE', 'HYDERABAD', 'DELHI')
+PAYEES = ('RAHUL SHARMA', 'PRIYA NAIR', 'ANIL KUMAR', 'SNEHA RAO', 'VIKRAM SINGH', 'MEERA IYER')
+CARD_MERCHANTS = ('SWIGGY BANGALORE', 'AMAZON PAY INDIA', 'NETFLIX.COM', 'SPOTIFY INDIA', 'UBER INDIA', 'MAKEMYTRIP',
+                  'FLIPKART INTERNET', 'ZOMATO LTD', 'APPLE.COM/BILL', 'INDIGO AIRLINES', 'TATA CLIQ')
+
+# (weight, is_credit, minimum amount, maximum amount, description kind)
+ACCOUNT_EVENTS = (
+    (55, False, 20, 1500, 'UPI'),
+    (8, False, 200, 8000, 'POS'),
+    (5, False, 500, 10000, 'ATM'),
+    (7, False, 500, 25000, 'IMPS'),
+    (7, True, 100, 20000, 'IMPS'),
+    (10, True, 10, 5000, 'UPI'),
+    (4, True, 1000, 50000, 'NEFT'),
+    (4, False, 100, 3000, 'BBPS'),
+)
+
+# (day of month, is_credit, amount, description, group)
+MONTHLY_EVENTS = (
+    (1, True, 85000, 'NEFT CR-CITI0000001-ACME TECHNOLOGIES PVT LTD-SALARY {month}', 'SALARY'),
+    (5, False, 22000, 'UPI-HOUSE RENT-LANDLORD@OKICICI-ICIC0000001-{ref}-RENT', 'UPI-HOUSE RENT'),
+    (10, False, 15430, 'ACH D- BAJAJ FINANCE LTD-{ref}', 'EMI'),
+    (15, False, 5000, 'ACH D- ZERODHA BROKING-SIP{ref}', 'SIP'),
+)
+
+CARD_PAYMENT_DESC = 'PAYMENT RECEIVED - THANK YOU'
+
+UPLOAD_OP_ARGS = {"dt_format": "%d/%m/%Y", "parser": "HDFC_D", "grouper": None}
+CC_UPLOAD_OP_ARGS = {"dt_format": "%d/%m/%y", "parser": "HDFC_CC_CSV", "grouper": None}
+SEED_NOTE = {"system_message": "Seeded by seed_transactions"}
+
+
+def month_index(dt: datetime, start: datetime) -> int:
+    return (dt.year - start.year) * 12 + dt.month - start.month
+
+
+def to_decimal(paise: int) -> Decimal:
+    return Decimal(paise).scaleb(-2)
+
+
+class Command(BaseCommand):
+    help = ("Seed the database with synthetic users, accounts, credit cards, statement files and transactions. "
+            "Rows are written with chunked executemany (COPY on PostgreSQL) to bypass model instantiation.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1, help="Number of users to create.")
+        parser.add_argument('--accounts', type=int, default=2, help="Accounts per user.")
+        parser.add_argument('--cards', type=int, default=1, help="Credit cards per user.")
+        parser.add_argument('--rows', type=int, default=1_000_000, help="Total account transactions to create.")
+        parser.add_argument('--card-rows', type=int, default=None,
+                            help="Total credit card transactions to create (default: a quarter of --rows).")
+        parser.add_argument('--years', type=int, default=3, help="Years of history to spread transactions over.")
+        parser.add_argument('--chunk-size', type=int, default=50_000, help="Rows written per insert batch.")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for reproducible data.")
+        parser.add_argument('--prefix', default='seed', help="Username prefix of the created users.")
+        parser.add_argument('--password', default='moneyflow', help="Password of the created users.")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--users and --chunk-size must be positive.")
+
+        self.rng = random.Random(options['seed'])
+        self.tz = ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz"))
+        self.chunk_size = options['chunk_size']
+
+        card_rows = options['card_rows'] if options['card_rows'] is not None else options['rows'] // 4
+        acc_count = options['users'] * options['accounts']
+        card_count = options['users'] * options['cards']
+
+        self.end = datetime.now(self.tz).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = (self.end - timedelta(days=365 * options['years'])).replace(day=1)
+
+        started = time.perf_counter()
+        written = 0
+
+        for user_no in range(options['users']):
+            user = self.get_user(f"{options['prefix']}_{user_no + 1}", options['password'])
+            self.stdout.write(f"Seeding user {user.username}...")
+
+            for acc_no in range(options['accounts']):
+                acc = Account.objects.create(
+                    name=f"Savings {acc_no + 1}",
+                    acc_no=self.rng.randrange(10 ** 10, 10 ** 14),
+                    ifsc_code=f"SEED{self.rng.randrange(10 ** 6):07d}",
+                    acc_type='Savings',
+                    currency='INR',
+                    def_parser='HDFC_D',
+                    user=user,
+                )
+                written += self.seed_account(acc, self.share(options['rows'], acc_count, acc_no))
+
+            for card_no in range(options['cards']):
+                cc = CreditCard.objects.create(
+                    name=f"Card {card_no + 1}",
+                    card_no=self.rng.randrange(10 ** 15, 10 ** 16),
+                    exp_date=(self.end + timedelta(days=365 * 4)).date(),
+                    def_parser='HDFC_CC_CSV',
+                    user=user,
+                )
+                written += self.seed_card(cc, self.share(card_rows, card_count, card_no))
+
+            self.post_ingest(user)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {written} transactions in {elapsed:.1f}s ({written / max(elapsed, 1e-9):,.0f} rows/s)."
+        ))
+
+    def post_ingest(self, user) -> None:
+        """
+        Runs what an upload runs once its rows are inserted, over all the seeded rows of the user at once:
+        transfer matching, recurring series and anomalies, then invalidates the user's cached responses.
+        """
+        with transaction.atomic():
+            transfers = match_transfers(user)
+            recurring = refresh_series(user)
+            anomalies = refresh_anomalies(user)
+            bump_data_version(user)
+        self.stdout.write(f"  {transfers} transfers, {recurring} recurring series, {anomalies} anomalies")
+
+    @staticmethod
+    def share(total: int, parts: int, index: int) -> int:
+        return total // parts + (1 if index < total % parts else 0)
+
+    @staticmethod
+    def get_user(username: str, password: str):
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            user = User.objects.create_user(username=username, password=password, home_currency='INR')
+        return user
+
+    def create_files(self, to_id: int, op_desc: str, op_args: dict, user, name: str) -> list[int]:
+        """
+        Creates one LOADED FileAudit per calendar month of the seeded period, mimicking monthly statements.
+        """
+        months = month_index(self.end, self.start) + 1
+        files = []
+        for idx in range(months):
+            year, month = divmod(self.start.month - 1 + idx, 12)
+            files.append(FileAudit(
+                file_name=f"{name}_{self.start.year + year}{month + 1:02d}.seed",
+                to_id=to_id,
+                op_desc=op_desc,
+                status='LOADED',
+                op_args=op_args,
+                op_add_txt=SEED_NOTE,
+                user=user,
+            ))
+        return [f.id for f in FileAudit.objects.bulk_create(files)]
+
+    def timestamps(self, count: int) -> list[datetime]:
+        span = (self.end - self.start).total_seconds()
+        offsets = sorted(self.rng.random() * span for _ in range(count))
+        return [self.start + timedelta(seconds=int(offset)) for offset in offsets]
+
+    def monthly_events(self) -> Iterator[tuple]:
+        month = self.start
+        while month < self.end:
+            for day, is_credit, amount, desc, group in MONTHLY_EVENTS:
+                dt = month.replace(day=min(day, calendar.monthrange(month.year, month.month)[1]), hour=9)
+                if self.start <= dt < self.end:
+                    yield dt, is_credit, amount * 100, desc.format(month=dt.strftime('%b%Y').upper(),
+                                                                   ref=self.rng.randrange(10 ** 9)), group
+            month = (month + timedelta(days=32)).replace(day=1)
+
+    def random_events(self, count: int) -> Iterator[tuple]:
+        events = self.rng.choices(ACCOUNT_EVENTS, weights=[e[0] for e in ACCOUNT_EVENTS], k=count)
+        for dt, (_, is_credit, low, high, kind) in zip(self.timestamps(count), events):
+            amount = self.rng.randrange(low * 100, high * 100)
+            ref = self.rng.randrange(10 ** 11, 10 ** 12)
+
+            if kind == 'UPI':
+                merchant = self.rng.choice(UPI_MERCHANTS if not is_credit else PAYEES)
+                desc = f"UPI-{merchant}-{merchant.replace(' ', '').lower()}@ybl-YESB0YBLUPI-{ref}-UPI"
+                group = 'UPI-IRCTC' if merchant == 'IRCTC' else f"UPI-{merchant}"
+            elif kind == 'POS':
+                merchant = self.rng.choice(POS_MERCHANTS)
+                desc = f"POS 4587XXXXXXXX{ref % 10000:04d} {merchant} {self.rng.choice(CITIES)}"
+                group = merchant
+            elif kind == 'ATM':
+                amount = amount // 10000 * 10000 or 10000
+                desc = f"ATW-4587XXXXXXXX{ref % 10000:04d}-S1AW{ref % 1000:03d}-{self.rng.choice(CITIES)}"
+                group = 'ATM'
+            elif kind == 'IMPS':
+                desc = f"IMPS-{ref}-{self.rng.choice(PAYEES)}-HDFC-XXXXXXXX{ref % 10000:04d}-TRANSFER"
+                group = 'IMPS'
+            elif kind == 'NEFT':
+                desc = f"NEFT CR-SBIN0000{ref % 1000:03d}-{self.rng.choice(PAYEES)}-N{ref}"
+                group = 'NEFT'
+            else:
+                desc = f"BBPS-{self.rng.choice(('BESCOM', 'BWSSB', 'ACT FIBERNET', 'TATA POWER'))}-{ref}"
+                group = 'BILLS'
+            yield dt, is_credit, amount, desc, group
+
+    def account_rows(self, acc: Account, file_ids: list[int], count: int) -> Iterator[tuple]:
+        fixed = list(self.monthly_events())[:count]
+        events = heapq.merge(fixed, self.random_events(count - len(fixed)), key=lambda e: e[0])
+        balance = self.rng.randrange(20_000, 200_000) * 100
+        adapt_dt = connection.ops.adapt_datetimefield_value
+        zero = Decimal('0.00')
+
+        for dt, is_credit, amount, desc, group in events:
+            if not is_credit and amount > balance:
+                # Keep the running balance non-negative like a real statement would
+                is_credit, desc, group = True, f"IMPS-{self.rng.randrange(10 ** 12)}-SELF TRANSFER-TOPUP", 'IMPS'
+            balance += amount if is_credit else -amount
+            db_dt = adapt_dt(dt)
+            yield (
+                acc.id, db_dt, desc, group, db_dt,
+                zero if is_credit else to_decimal(amount),
+                to_decimal(amount) if is_credit else zero,
+                str(self.rng.randrange(10 ** 11, 10 ** 12)),
+                to_decimal(balance),
+                file_ids[month_index(dt, self.start)],
+            )
+
+    def card_rows(self, cc: CreditCard, file_ids: list[int], count: int) -> Iterator[tuple]:
+        adapt_dt = connection.ops.adapt_datetimefield_value
+        for dt in self.timestamps(count):
+            roll = self.rng.random()
+            if roll < 0.03:
+                desc, amount, is_credit = CARD_PAYMENT_DESC, self.rng.randrange(5_000, 60_000) * 100, True
+            elif roll < 0.06:
+                merchant = self.rng.choice(CARD_MERCHANTS)
+                desc, amount, is_credit = f"REFUND {merchant}", self.rng.randrange(100, 5_000) * 100, True
+            else:
+                merchant = self.rng.choice(CARD_MERCHANTS)
+                desc, amount, is_credit = merchant, self.rng.randrange(50, 15_000) * 100, False
+            yield (cc.id, adapt_dt(dt), desc, desc.removeprefix('REFUND '), to_decimal(amount), is_credit,
+                   file_ids[month_index(dt, self.start)])
+
+    def seed_account(self, acc: Account, count: int) -> int:
+        file_ids = self.create_files(acc.id, 'ACC_TXN_UPLOAD', UPLOAD_OP_ARGS, acc.user, f"seed_acc_{acc.id}")
+        columns = ('account_id', 'txn_date', 'txn_desc', 'grp_name', 'opr_dt', 'dbt_amount', 'cr_amount',
+                   'ref_num', 'cf_amt', 'src_file_id')
+        written = self.bulk_insert(Transaction, columns, self.account_rows(acc, file_ids, count), str(acc))
+        self.record_totals(Transaction, file_ids)
+        return written
+
+    def seed_card(self, cc: CreditCard, count: int) -> int:
+        file_ids = self.create_files(cc.id, 'CC_TXN_UPLOAD', CC_UPLOAD_OP_ARGS, cc.user, f"seed_cc_{cc.id}")
+        columns = ('credit_card_id', 'txn_date', 'txn_desc', 'grp_name', 'amt', 'is_credit', 'src_file_id')
+        written = self.bulk_insert(CreditTransaction, columns, self.card_rows(cc, file_ids, count), str(cc))
+        self.record_totals(CreditTransaction, file_ids)
+        return written
+
+    @staticmethod
+    def record_totals(model: type[Model], file_ids: list[int]) -> None:
+        """
+        Stores the count, date range and debit/credit totals of the seeded files, like `FileAudit.record_totals`
+        does for uploads, with one grouped query instead of loading the rows.
+        """
+        if model is CreditTransaction:
+            debit = Sum('amt', filter=Q(is_credit=False), default=0)
+            credit = Sum('amt', filter=Q(is_credit=True), default=0)
+        else:
+            debit, credit = Sum('dbt_amount', default=0), Sum('cr_amount', default=0)
+        totals = {row.pop('src_file'): row for row in model.objects.filter(src_file__in=file_ids).values(
+            'src_file').annotate(txn_count=Count('id'), first_txn_date=Min('txn_date'), last_txn_date=Max('txn_date'),
+                                 total_debit=debit, total_credit=credit).order_by()}
+
+        files = list(FileAudit.objects.filter(id__in=totals))
+        for audit_file in files:
+            for field, value in totals[audit_file.id].items():
+                setattr(audit_file, field, value)
+        FileAudit.objects.bulk_update(files, ['txn_count', 'first_txn_date', 'last_txn_date', 'total_debit',
+                                              'total_credit'])
+
+    def bulk_insert(self, model: type[Model], columns: tuple[str, ...], rows: Iterable[tuple], label: str) -> int:
+        """
+        Writes rows straight to the model's table in chunks. PostgreSQL (psycopg 3) uses COPY, every other
+        backend uses a single executemany per chunk. Each chunk is committed on its own so memory stays flat.
+        """
+        qn = connection.ops.quote_name
+        table = qn(model._meta.db_table)
+        db_columns = ', '.join(qn(model._meta.get_field(c).column) for c in columns)
+        rows = iter(rows)
+        total = 0
+
+        while chunk := list(islice(rows, self.chunk_size)):
+            with transaction.atomic(), connection.cursor() as cursor:
+                if connection.vendor == 'postgresql' and hasattr(cursor.cursor, 'copy'):
+                    with cursor.cursor.copy(f"COPY {table} ({db_columns}) FROM STDIN") as copy:
+                        for row in chunk:
+                            copy.write_row(row)
+                else:
+                    placeholders = ', '.join(['%s'] * len(columns))
+                    cursor.executemany(f"INSERT INTO {table} ({db_columns}) VALUES ({placeholders})", chunk)
+            total += len(chunk)
+            self.stdout.write(f"  {label}: {total} rows", ending='\r')
+
+        self.stdout.write(f"  {label}: {total} rows")
+        return total
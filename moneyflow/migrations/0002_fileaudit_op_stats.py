@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-19 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileaudit',
+            name='op_stats',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Operation Statistics'),
+        ),
+    ]
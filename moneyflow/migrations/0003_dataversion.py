@@ -0,0 +1,29 @@
+# Generated by Django 6.1.2 on 2026-10-19 17:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('moneyflow', '0002_fileaudit_op_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='data_version', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updt_dt', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Updated Date')),
+            ],
+            options={
+                'verbose_name': 'Data Version',
+                'verbose_name_plural': 'Data Versions',
+            },
+        ),
+    ]
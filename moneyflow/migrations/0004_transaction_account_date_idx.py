@@ -0,0 +1,17 @@
+# Generated by Django 6.1.2 on 2026-10-19 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0003_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'txn_date', 'id'], name='txn_account_date_idx'),
+        ),
+    ]
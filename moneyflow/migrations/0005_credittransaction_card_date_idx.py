@@ -0,0 +1,17 @@
+# Generated by Django 6.1.2 on 2026-10-19 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0004_transaction_account_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='credittransaction',
+            index=models.Index(fields=['credit_card', 'txn_date', 'id'], name='ctxn_card_date_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.1.2 on 2026-10-19 18:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0005_credittransaction_card_date_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransferLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('TRANSFER', 'Transfer'), ('CARD_PAYMENT', 'Card Payment')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='Amount')),
+                ('isrt_dt', models.DateTimeField(auto_now_add=True, verbose_name='Inserted Date')),
+                ('card_txn', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='card_payment', to='moneyflow.credittransaction', verbose_name='Card Transaction')),
+                ('credit_txn', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='transfer_in', to='moneyflow.transaction', verbose_name='Credit Transaction')),
+                ('debit_txn', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_out', to='moneyflow.transaction', verbose_name='Debit Transaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_links', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Transfer Link',
+                'verbose_name_plural': 'Transfer Links',
+                'constraints': [models.CheckConstraint(condition=models.Q(('credit_txn__isnull', True), ('card_txn__isnull', True), _connector='XOR'), name='transfer_link_one_credit_leg')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.1.2 on 2026-10-19 18:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0006_transferlink'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, verbose_name='Normalized Description')),
+                ('direction', models.CharField(choices=[('DEBIT', 'Debit'), ('CREDIT', 'Credit')], max_length=6)),
+                ('txn_desc', models.CharField(max_length=1024, verbose_name='Last Transaction Description')),
+                ('grp_name', models.CharField(blank=True, default='', max_length=1024, verbose_name='Last Group Name')),
+                ('txns', models.PositiveIntegerField(verbose_name='Transactions')),
+                ('first_date', models.DateTimeField(verbose_name='First Transaction Date')),
+                ('last_date', models.DateTimeField(verbose_name='Last Transaction Date')),
+                ('period_mean', models.FloatField(default=0, verbose_name='Mean Interval (days)')),
+                ('period_m2', models.FloatField(default=0, verbose_name='Interval Sum of Squared Deviations')),
+                ('amount_mean', models.FloatField(verbose_name='Mean Amount')),
+                ('amount_m2', models.FloatField(default=0, verbose_name='Amount Sum of Squared Deviations')),
+                ('is_recurring', models.BooleanField(default=False)),
+                ('next_date', models.DateTimeField(blank=True, null=True, verbose_name='Expected Next Date')),
+                ('updt_dt', models.DateTimeField(auto_now=True, verbose_name='Updated Date')),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recurring_series', to='moneyflow.account')),
+                ('credit_card', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recurring_series', to='moneyflow.creditcard')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_series', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Recurring Series',
+                'verbose_name_plural': 'Recurring Series',
+                'indexes': [models.Index(fields=['user', 'is_recurring'], name='recurring_series_user_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('account__isnull', False)), fields=('account', 'direction', 'key'), name='recurring_series_account_key'), models.UniqueConstraint(condition=models.Q(('credit_card__isnull', False)), fields=('credit_card', 'direction', 'key'), name='recurring_series_card_key')],
+            },
+        ),
+    ]
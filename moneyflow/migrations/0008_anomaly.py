@@ -0,0 +1,38 @@
+# Generated by Django 6.1.2 on 2026-10-19 18:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0007_recurringseries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Anomaly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grp_name', models.CharField(blank=True, default='', max_length=1024, verbose_name='Group Name')),
+                ('txn_date', models.DateTimeField(verbose_name='Transaction Date')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='Amount')),
+                ('median', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='Rolling Median')),
+                ('mad', models.DecimalField(decimal_places=2, max_digits=16, verbose_name='Rolling MAD')),
+                ('score', models.FloatField()),
+                ('isrt_dt', models.DateTimeField(auto_now_add=True, verbose_name='Inserted Date')),
+                ('card_txn', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='anomaly', to='moneyflow.credittransaction', verbose_name='Card Transaction')),
+                ('txn', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='anomaly', to='moneyflow.transaction', verbose_name='Transaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomalies', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Anomaly',
+                'verbose_name_plural': 'Anomalies',
+                'indexes': [models.Index(fields=['user', 'grp_name'], name='anomaly_user_group_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('txn__isnull', True), ('card_txn__isnull', True), _connector='XOR'), name='anomaly_one_transaction')],
+            },
+        ),
+    ]
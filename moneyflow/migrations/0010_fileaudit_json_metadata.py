@@ -0,0 +1,93 @@
+# Generated by Django 6.1.2 on 2026-10-19 18:44
+
+import json
+
+import django.db.models.fields.json
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize_metadata(apps, schema_editor):
+    """
+    Rewrites the arguments and additional text of the files as JSON objects, wrapping anything else, and
+    splits the exception class out of recorded errors.
+    """
+    FileAudit = apps.get_model('moneyflow', 'FileAudit')
+    for audit_file in FileAudit.objects.only('op_args', 'op_add_txt').iterator():
+        metadata = []
+        for value, key in ((audit_file.op_args, 'args'), (audit_file.op_add_txt, 'text')):
+            try:
+                value = json.loads(value) if value else {}
+            except ValueError:
+                value = {key: value}
+            metadata.append(value if isinstance(value, dict) else {key: value})
+        op_args, op_add_txt = metadata
+
+        error_class = str(op_add_txt.get('error', '')).partition(':')[0]
+        if error_class.isidentifier():
+            op_add_txt['error_class'] = error_class
+        FileAudit.objects.filter(pk=audit_file.pk).update(op_args=json.dumps(op_args),
+                                                          op_add_txt=json.dumps(op_add_txt))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0009_categories'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_metadata, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='fileaudit',
+            name='op_args',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Operation Arguments'),
+        ),
+        migrations.AlterField(
+            model_name='fileaudit',
+            name='op_add_txt',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Operation Additional Text'),
+        ),
+        migrations.AddField(
+            model_name='fileaudit',
+            name='error_class',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.fields.json.KeyTextTransform('error_class', 'op_add_txt'), output_field=models.CharField(max_length=255)),
+        ),
+        migrations.AddField(
+            model_name='fileaudit',
+            name='grouper',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.NullIf(models.Case(models.When(op_add_txt__has_key='regroup', then=django.db.models.fields.json.KeyTextTransform('regroup', 'op_add_txt')), default=django.db.models.fields.json.KeyTextTransform('grouper', 'op_args')), models.Value('null'), output_field=models.CharField()), output_field=models.CharField(max_length=255), verbose_name='Last Grouper'),
+        ),
+        migrations.AddField(
+            model_name='fileaudit',
+            name='parser',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.fields.json.KeyTextTransform('parser', 'op_args'), output_field=models.CharField(max_length=20)),
+        ),
+        migrations.AddField(
+            model_name='fileaudit',
+            name='row_count',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Cast(django.db.models.fields.json.KeyTextTransform('rows_read', 'op_stats'), models.IntegerField()), output_field=models.IntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='fileaudit',
+            index=models.Index(fields=['user', 'status', 'isrt_dt'], name='file_audit_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileaudit',
+            index=models.Index(fields=['user', 'parser', 'isrt_dt'], name='file_audit_parser_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileaudit',
+            index=models.Index(fields=['user', 'grouper'], name='file_audit_grouper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileaudit',
+            index=models.Index(fields=['user', 'row_count'], name='file_audit_row_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fileaudit',
+            index=models.Index(fields=['user', 'error_class'], name='file_audit_error_class_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.1.2 on 2026-10-19 18:46
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+
+
+def backfill_totals(apps, schema_editor):
+    """
+    Totals the transactions of every loaded file with one grouped query per transaction table.
+    """
+    FileAudit = apps.get_model('moneyflow', 'FileAudit')
+    totals = {'txn_count': Count('id'), 'first_txn_date': Min('txn_date'), 'last_txn_date': Max('txn_date')}
+    rows = [
+        *apps.get_model('moneyflow', 'Transaction').objects.order_by().values('src_file_id').annotate(
+            **totals, total_debit=Sum('dbt_amount'), total_credit=Sum('cr_amount')),
+        *apps.get_model('moneyflow', 'CreditTransaction').objects.order_by().values('src_file_id').annotate(
+            **totals, total_debit=Sum('amt', filter=Q(is_credit=False), default=0),
+            total_credit=Sum('amt', filter=Q(is_credit=True), default=0)),
+    ]
+    FileAudit.objects.bulk_update([FileAudit(pk=row.pop('src_file_id'), **row) for row in rows],
+                                  ['txn_count', 'first_txn_date', 'last_txn_date', 'total_debit', 'total_credit'],
+                                  batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0010_fileaudit_json_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileaudit',
+            name='first_txn_date',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='First Transaction Date'),
+        ),
+        migrations.AddField(
+            model_name='fileaudit',
+            name='last_txn_date',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last Transaction Date'),
+        ),
+        migrations.AddField(
+            model_name='fileaudit',
+            name='total_credit',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='Total Credit'),
+        ),
+        migrations.AddField(
+            model_name='fileaudit',
+            name='total_debit',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='Total Debit'),
+        ),
+        migrations.AddField(
+            model_name='fileaudit',
+            name='txn_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Transactions'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.1.2 on 2026-10-19 18:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0011_fileaudit_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileaudit',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='SHA-256'),
+        ),
+        migrations.AddIndex(
+            model_name='fileaudit',
+            index=models.Index(fields=['user', 'sha256'], name='file_audit_sha256_idx'),
+        ),
+    ]
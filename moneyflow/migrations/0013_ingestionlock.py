@@ -0,0 +1,26 @@
+# Generated by Django 6.1.2 on 2026-10-19 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0012_fileaudit_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('token', models.CharField(max_length=32)),
+                ('acquired_dt', models.DateTimeField(verbose_name='Acquired Date')),
+            ],
+            options={
+                'verbose_name': 'Ingestion Lock',
+                'verbose_name_plural': 'Ingestion Locks',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-19 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0013_ingestionlock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anomaly',
+            name='kind',
+            field=models.CharField(choices=[('AMOUNT', 'Unusual Amount'), ('DUPLICATE', 'Duplicate')], default='AMOUNT', max_length=10),
+        ),
+    ]
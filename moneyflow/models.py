@@ -1,8 +1,12 @@
 from decimal import Decimal
 
 from django.conf import settings
+from django.contrib.contenttypes.fields import GenericRelation
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, NullIf
+from django.utils import timezone
 
 
 class Account(models.Model):
@@ -57,19 +61,68 @@ class FileAudit(models.Model):
     to_id = models.BigIntegerField()
     op_desc = models.CharField(max_length=255, verbose_name="Opreration Description")
     status = models.CharField(max_length=255)
-    op_args = models.CharField(max_length=1024, blank=True, default='', verbose_name="Operation Arguments")
-    op_add_txt = models.TextField(blank=True, default='', verbose_name="Operation Additional Text")
+    op_args = models.JSONField(blank=True, default=dict, verbose_name="Operation Arguments")
+    op_add_txt = models.JSONField(blank=True, default=dict, verbose_name="Operation Additional Text")
+    op_stats = models.JSONField(blank=True, default=dict, verbose_name="Operation Statistics")
     updt_dt = models.DateTimeField(auto_now=True, verbose_name="Updated Date")
     isrt_dt = models.DateTimeField(auto_now_add=True, verbose_name="Inserted Date")
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
+    txn_count = models.PositiveIntegerField(default=0, verbose_name="Transactions")
+    first_txn_date = models.DateTimeField(null=True, blank=True, verbose_name="First Transaction Date")
+    last_txn_date = models.DateTimeField(null=True, blank=True, verbose_name="Last Transaction Date")
+    total_debit = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total Debit")
+    total_credit = models.DecimalField(max_digits=17, decimal_places=2, default=0, verbose_name="Total Credit")
+    sha256 = models.CharField(max_length=64, null=True, blank=True, verbose_name="SHA-256")
+
+    # Extracted from the JSON columns by the database itself, so that files are filtered on them with an index
+    parser = models.GeneratedField(expression=KT('op_args__parser'), output_field=models.CharField(max_length=20),
+                                   db_persist=True)
+    # SQLite extracts JSON nulls as 'null' where PostgreSQL gives NULL
+    grouper = models.GeneratedField(
+        expression=NullIf(models.Case(models.When(op_add_txt__has_key='regroup', then=KT('op_add_txt__regroup')),
+                                      default=KT('op_args__grouper')),
+                          models.Value('null'), output_field=models.CharField()),
+        output_field=models.CharField(max_length=255), db_persist=True, verbose_name="Last Grouper"
+    )
+    row_count = models.GeneratedField(expression=Cast(KT('op_stats__rows_read'), models.IntegerField()),
+                                      output_field=models.IntegerField(), db_persist=True)
+    error_class = models.GeneratedField(expression=KT('op_add_txt__error_class'),
+                                        output_field=models.CharField(max_length=255), db_persist=True)
 
     class Meta:
         verbose_name = "File"
         verbose_name_plural = "Files"
+        indexes = [
+            models.Index(fields=['user', 'status', 'isrt_dt'], name='file_audit_status_idx'),
+            models.Index(fields=['user', 'parser', 'isrt_dt'], name='file_audit_parser_idx'),
+            models.Index(fields=['user', 'grouper'], name='file_audit_grouper_idx'),
+            models.Index(fields=['user', 'row_count'], name='file_audit_row_count_idx'),
+            models.Index(fields=['user', 'error_class'], name='file_audit_error_class_idx'),
+            models.Index(fields=['user', 'sha256'], name='file_audit_sha256_idx'),
+        ]
 
     def __str__(self):
         return f"{self.file_name} ({self.id})"
 
+    def record_totals(self, txns: list) -> None:
+        """
+        Stores the count, date range and debit/credit totals of the transactions loaded from the file, so that
+        files are listed with them without touching the transaction tables. Not saved.
+
+        :param txns: The account or credit card transactions of the file.
+        """
+        self.txn_count = len(txns)
+        self.first_txn_date = min((txn.txn_date for txn in txns), default=None)
+        self.last_txn_date = max((txn.txn_date for txn in txns), default=None)
+        if txns and isinstance(txns[0], CreditTransaction):
+            debits = [txn.amt for txn in txns if not txn.is_credit]
+            credits = [txn.amt for txn in txns if txn.is_credit]
+        else:
+            debits = [txn.dbt_amount for txn in txns]
+            credits = [txn.cr_amount for txn in txns]
+        self.total_debit = sum((Decimal(str(amount)) for amount in debits), Decimal(0))
+        self.total_credit = sum((Decimal(str(amount)) for amount in credits), Decimal(0))
+
 
 class Transaction(models.Model):
     account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='transactions')
@@ -89,6 +142,12 @@ class Transaction(models.Model):
                                  verbose_name="CF Amount")
     src_file = models.ForeignKey(FileAudit, on_delete=models.CASCADE, related_name='transactions',
                                  verbose_name="Source File")
+    tagged_items = GenericRelation('tags.TaggedItem', related_query_name='transaction')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'txn_date', 'id'], name='txn_account_date_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.txn_desc
@@ -103,10 +162,222 @@ class CreditTransaction(models.Model):
     is_credit = models.BooleanField(default=False)
     src_file = models.ForeignKey(FileAudit, on_delete=models.CASCADE, related_name='credit_transactions',
                                  verbose_name="Source File")
+    tagged_items = GenericRelation('tags.TaggedItem', related_query_name='credit_transaction')
 
     class Meta:
         verbose_name = "Credit Transaction"
         verbose_name_plural = "Credit Transactions"
+        indexes = [
+            models.Index(fields=['credit_card', 'txn_date', 'id'], name='ctxn_card_date_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.txn_desc
+
+
+class TransferLink(models.Model):
+    """
+    Pairs the debit of a bank transaction with the matching credit on another of the user's accounts (a transfer)
+    or on one of their credit cards (a card payment). Both legs are internal money movement, not spending.
+    """
+    TRANSFER = 'TRANSFER'
+    CARD_PAYMENT = 'CARD_PAYMENT'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transfer_links')
+    kind = models.CharField(max_length=20, choices=[(TRANSFER, "Transfer"), (CARD_PAYMENT, "Card Payment")])
+    debit_txn = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name='transfer_out',
+                                     verbose_name="Debit Transaction")
+    credit_txn = models.OneToOneField(Transaction, on_delete=models.CASCADE, null=True, blank=True,
+                                      related_name='transfer_in', verbose_name="Credit Transaction")
+    card_txn = models.OneToOneField(CreditTransaction, on_delete=models.CASCADE, null=True, blank=True,
+                                    related_name='card_payment', verbose_name="Card Transaction")
+    amount = models.DecimalField(max_digits=16, decimal_places=2, verbose_name="Amount")
+    isrt_dt = models.DateTimeField(auto_now_add=True, verbose_name="Inserted Date")
+
+    class Meta:
+        verbose_name = "Transfer Link"
+        verbose_name_plural = "Transfer Links"
+        constraints = [
+            models.CheckConstraint(condition=models.Q(credit_txn__isnull=True) ^ models.Q(card_txn__isnull=True),
+                                   name='transfer_link_one_credit_leg'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind}: {self.debit_txn_id} -> {self.credit_txn_id or self.card_txn_id}"
+
+
+class RecurringSeries(models.Model):
+    """
+    Running statistics of the transactions sharing a normalized description on one account or card, in one
+    direction. The series with enough regular occurrences of a steady amount are the recurring ones:
+    subscriptions, EMIs, salary credits and the like.
+    """
+    DEBIT = 'DEBIT'
+    CREDIT = 'CREDIT'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='recurring_series')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, null=True, blank=True,
+                                related_name='recurring_series')
+    credit_card = models.ForeignKey(CreditCard, on_delete=models.CASCADE, null=True, blank=True,
+                                    related_name='recurring_series')
+    key = models.CharField(max_length=255, verbose_name="Normalized Description")
+    direction = models.CharField(max_length=6, choices=[(DEBIT, "Debit"), (CREDIT, "Credit")])
+    txn_desc = models.CharField(max_length=1024, verbose_name="Last Transaction Description")
+    grp_name = models.CharField(max_length=1024, blank=True, default='', verbose_name="Last Group Name")
+    txns = models.PositiveIntegerField(verbose_name="Transactions")
+    first_date = models.DateTimeField(verbose_name="First Transaction Date")
+    last_date = models.DateTimeField(verbose_name="Last Transaction Date")
+    period_mean = models.FloatField(default=0, verbose_name="Mean Interval (days)")
+    period_m2 = models.FloatField(default=0, verbose_name="Interval Sum of Squared Deviations")
+    amount_mean = models.FloatField(verbose_name="Mean Amount")
+    amount_m2 = models.FloatField(default=0, verbose_name="Amount Sum of Squared Deviations")
+    is_recurring = models.BooleanField(default=False)
+    next_date = models.DateTimeField(null=True, blank=True, verbose_name="Expected Next Date")
+    updt_dt = models.DateTimeField(auto_now=True, verbose_name="Updated Date")
+
+    class Meta:
+        verbose_name = "Recurring Series"
+        verbose_name_plural = "Recurring Series"
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'direction', 'key'], condition=models.Q(account__isnull=False),
+                                    name='recurring_series_account_key'),
+            models.UniqueConstraint(fields=['credit_card', 'direction', 'key'],
+                                    condition=models.Q(credit_card__isnull=False), name='recurring_series_card_key'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'is_recurring'], name='recurring_series_user_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.key} ({self.direction})"
+
+    @property
+    def period_std(self) -> float:
+        return (self.period_m2 / max(self.txns - 1, 1)) ** 0.5
+
+    @property
+    def amount_std(self) -> float:
+        return (self.amount_m2 / max(self.txns, 1)) ** 0.5
+
+
+class Anomaly(models.Model):
+    """
+    A debit whose amount stands out from the previous debits of its group: its distance from their rolling
+    median, measured in (scaled) median absolute deviations, is the score. Debits repeating the amount of an
+    earlier debit of their group shortly after it are flagged as duplicates, whatever their score.
+    """
+    AMOUNT = 'AMOUNT'
+    DUPLICATE = 'DUPLICATE'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='anomalies')
+    kind = models.CharField(max_length=10, choices=[(AMOUNT, "Unusual Amount"), (DUPLICATE, "Duplicate")],
+                            default=AMOUNT)
+    txn = models.OneToOneField(Transaction, on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='anomaly', verbose_name="Transaction")
+    card_txn = models.OneToOneField(CreditTransaction, on_delete=models.CASCADE, null=True, blank=True,
+                                    related_name='anomaly', verbose_name="Card Transaction")
+    grp_name = models.CharField(max_length=1024, blank=True, default='', verbose_name="Group Name")
+    txn_date = models.DateTimeField(verbose_name="Transaction Date")
+    amount = models.DecimalField(max_digits=16, decimal_places=2, verbose_name="Amount")
+    median = models.DecimalField(max_digits=16, decimal_places=2, verbose_name="Rolling Median")
+    mad = models.DecimalField(max_digits=16, decimal_places=2, verbose_name="Rolling MAD")
+    score = models.FloatField()
+    isrt_dt = models.DateTimeField(auto_now_add=True, verbose_name="Inserted Date")
+
+    class Meta:
+        verbose_name = "Anomaly"
+        verbose_name_plural = "Anomalies"
+        constraints = [
+            models.CheckConstraint(condition=models.Q(txn__isnull=True) ^ models.Q(card_txn__isnull=True),
+                                   name='anomaly_one_transaction'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'grp_name'], name='anomaly_user_group_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.grp_name}: {self.amount} ({self.score:.1f})"
+
+
+class Category(models.Model):
+    """
+    A node of the user's category tree. Groups are assigned to categories through `CategoryGroup`, and the
+    ancestors of every category are stored in `CategoryClosure`, so that the groups under a category at any
+    depth are found with one indexed join.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='categories')
+    name = models.CharField(max_length=100)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
+
+    class Meta:
+        verbose_name_plural = "Categories"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'parent', 'name'], name='category_unique_name'),
+            models.UniqueConstraint(fields=['user', 'name'], condition=models.Q(parent__isnull=True),
+                                    name='category_unique_root_name'),
+        ]
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class CategoryClosure(models.Model):
+    """
+    A (ancestor, descendant) pair of the category tree, including every category with itself at depth 0.
+    """
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='category_closure_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='category_closure_desc_idx'),
+        ]
+
+
+class CategoryGroup(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='category_groups')
+    grp_name = models.CharField(max_length=1024, verbose_name="Group Name")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='groups')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'grp_name'], name='category_group_unique'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.grp_name} -> {self.category}"
+
+
+class DataVersion(models.Model):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='data_version')
+    version = models.PositiveBigIntegerField(default=0)
+    updt_dt = models.DateTimeField(default=timezone.now, verbose_name="Updated Date")
+
+    class Meta:
+        verbose_name = "Data Version"
+        verbose_name_plural = "Data Versions"
+
+    def __str__(self) -> str:
+        return f"{self.user} (v{self.version})"
+
+
+class IngestionLock(models.Model):
+    """
+    A held lock on the ingestion into an account or card, for databases without row level locks (SQLite). The
+    row exists while the lock is held, see `locking.ingestion_lock`.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    token = models.CharField(max_length=32)
+    acquired_dt = models.DateTimeField(verbose_name="Acquired Date")
+
+    class Meta:
+        verbose_name = "Ingestion Lock"
+        verbose_name_plural = "Ingestion Locks"
+
+    def __str__(self) -> str:
+        return self.key
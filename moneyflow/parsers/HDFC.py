@@ -1,34 +1,31 @@
+from collections.abc import Iterator
 from io import BufferedReader, TextIOWrapper
 
 FILE_HEADER = "txn_date,txn_desc,opr_dt,dbt_amount,cr_amount,ref_num,cf_amt"
 CC_FILE_HEADER = "txn_date,txn_desc,amt,is_credit"
 
 
-def parse_delimited(uploaded_file: BufferedReader) -> str:
+def parse_delimited(uploaded_file: BufferedReader) -> Iterator[str]:
     stream = TextIOWrapper(uploaded_file, encoding='utf-8')
     stream.__next__()
     stream.__next__()
-    raw_lines = stream.readlines()
-    lines = []
-    for line in raw_lines:
+    yield FILE_HEADER + '\n'
+    for line in stream:
         # Remove Commas in Narration
         line = line[:14] + line[14:133].replace(',', '~') + line[133:]
-        line = line.replace(' ', '')
-        lines.append(line)
-    ret = FILE_HEADER + '\n'
-    for line in lines:
-        ret += line
-    return ret
+        yield line.replace(' ', '')
 
 
-def parse_cc_csv(uploaded_file: BufferedReader) -> str:
+def parse_cc_csv(uploaded_file: BufferedReader) -> Iterator[str]:
     stream = TextIOWrapper(uploaded_file, encoding='utf-8')
 
     found_start_point = False
-    lines = [CC_FILE_HEADER]
+    yield CC_FILE_HEADER + '\n'
 
     while not found_start_point:
         line = stream.readline()
+        if line == '':
+            raise ValueError("Transactions not found in the file")
         if line.startswith("Transaction type~|~"):
             found_start_point = True
 
@@ -43,9 +40,7 @@ def parse_cc_csv(uploaded_file: BufferedReader) -> str:
         line[2] = line[2].replace(',', '')
         line[3] = 'N' if line[3] == '' else "Y"
         line.pop(4)
-        line = ",".join(line)
-        lines.append(line)
-    return '\n'.join(lines)
+        yield ",".join(line) + '\n'
 
 
 if __name__ == '__main__':
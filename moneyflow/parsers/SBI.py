@@ -18,9 +18,7 @@ def unlock_file(uploaded_file: BufferedReader, pw: str) -> BytesIO:
     return file
 
 
-def parse_xlsx(uploaded_file: BufferedReader, pw: str) -> str:
-    file = unlock_file(uploaded_file, pw)
-
+def read_xlsx(file: BytesIO) -> str:
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
         workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
@@ -76,4 +74,4 @@ def parse_xlsx(uploaded_file: BufferedReader, pw: str) -> str:
 if __name__ == '__main__':
     with open('Examples/SBI_XLSX.xlsx', 'rb') as f:
         with open('Examples/temp.csv', 'w', newline='') as csvfile:
-            csvfile.writelines(parse_xlsx(f, "TEST"))
+            csvfile.writelines(read_xlsx(unlock_file(f, "TEST")))
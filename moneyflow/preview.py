@@ -0,0 +1,122 @@
+from csv import DictReader
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+from jinja2 import Template
+
+from .file_actions import StageTimer, count_renders, get_group
+from .models import Transaction
+from .parsers import CC_FILE_HEADER, FILE_HEADER
+
+# Columns of the parsed rows, and those holding dates and amounts, by the file's source
+COLUMNS = {'ACC': FILE_HEADER.split(','), 'CC': CC_FILE_HEADER.split(',')}
+DATE_COLUMNS = {'ACC': ('txn_date', 'opr_dt'), 'CC': ('txn_date',)}
+AMOUNT_COLUMNS = {'ACC': ('dbt_amount', 'cr_amount', 'cf_amt'), 'CC': ('amt',)}
+
+
+def preview_rows(reader: DictReader, source: str, rows: int, dt_format: str, grouper: Template | None,
+                 timer: StageTimer, latest_txn: Transaction = None, is_strict_future: bool = False) -> dict:
+    """
+    Normalizes the first rows of an upload the way the upload would, without saving anything. Rows failing
+    to normalize are reported as issues instead of failing the preview, as are errors of the parser.
+
+    :param reader: The reader of the file, lazy so only the previewed rows are parsed.
+    :param source: 'ACC' or 'CC', the kind of transactions the file holds.
+    :param rows: The number of rows to preview.
+    :param latest_txn: The latest transaction of the account with `is_future_only`, deciding which rows
+        would be inserted.
+    :return: The normalized rows, each telling whether the upload would insert it, and the issues found.
+    """
+    home_tz = ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz"))
+    normalized, issues = [], []
+    found_match = False
+    truncated = False
+    rows_read = 0
+    renders = 0
+
+    def issue(row: int | None, column: str | None, message: str) -> None:
+        issues.append({'row': row, 'column': column, 'issue': message})
+
+    try:
+        missing = [column for column in COLUMNS[source] if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+        # One row past the preview tells whether the file has more
+        for number, row in enumerate(islice(reader, rows + 1), start=1):
+            if number > rows:
+                truncated = True
+                break
+
+            rows_read = number
+            missing = [column for column in COLUMNS[source] if row.get(column) is None]
+            if missing:
+                issue(number, None, f"Missing values: {', '.join(missing)}")
+                continue
+
+            this_row = {'row': number, **{column: row[column] for column in COLUMNS[source]}}
+            with timer.stage('dates'):
+                for column in DATE_COLUMNS[source]:
+                    try:
+                        this_row[column] = timezone.make_aware(datetime.strptime(row[column], dt_format), home_tz)
+                    except ValueError as e:
+                        this_row[column] = None
+                        issue(number, column, str(e))
+            for column in AMOUNT_COLUMNS[source]:
+                try:
+                    this_row[column] = Decimal(row[column])
+                except InvalidOperation:
+                    this_row[column] = None
+                    issue(number, column, f"'{row[column]}' is not a number")
+                    continue
+                if source == 'ACC' and this_row[column] < 0:
+                    issue(number, column, f"{column} cannot be < 0")
+            if source == 'CC':
+                if row['is_credit'] not in ('Y', 'N'):
+                    issue(number, 'is_credit', f"'{row['is_credit']}' is neither Y nor N")
+                this_row['is_credit'] = row['is_credit'] == 'Y'
+            with timer.stage('group'):
+                renders += 1
+                try:
+                    this_row['grp_name'] = get_group(grouper, row['txn_desc'])
+                except Exception as e:
+                    this_row['grp_name'] = None
+                    issue(number, 'txn_desc', f"Grouper failed: {e.__class__.__name__}: {e}")
+
+            this_row['insert'] = True
+            if latest_txn and (not found_match):
+                if this_row['txn_date'] is None:
+                    this_row['insert'] = None
+                elif is_strict_future:
+                    found_match = (
+                            row['cf_amt'] == str(latest_txn.cf_amt) and
+                            this_row['txn_date'] == latest_txn.txn_date and
+                            this_row['txn_desc'] == latest_txn.txn_desc
+                    )
+                    this_row['insert'] = False
+                elif this_row['txn_date'] < latest_txn.txn_date:
+                    this_row['insert'] = False
+                else:
+                    found_match = True
+            normalized.append(this_row)
+    except Exception as e:
+        issue(None, None, f"{e.__class__.__name__}: {e}")
+    count_renders(grouper, renders)
+
+    if not rows_read and not issues:
+        issue(None, None, "No rows found in the file")
+    elif latest_txn and not found_match:
+        issue(None, None, "The latest transaction of the account was not found in the previewed rows"
+              if is_strict_future else "No previewed row is after the latest transaction of the account")
+
+    return {
+        'rows_read': rows_read,
+        'truncated': truncated,
+        'latest_txn_date': latest_txn.txn_date if latest_txn else None,
+        'rows': normalized,
+        'issues': issues,
+    }
@@ -0,0 +1,262 @@
+import re
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, IntegerField, QuerySet, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import CreditTransaction, FileAudit, RecurringSeries, Transaction
+from .reconciliation import EpochSeconds, paise
+
+DAY = 86400
+TOKEN = re.compile(r'[a-z0-9]+')
+DIGIT = re.compile(r'\d')
+WHITESPACE = re.compile(r'\s+')
+NON_LETTER = re.compile(r'[^a-z]+')
+# Maps every digit to 0, which keeps the tokens and which of them hold digits as they are for `normalize`
+ZERO_DIGITS = bytes.maketrans(b'123456789', b'000000000')
+
+
+def normalize(txn_desc: str) -> str:
+    """
+    Reduces a description to the words identifying the counterparty, dropping the references, dates, masked
+    card numbers and other tokens that change between occurrences: `UPI-NETFLIX-netflix@ybl-123456-UPI` and
+    `UPI-NETFLIX-netflix@ybl-654321-UPI` both become `upi netflix netflix ybl upi`. Whitespace is ignored, as
+    some parsers strip it, and descriptions made of such tokens only are reduced to their letters.
+    """
+    txn_desc = WHITESPACE.sub('', txn_desc.lower())
+    tokens = [token for token in TOKEN.findall(txn_desc) if not DIGIT.search(token) and token.strip('x')]
+    return (' '.join(tokens) or NON_LETTER.sub('', txn_desc))[:255]
+
+
+def owner_field(source: str) -> str:
+    return 'account_id' if source == 'ACC' else 'credit_card_id'
+
+
+def load_rows(queryset: QuerySet, source: str) -> dict[str, np.ndarray | list]:
+    """
+    Loads transactions as arrays of owner (account or card), epoch seconds, amount in hundredths and
+    direction (1 for credits), along with their descriptions and groups.
+    """
+    if source == 'ACC':
+        queryset = queryset.annotate(cents=paise('dbt_amount') + paise('cr_amount'),
+                                     credit=Case(When(cr_amount__gt=0, then=Value(1)), default=Value(0),
+                                                 output_field=IntegerField()))
+    else:
+        queryset = queryset.annotate(cents=paise('amt'), credit=Cast('is_credit', IntegerField()))
+    queryset = queryset.annotate(ts=EpochSeconds('txn_date')).values_list(
+        owner_field(source), 'ts', 'cents', 'credit', 'txn_desc', 'grp_name')
+
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    owner, ts, cents, credit, txn_desc, grp_name = zip(*rows) if rows else ((),) * 6
+    return {
+        'owner': np.array(owner, dtype=np.int64),
+        'ts': np.array(ts, dtype=np.int64),
+        'cents': np.array(cents, dtype=np.int64),
+        'credit': np.array(credit, dtype=np.int64),
+        'txn_desc': txn_desc,
+        'grp_name': grp_name,
+    }
+
+
+def group_rows(rows: dict) -> tuple[np.ndarray, list[tuple[int, int, str]]]:
+    """
+    Assigns every row the code of its (owner, direction, normalized description) series.
+
+    :return: The code of each row and the key of each code.
+    """
+    # Most descriptions only differ by their digits: zero those in bulk first, and normalize each distinct rest once
+    masked = {}
+    masked_codes = np.fromiter(
+        (masked.setdefault(key, len(masked)) for key in zip(rows['owner'].tolist(), rows['credit'].tolist(),
+                                                            (txn_desc.encode().translate(ZERO_DIGITS)
+                                                             for txn_desc in rows['txn_desc']))),
+        dtype=np.int64, count=len(rows['ts']))
+    codes = {}
+    remap = np.array([codes.setdefault((owner, credit, normalize(txn_desc.decode())), len(codes))
+                      for owner, credit, txn_desc in masked], dtype=np.int64)
+    return remap[masked_codes], list(codes)
+
+
+def series_stats(codes: np.ndarray, rows: dict, groups: int) -> dict[str, np.ndarray]:
+    """
+    Computes the statistics of every series in one vectorized pass: the rows are sorted by (series, time)
+    and every per-series sum is a `bincount` over the series codes.
+
+    Intervals and amounts are summarized by their count, mean and sum of squared deviations, which can be
+    merged exactly with the statistics of later rows by `merge_stats`.
+    """
+    order = np.lexsort((rows['ts'], codes))
+    codes, ts, amounts = codes[order], rows['ts'][order], rows['cents'][order] / 100
+    ends = np.searchsorted(codes, np.arange(groups), side='right') - 1
+
+    txns = np.bincount(codes, minlength=groups)
+    amount_mean = np.bincount(codes, amounts, groups) / txns
+    amount_m2 = np.bincount(codes, (amounts - amount_mean[codes]) ** 2, groups)
+
+    same = codes[1:] == codes[:-1]
+    gaps, gap_codes = (np.diff(ts) / DAY)[same], codes[1:][same]
+    intervals = txns - 1
+    period_mean = np.bincount(gap_codes, gaps, groups) / np.maximum(intervals, 1)
+    period_m2 = np.bincount(gap_codes, (gaps - period_mean[gap_codes]) ** 2, groups)
+
+    return {
+        'txns': txns, 'first': ts[ends - txns + 1], 'last': ts[ends], 'last_row': order[ends],
+        'period_mean': period_mean, 'period_m2': period_m2, 'amount_mean': amount_mean, 'amount_m2': amount_m2,
+    }
+
+
+def merge_stats(n_a, mean_a, m2_a, n_b, mean_b, m2_b) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Combines the count, mean and sum of squared deviations of two samples (Chan et al.), element-wise.
+    """
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    safe_n = np.maximum(n, 1)
+    return n, mean_a + delta * n_b / safe_n, m2_a + m2_b + delta ** 2 * n_a * n_b / safe_n
+
+
+def classify(stats: dict) -> np.ndarray:
+    """
+    Flags the series with at least `min_txns` transactions, a mean interval within the configured bounds,
+    and intervals and amounts whose standard deviations are within the configured tolerances of their means.
+    """
+    conf = settings.USER_SETTINGS['Recurring']
+    period_std = np.sqrt(stats['period_m2'] / np.maximum(stats['txns'] - 1, 1))
+    amount_std = np.sqrt(stats['amount_m2'] / np.maximum(stats['txns'], 1))
+    return ((stats['txns'] >= conf.getint('min_txns'))
+            & (stats['period_mean'] >= conf.getfloat('min_period_days'))
+            & (stats['period_mean'] <= conf.getfloat('max_period_days'))
+            & (period_std <= conf.getfloat('period_tolerance') * stats['period_mean'])
+            & (amount_std <= conf.getfloat('amount_tolerance') * np.abs(stats['amount_mean'])))
+
+
+def epoch_date(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, tz=UTC)
+
+
+def build_series(user, source: str, keys: list[tuple[int, int, str]], stats: dict, rows: dict,
+                 existing: dict = None) -> list[RecurringSeries]:
+    """
+    Builds the series of every key from its statistics, updating the `existing` series of a key in place.
+    """
+    recurring = classify(stats)
+    series = []
+    for code, (owner, credit, key) in enumerate(keys):
+        last_row = stats['last_row'][code]
+        item = (existing or {}).get((owner, credit, key)) or RecurringSeries(
+            user=user, key=key, direction=RecurringSeries.CREDIT if credit else RecurringSeries.DEBIT,
+            first_date=epoch_date(stats['first'][code]), **{owner_field(source): owner})
+        item.txn_desc = rows['txn_desc'][last_row]
+        item.grp_name = rows['grp_name'][last_row]
+        item.txns = int(stats['txns'][code])
+        item.last_date = epoch_date(stats['last'][code])
+        item.period_mean = float(stats['period_mean'][code])
+        item.period_m2 = float(stats['period_m2'][code])
+        item.amount_mean = float(stats['amount_mean'][code])
+        item.amount_m2 = float(stats['amount_m2'][code])
+        item.is_recurring = bool(recurring[code])
+        item.next_date = item.last_date + timedelta(days=item.period_mean) if item.is_recurring else None
+        series.append(item)
+    return series
+
+
+@transaction.atomic
+def refresh_series(user, account_id: int = None, credit_card_id: int = None) -> int:
+    """
+    Detects the recurring series of the user's transactions from scratch, replacing the stored ones.
+
+    :param user: The user whose transactions are scanned.
+    :param account_id: Only scan the transactions of this account.
+    :param credit_card_id: Only scan the transactions of this card.
+    :return: The number of recurring series found.
+    """
+    sources = []
+    if credit_card_id is None:
+        accounts = Transaction.objects.filter(account__user=user)
+        sources.append(('ACC', accounts.filter(account_id=account_id) if account_id else accounts))
+    if account_id is None:
+        cards = CreditTransaction.objects.filter(credit_card__user=user)
+        sources.append(('CC', cards.filter(credit_card_id=credit_card_id) if credit_card_id else cards))
+
+    stored = RecurringSeries.objects.filter(user=user)
+    if account_id:
+        stored = stored.filter(account_id=account_id)
+    elif credit_card_id:
+        stored = stored.filter(credit_card_id=credit_card_id)
+    stored.delete()
+
+    found = 0
+    for source, queryset in sources:
+        rows = load_rows(queryset, source)
+        if len(rows['ts']) == 0:
+            continue
+        codes, keys = group_rows(rows)
+        series = build_series(user, source, keys, series_stats(codes, rows, len(keys)), rows)
+        RecurringSeries.objects.bulk_create(series, batch_size=1000)
+        found += sum(item.is_recurring for item in series)
+    return found
+
+
+def update_series(src_file: FileAudit) -> int:
+    """
+    Folds the transactions of a newly loaded file into the stored series of its account or card, from those
+    rows alone: their statistics are merged with the stored ones, with the interval between the last stored
+    transaction and the first new one in between. Files going back before the last transaction of a series
+    they touch can't be merged that way, and trigger a `refresh_series` of the account or card instead.
+
+    :param src_file: The loaded file.
+    :return: The number of recurring series among the ones the file touched.
+    """
+    source = 'ACC' if src_file.op_desc == 'ACC_TXN_UPLOAD' else 'CC'
+    owner = {owner_field(source): src_file.to_id}
+    rows = load_rows(src_file.transactions if source == 'ACC' else src_file.credit_transactions, source)
+    if len(rows['ts']) == 0:
+        return 0
+
+    codes, keys = group_rows(rows)
+    stats = series_stats(codes, rows, len(keys))
+
+    existing = {
+        (src_file.to_id, int(item.direction == RecurringSeries.CREDIT), item.key): item
+        for item in RecurringSeries.objects.filter(user=src_file.user, **owner)
+    }
+    prior = [existing.get(key) for key in keys]
+    if any(item and item.last_date.timestamp() > first for item, first in zip(prior, stats['first'])):
+        refresh_series(src_file.user, **owner)
+        return RecurringSeries.objects.filter(user=src_file.user, is_recurring=True, key__in=[key for *_, key in keys],
+                                              **owner).count()
+
+    def column(attr: str, default: float = 0) -> np.ndarray:
+        return np.array([getattr(item, attr) if item else default for item in prior], dtype=np.float64)
+
+    txns_a = column('txns')
+    last_a = np.array([item.last_date.timestamp() if item else 0 for item in prior], dtype=np.float64)
+    # The stored series end where the new rows start: one more interval links them
+    link = np.where(txns_a > 0, (stats['first'] - last_a) / DAY, 0)
+    n_int, period_mean, period_m2 = merge_stats(np.maximum(txns_a - 1, 0), column('period_mean'),
+                                                column('period_m2'), (txns_a > 0).astype(np.float64), link, 0)
+    _, period_mean, period_m2 = merge_stats(n_int, period_mean, period_m2, stats['txns'] - 1,
+                                            stats['period_mean'], stats['period_m2'])
+    txns, amount_mean, amount_m2 = merge_stats(txns_a, column('amount_mean'), column('amount_m2'),
+                                               stats['txns'], stats['amount_mean'], stats['amount_m2'])
+    stats.update(txns=txns.astype(np.int64), period_mean=period_mean, period_m2=period_m2,
+                 amount_mean=amount_mean, amount_m2=amount_m2)
+
+    series = build_series(src_file.user, source, keys, stats, rows, existing)
+    now = timezone.now()
+    for item in series:
+        item.updt_dt = now
+    RecurringSeries.objects.bulk_create([item for item in series if item.pk is None], batch_size=1000)
+    RecurringSeries.objects.bulk_update(
+        [item for item in series if item.pk is not None],
+        ['txn_desc', 'grp_name', 'txns', 'last_date', 'period_mean', 'period_m2', 'amount_mean', 'amount_m2',
+         'is_recurring', 'next_date', 'updt_dt'], batch_size=1000)
+    return sum(item.is_recurring for item in series)
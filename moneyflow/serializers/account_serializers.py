@@ -45,6 +45,8 @@ class TransactionFileUploadSerializer(serializers.Serializer):
     pw = serializers.CharField(allow_blank=True, default='')
     is_future_only = serializers.BooleanField(allow_null=True, default=False)
     is_strict_future = serializers.BooleanField(allow_null=True, default=False)
+    preview = serializers.BooleanField(default=False)
+    preview_rows = serializers.IntegerField(min_value=1, max_value=500, default=20)
 
     def validate_parser(self, value):
         value = self.context['acc'].def_parser if not value else value
@@ -96,6 +98,25 @@ class TransactionFileUploadSerializer(serializers.Serializer):
         return attrs
 
 
+class TransactionFileReprocessSerializer(TransactionFileUploadSerializer):
+    file = None
+    pw = None
+    preview = None
+    preview_rows = None
+    file_id = serializers.IntegerField()
+
+    def validate(self, attrs):
+        if (not attrs["is_future_only"]) and attrs["is_strict_future"]:
+            raise serializers.ValidationError("Future Only is required when using Strict Future.")
+
+        if not attrs["dt_format"]:
+            attrs["dt_format"] = SUPPORTED_PARSERS[attrs["parser"]][1]
+
+        # Password protected files are stored decrypted
+        attrs["pw"] = None
+        return attrs
+
+
 class RerunGroupSerializer(serializers.Serializer):
     grouper = serializers.CharField(max_length=40, allow_blank=True, default='')
     blanks_only = serializers.BooleanField()
@@ -122,3 +143,16 @@ class TransactionByDateSerializer(serializers.Serializer):
             raise serializers.ValidationError("From Date must be before To Date")
 
         return attrs
+
+
+class BalanceHistorySerializer(serializers.Serializer):
+    from_date = serializers.DateField(required=False)
+    to_date = serializers.DateField(required=False)
+    interval = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+    points = serializers.IntegerField(min_value=2, required=False)
+
+    def validate(self, attrs):
+        if attrs.get("from_date") and attrs.get("to_date") and attrs["from_date"] > attrs["to_date"]:
+            raise serializers.ValidationError("From Date must be before To Date")
+
+        return attrs
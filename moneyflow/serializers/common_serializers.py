@@ -1,10 +1,155 @@
 from rest_framework import serializers
 
-from ..models import FileAudit
+from ..feed import decode_cursor
+from ..models import Anomaly, Category, FileAudit, RecurringSeries, TransferLink
 
 
 class FileAuditSerializer(serializers.ModelSerializer):
     class Meta:
         model = FileAudit
-        fields = ['id', 'file_name', 'to_id', 'op_desc', 'status', 'op_args', 'op_add_txt', 'isrt_dt']
-        read_only_fields = ['id', 'file_name', 'to_id', 'op_desc', 'status', 'op_args', 'op_add_txt', 'isrt_dt']
+        fields = ['id', 'file_name', 'to_id', 'op_desc', 'status', 'op_args', 'op_add_txt', 'op_stats', 'parser',
+                  'grouper', 'row_count', 'error_class', 'txn_count', 'first_txn_date', 'last_txn_date',
+                  'total_debit', 'total_credit', 'sha256', 'isrt_dt']
+        read_only_fields = fields
+
+
+class SetGroupByFilterSerializer(serializers.Serializer):
+    grp_name = serializers.CharField(max_length=1024, allow_blank=True)
+
+
+class SetGroupSerializer(SetGroupByFilterSerializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class GroupRenameSerializer(SetGroupByFilterSerializer):
+    from_grp_name = serializers.CharField(max_length=1024, allow_blank=True)
+
+
+class FeedSerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, default=50)
+    source = serializers.ChoiceField(choices=['ACC', 'CC'], required=False)
+    account__in = serializers.CharField(required=False)
+    credit_card__in = serializers.CharField(required=False)
+    txn_date__gte = serializers.DateTimeField(required=False)
+    txn_date__lte = serializers.DateTimeField(required=False)
+    amount__gte = serializers.DecimalField(max_digits=17, decimal_places=2, required=False)
+    amount__lte = serializers.DecimalField(max_digits=17, decimal_places=2, required=False)
+    grp_name = serializers.CharField(max_length=1024, allow_blank=True, required=False)
+    search = serializers.CharField(required=False)
+
+    def validate_cursor(self, value):
+        try:
+            return decode_cursor(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+    def validate_id_list(self, value):
+        try:
+            return [int(pk) for pk in value.split(',') if pk]
+        except ValueError:
+            raise serializers.ValidationError("Enter a comma separated list of IDs.")
+
+    validate_account__in = validate_id_list
+    validate_credit_card__in = validate_id_list
+
+
+class TransferLinkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TransferLink
+        fields = ['id', 'kind', 'debit_txn', 'credit_txn', 'card_txn', 'amount', 'isrt_dt']
+        read_only_fields = ['id', 'kind', 'debit_txn', 'credit_txn', 'card_txn', 'amount', 'isrt_dt']
+
+
+class MatchTransfersSerializer(serializers.Serializer):
+    from_date = serializers.DateField(required=False)
+    to_date = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get("from_date") and attrs.get("to_date") and attrs["from_date"] > attrs["to_date"]:
+            raise serializers.ValidationError("From Date must be before To Date")
+
+        return attrs
+
+
+class RecurringSeriesSerializer(serializers.ModelSerializer):
+    period_days = serializers.FloatField(source='period_mean', read_only=True)
+    period_std_days = serializers.FloatField(source='period_std', read_only=True)
+    amount = serializers.FloatField(source='amount_mean', read_only=True)
+    amount_std = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = RecurringSeries
+        fields = ['id', 'account', 'credit_card', 'key', 'direction', 'txn_desc', 'grp_name', 'txns', 'first_date',
+                  'last_date', 'next_date', 'period_days', 'period_std_days', 'amount', 'amount_std', 'updt_dt']
+        read_only_fields = fields
+
+
+class AnomalySerializer(serializers.ModelSerializer):
+    account = serializers.IntegerField(source='txn.account_id', read_only=True, default=None)
+    credit_card = serializers.IntegerField(source='card_txn.credit_card_id', read_only=True, default=None)
+    txn_desc = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Anomaly
+        fields = ['id', 'kind', 'txn', 'card_txn', 'account', 'credit_card', 'txn_date', 'txn_desc', 'grp_name',
+                  'amount', 'median', 'mad', 'score']
+        read_only_fields = fields
+
+    def get_txn_desc(self, obj: Anomaly) -> str:
+        return (obj.txn or obj.card_txn).txn_desc
+
+
+class PercentilesSerializer(serializers.Serializer):
+    q = serializers.CharField(default="50,90,99")
+    measure = serializers.ChoiceField(choices=['debit', 'credit'], default='debit')
+    by_group = serializers.BooleanField(default=False)
+
+    def validate_q(self, value):
+        try:
+            quantiles = [float(quantile) for quantile in value.split(',')]
+        except ValueError:
+            raise serializers.ValidationError("Percentiles must be comma separated numbers")
+        if not quantiles or any(not 0 <= quantile <= 100 for quantile in quantiles):
+            raise serializers.ValidationError("Percentiles must be between 0 and 100")
+
+        return quantiles
+
+
+class TopGroupsSerializer(serializers.Serializer):
+    n = serializers.IntegerField(default=10, min_value=1, max_value=100)
+    by = serializers.ChoiceField(choices=['debit', 'credit', 'txns'], default='debit')
+
+
+class CategoryRollupSerializer(serializers.Serializer):
+    categories = serializers.BooleanField(default=False)
+    category = serializers.IntegerField(required=False)
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'parent']
+
+    def validate_parent(self, value):
+        if value is not None and value.user_id != self.context['request'].user.id:
+            raise serializers.ValidationError("Unknown category")
+
+        return value
+
+    def validate(self, attrs):
+        user = self.context['request'].user
+        name = attrs.get('name', getattr(self.instance, 'name', None))
+        parent = attrs['parent'] if 'parent' in attrs else getattr(self.instance, 'parent', None)
+        siblings = Category.objects.filter(user=user, parent=parent, name=name)
+        if self.instance is not None:
+            siblings = siblings.exclude(pk=self.instance.pk)
+        if siblings.exists():
+            raise serializers.ValidationError("A category with this name already exists here")
+
+        return attrs
+
+
+class CategoryGroupsSerializer(serializers.Serializer):
+    grp_names = serializers.ListField(child=serializers.CharField(max_length=1024, allow_blank=True),
+                                      allow_empty=False)
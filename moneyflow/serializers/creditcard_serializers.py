@@ -36,6 +36,8 @@ class TransactionFileUploadSerializer(serializers.Serializer):
     parser = serializers.CharField(max_length=20)
     grouper = serializers.CharField(max_length=40, allow_blank=True, default='')
     file = serializers.FileField()
+    preview = serializers.BooleanField(default=False)
+    preview_rows = serializers.IntegerField(min_value=1, max_value=500, default=20)
 
     def validate_parser(self, value):
         if (value not in SUPPORTED_PARSERS.keys()) or value == "NULL":
@@ -62,3 +64,10 @@ class TransactionFileUploadSerializer(serializers.Serializer):
             raise serializers.ValidationError("Invalid File")
 
         return value
+
+
+class TransactionFileReprocessSerializer(TransactionFileUploadSerializer):
+    file = None
+    preview = None
+    preview_rows = None
+    file_id = serializers.IntegerField()
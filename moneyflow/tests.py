@@ -1,3 +1,442 @@
-from django.test import TestCase
+import json
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import PROTECT, Sum
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from .anomalies import refresh_anomalies
+from .deletion import FileDeletion
+from .file_actions import StageTimer
+from .locking import ingestion_lock
+from .models import Account, Anomaly, CreditTransaction, DataVersion, FileAudit, IngestionLock, RecurringSeries, \
+    Transaction, TransferLink
+from .upload_store import blob_path
+
+
+@contextmanager
+def user_settings(section: str, **values: str):
+    """
+    Overrides options of the user's config.ini for the duration of the block.
+    """
+    saved = {option: settings.USER_SETTINGS.get(section, option) for option in values}
+    settings.USER_SETTINGS[section].update(values)
+    try:
+        yield
+    finally:
+        settings.USER_SETTINGS[section].update(saved)
+
+
+class MoneyFlowTestCase(APITestCase):
+    """
+    An authenticated user owning an account with a statement of a few transactions.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='tester', password='tester')
+        cls.account = Account.objects.create(name="Savings", acc_no=1234567890, ifsc_code='HDFC0000001',
+                                             acc_type='SAVINGS', currency='INR', user=cls.user)
+        cls.audit_file = FileAudit.objects.create(file_name='statement.txt', op_desc='ACC_TXN_UPLOAD',
+                                                  status='LOADED', user=cls.user, to_id=cls.account.id,
+                                                  op_args={'parser': 'HDFC'})
+        start = datetime(2024, 1, 1, tzinfo=ZoneInfo('UTC'))
+        Transaction.objects.bulk_create([
+            Transaction(account=cls.account, txn_date=start + timedelta(days=day), opr_dt=start + timedelta(days=day),
+                        txn_desc=desc, grp_name=grp_name, dbt_amount=Decimal(100), cr_amount=Decimal(0),
+                        ref_num=str(day), cf_amt=Decimal(1000 - 100 * day), src_file=cls.audit_file)
+            for day, (desc, grp_name) in enumerate([("UPI-GROCER", 'Groceries'), ("UPI-GROCER", 'Groceries'),
+                                                    ("NEFT-RENT", 'Rent')])
+        ])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def groups(self) -> list[str]:
+        return list(Transaction.objects.filter(account=self.account).order_by('txn_date')
+                    .values_list('grp_name', flat=True))
+
+
+def statement(rows: list[tuple], name: str = 'statement.txt') -> SimpleUploadedFile:
+    """
+    An HDFC delimited statement of (date, description, debit, credit, reference, balance) rows.
+    """
+    lines = ['Date,Narration\n', '\n']
+    for date, desc, debit, credit, ref, balance in rows:
+        lines.append(f"{date:<13},{desc:<119},{date},{debit},{credit},{ref},{balance}\n")
+    return SimpleUploadedFile(name, ''.join(lines).encode(), content_type='text/plain')
+
+
+class UploadTestCase(MoneyFlowTestCase):
+    """
+    Uploads statements to the account, storing them in a temporary upload store.
+    """
+    rows = [(f"{day:02d}/02/24", f"UPI-SHOP{day % 3}", '10.00', '0.00', f"R{day}", f"{600 - day * 10}.00")
+            for day in range(1, 11)]
+
+    def setUp(self):
+        super().setUp()
+        self.store_dir = self.enterContext(TemporaryDirectory())
+        self.enterContext(user_settings('Uploads', store_dir=self.store_dir))
+
+    def upload(self, rows: list[tuple] = None, **options):
+        return self.client.post(reverse('account-upload-transaction-file', kwargs={'pk': self.account.id}),
+                                {'file': statement(rows or self.rows), 'parser': 'HDFC_D', 'dt_format': '%d/%m/%y',
+                                 **options}, format='multipart')
+
+
+class UploadTests(UploadTestCase):
+    def test_upload_loads_and_reconciles_the_file(self):
+        response = self.upload()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data['txns'], 10)
+        self.assertEqual(response.data['reconciliation']['counts'], {'duplicates': 0, 'breaks': 0, 'gaps': 1})
+        audit_file = FileAudit.objects.get(pk=response.data['id'])
+        self.assertEqual((audit_file.status, audit_file.txn_count), ('LOADED', 10))
+        self.assertEqual(audit_file.op_stats['reconciliation'], response.data['reconciliation']['counts'])
+        self.assertIn('reconcile', audit_file.op_stats['timings_ms'])
+        self.assertFalse(IngestionLock.objects.exists())
+
+    def test_the_same_file_is_loaded_once(self):
+        file_id = self.upload().data['id']
+
+        response = self.upload()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], file_id)
+        self.assertEqual(FileAudit.objects.filter(sha256=FileAudit.objects.get(pk=file_id).sha256).count(), 1)
+        self.assertEqual(Transaction.objects.filter(src_file_id=file_id).count(), 10)
+
+
+class ReprocessTests(UploadTestCase):
+    def setUp(self):
+        super().setUp()
+        self.file_id = self.upload().data['id']
+
+    def reprocess(self, **options):
+        return self.client.post(reverse('account-acc-reprocess', kwargs={'pk': self.account.id}),
+                                {'file_id': self.file_id, 'parser': 'HDFC_D', 'dt_format': '%d/%m/%y', **options},
+                                format='json')
+
+    def txn_ids(self) -> set[int]:
+        return set(Transaction.objects.filter(src_file_id=self.file_id).values_list('id', flat=True))
+
+    def test_replaces_the_transactions_of_the_file(self):
+        old_ids = self.txn_ids()
+
+        response = self.reprocess()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual((response.data['replaced_txns'], response.data['txns']), (10, 10))
+        self.assertEqual(len(self.txn_ids()), 10)
+        self.assertFalse(self.txn_ids() & old_ids)
+        audit_file = FileAudit.objects.get(pk=self.file_id)
+        self.assertEqual(audit_file.op_add_txt['reprocessed_from']['dt_format'], '%d/%m/%y')
+        self.assertEqual(audit_file.op_stats['reconciliation'], response.data['reconciliation']['counts'])
+        self.assertFalse(IngestionLock.objects.exists())
+
+    def test_rows_failing_to_load_keep_the_transactions(self):
+        old_ids = self.txn_ids()
+
+        response = self.reprocess(dt_format='%Y-%m-%d')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.txn_ids(), old_ids)
+        self.assertEqual(FileAudit.objects.get(pk=self.file_id).status, 'LOADED')
+        self.assertFalse(IngestionLock.objects.exists())
+
+
+class UploadStoreTests(UploadTestCase):
+    def setUp(self):
+        super().setUp()
+        self.audit_file = FileAudit.objects.get(pk=self.upload().data['id'])
+        self.blob = blob_path(self.audit_file.sha256)
+
+    def destroy(self, audit_file: FileAudit):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('files-detail', kwargs={'pk': audit_file.id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_deleting_the_transactions_releases_the_blob(self):
+        self.assertTrue(self.blob.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('account-acct-delete-by-files', kwargs={'pk': self.account.id}),
+                                        {'file_ids': [self.audit_file.id]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(self.blob.exists())
+
+    def test_blob_is_kept_until_its_last_file_is_destroyed(self):
+        # An earlier failed upload of the same file, which can still be reprocessed
+        failed = FileAudit.objects.create(file_name='statement.txt', op_desc='ACC_TXN_UPLOAD', status='ERROR',
+                                          user=self.user, to_id=self.account.id, sha256=self.audit_file.sha256)
+
+        self.destroy(self.audit_file)
+        self.assertTrue(self.blob.exists())
+
+        self.destroy(failed)
+        self.assertFalse(self.blob.exists())
+
+
+class DuplicateChargeTests(UploadTestCase):
+    def test_repeated_charges_are_flagged(self):
+        rows = [*self.rows, ("05/02/24", "UPI-SHOP2", '10.00', '0.00', "R5-2", "540.00")]
+
+        response = self.upload(rows)
+
+        self.assertEqual(response.data['anomalies'], 1)
+        anomaly = Anomaly.objects.get()
+        self.assertEqual((anomaly.kind, anomaly.txn.ref_num), (Anomaly.DUPLICATE, "R5-2"))
+
+    def test_the_window_follows_the_setting(self):
+        self.assertEqual(refresh_anomalies(self.user), 0)
+
+        with user_settings('Anomalies', duplicate_hours='25'):
+            self.assertEqual(refresh_anomalies(self.user), 1)
+
+        anomaly = Anomaly.objects.get()
+        self.assertEqual((anomaly.kind, anomaly.txn.txn_date.day), (Anomaly.DUPLICATE, 2))
+
+
+class IngestionLockTests(MoneyFlowTestCase):
+    def lock(self):
+        return ingestion_lock(self.account, StageTimer())
+
+    def hold(self, acquired_dt: datetime) -> None:
+        IngestionLock.objects.create(key=f"ACC:{self.account.id}", token='other', acquired_dt=acquired_dt)
+
+    def test_released_after_a_rollback(self):
+        with self.assertRaises(ValueError):
+            with self.lock():
+                Transaction.objects.all().delete()
+                raise ValueError("Failed")
+
+        self.assertFalse(IngestionLock.objects.exists())
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_waits_for_the_lock_held_by_another_upload(self):
+        self.hold(timezone.now())
+
+        def release(_seconds: float) -> None:
+            IngestionLock.objects.filter(token='other').delete()
+
+        with mock.patch('moneyflow.locking.time.sleep', side_effect=release) as sleep:
+            with self.lock():
+                self.assertFalse(IngestionLock.objects.exists())
+
+        sleep.assert_called_once()
+        self.assertFalse(IngestionLock.objects.exists())
+
+    def test_expired_lock_is_taken_over(self):
+        expiry = settings.USER_SETTINGS.getint('Uploads', 'lock_expiry')
+        self.hold(timezone.now() - timedelta(seconds=expiry + 1))
+
+        with mock.patch('moneyflow.locking.time.sleep') as sleep:
+            with self.lock():
+                pass
+
+        sleep.assert_not_called()
+        self.assertFalse(IngestionLock.objects.exists())
+
+    def test_row_locks_leave_the_lock_table_alone(self):
+        # SQLite can't run FOR UPDATE, so only the clause is left out of the query
+        with mock.patch.object(connection.features, 'has_select_for_update', True), \
+                mock.patch.object(connection.ops, 'for_update_sql', return_value='') as for_update, \
+                CaptureQueriesContext(connection) as queries:
+            with self.lock():
+                pass
+
+        for_update.assert_called_once()
+        self.assertTrue(any(Account._meta.db_table in query['sql'] for query in queries))
+        self.assertFalse(any(IngestionLock._meta.db_table in query['sql'] for query in queries))
+
+
+class FileDeletionTests(MoneyFlowTestCase):
+    def url(self) -> str:
+        return reverse('account-acct-delete-by-files', kwargs={'pk': self.account.id})
+
+    def test_deletes_the_transactions_and_keeps_the_file(self):
+        response = self.client.post(self.url(), {'file_ids': [self.audit_file.id]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['details'], {'moneyflow.Transaction': 3})
+        self.audit_file.refresh_from_db()
+        self.assertEqual((self.audit_file.status, self.audit_file.txn_count), ('DELETED', 0))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_stream_closed_early_still_completes(self):
+        stream = FileDeletion([self.audit_file], self.user, chunk_size=1).stream()
+        next(stream)
+        stream.close()
+
+        self.audit_file.refresh_from_db()
+        self.assertEqual(self.audit_file.status, 'DELETED')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_files_without_transactions_are_deleted(self):
+        audit_file = FileAudit.objects.create(file_name='empty.txt', op_desc='ACC_TXN_UPLOAD', status='NO TXNS',
+                                              user=self.user, to_id=self.account.id)
+
+        response = self.client.delete(reverse('files-detail', kwargs={'pk': audit_file.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(FileAudit.objects.filter(pk=audit_file.pk).exists())
+
+    def test_protected_transactions_stop_the_deletion(self):
+        debit, credit = Transaction.objects.order_by('txn_date')[:2]
+        TransferLink.objects.create(user=self.user, kind=TransferLink.TRANSFER, debit_txn=debit, credit_txn=credit,
+                                    amount=debit.dbt_amount)
+
+        with mock.patch.object(TransferLink._meta.get_field('credit_txn').remote_field, 'on_delete', PROTECT):
+            response = self.client.post(self.url(), {'file_ids': [self.audit_file.id], 'progress': True},
+                                        format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.audit_file.refresh_from_db()
+        self.assertEqual(self.audit_file.status, 'LOADED')
+        self.assertEqual(Transaction.objects.count(), 3)
+
+
+class SetGroupByFilterTests(MoneyFlowTestCase):
+    def url(self, query: str) -> str:
+        return reverse('acc_transaction-set-group-by-filter', kwargs={'acc_pk': self.account.id}) + query
+
+    def test_search_updates_matching_transactions(self):
+        response = self.client.post(self.url('?search=GROCER'), {'grp_name': 'Food'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated_txns'], 2)
+        self.assertEqual(self.groups(), ['Food', 'Food', 'Rent'])
+
+    def test_filter_updates_matching_transactions(self):
+        response = self.client.post(self.url('?txn_date__gte=2024-01-03'), {'grp_name': 'Home'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.groups(), ['Groceries', 'Groceries', 'Home'])
+
+    def test_non_filter_params_are_rejected(self):
+        for query in ('', '?page=2', '?ordering=txn_date', '?junk=1', '?search=', '?exclude_transfers=false'):
+            with self.subTest(query=query):
+                response = self.client.post(self.url(query), {'grp_name': 'Food'}, format='json')
+
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(self.groups(), ['Groceries', 'Groceries', 'Rent'])
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.post(self.url('?txn_date__gte=someday'), {'grp_name': 'Food'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('txn_date__gte', response.data)
+        self.assertEqual(self.groups(), ['Groceries', 'Groceries', 'Rent'])
+
+
+class AccountEditTests(MoneyFlowTestCase):
+    def test_balance_thresholds_invalidate_balance_history(self):
+        url = reverse('account-balance-history', kwargs={'pk': self.account.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Last-Modified', response.headers)
+        self.assertFalse(any(point['below_min'] for point in response.data['points']))
+        etag = response.headers['ETag']
+
+        response = self.client.patch(reverse('account-detail', kwargs={'pk': self.account.id}), {'min_bal': '850'},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response.headers['ETag']
+        self.assertEqual([point['below_min'] for point in response.data['points']], [False, False, True])
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class ResponseCacheTests(MoneyFlowTestCase):
+    def test_links_follow_the_scheme_of_the_request(self):
+        url = reverse('acc_transaction-list', kwargs={'acc_pk': self.account.id}) + '?page_size=1'
+
+        self.assertTrue(self.client.get(url).data['next'].startswith('http://'))
+        response = self.client.get(url, secure=True)
+
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertTrue(response.data['next'].startswith('https://'))
+        self.assertEqual(self.client.get(url, secure=True).headers['X-Cache'], 'HIT')
+
+
+class AsyncEndpointTests(MoneyFlowTestCase):
+    def setUp(self):
+        # The async views authenticate the request themselves, from its session or token
+        self.client.force_login(self.user)
+
+    def summary(self, file_ids: list[int]):
+        return self.client.generic('GET', reverse('async_acct_summary'), json.dumps({'file_ids': file_ids}),
+                                   content_type='application/json')
+
+    def test_file_ids_in_the_body_filter_the_summary(self):
+        response = self.summary([self.audit_file.id])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['txns'], 3)
+
+        response = self.summary([self.audit_file.id + 1])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['txns'], 0)
+
+
+class MetricsEndpointTests(MoneyFlowTestCase):
+    def test_off_by_default(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_allowed_ips(self):
+        with user_settings('Metrics', endpoint='true', allowed_ips='10.0.0.1'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'moneyflow_files{op_desc="ACC_TXN_UPLOAD",status="LOADED"} 1.0', response.content)
+
+
+class SeedTransactionsTests(APITestCase):
+    def seed(self) -> None:
+        call_command('seed_transactions', rows=400, card_rows=100, years=1, seed=7, prefix='seedtest',
+                     stdout=StringIO())
+
+    def test_seeded_files_carry_totals(self):
+        self.seed()
+
+        files = FileAudit.objects.filter(user__username='seedtest_1')
+        self.assertTrue(files.exists())
+        for audit_file in files:
+            with self.subTest(file=audit_file.file_name):
+                model = Transaction if audit_file.op_desc == 'ACC_TXN_UPLOAD' else CreditTransaction
+                txns = model.objects.filter(src_file=audit_file)
+                self.assertEqual(audit_file.txn_count, txns.count())
+                if model is Transaction:
+                    totals = txns.aggregate(debit=Sum('dbt_amount', default=0), credit=Sum('cr_amount', default=0))
+                else:
+                    totals = {'debit': txns.filter(is_credit=False).aggregate(total=Sum('amt', default=0))['total'],
+                              'credit': txns.filter(is_credit=True).aggregate(total=Sum('amt', default=0))['total']}
+                self.assertEqual(audit_file.total_debit, totals['debit'])
+                self.assertEqual(audit_file.total_credit, totals['credit'])
+
+    def test_seeding_runs_the_post_ingest_hooks(self):
+        self.seed()
+
+        user = get_user_model().objects.get(username='seedtest_1')
+        self.assertTrue(DataVersion.objects.filter(user=user).exists())
+        self.assertTrue(RecurringSeries.objects.filter(user=user, is_recurring=True).exists())
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db.models import IntegerField, Max, Min, Q, QuerySet, Value
+
+from .models import CreditTransaction, FileAudit, Transaction, TransferLink
+from .reconciliation import EpochSeconds, fetch_array, paise
+
+BANK, CARD = 0, 1
+
+
+def window_days() -> int:
+    return settings.USER_SETTINGS.getint('Transfers', 'window_days')
+
+
+def load_legs(queryset: QuerySet, amount: str, source: int) -> np.ndarray:
+    """
+    Loads the candidate legs of a transfer as rows of (id, owner, epoch seconds, amount in hundredths,
+    source file, source), where the owner is the account or the card of the transaction.
+    """
+    owner = 'account_id' if source == BANK else 'credit_card_id'
+    queryset = queryset.annotate(ts=EpochSeconds('txn_date'), cents=paise(amount),
+                                 source=Value(source, output_field=IntegerField()))
+    return fetch_array(queryset.values_list('id', owner, 'ts', 'cents', 'src_file_id', 'source'), 6)
+
+
+def merge_legs(debits: np.ndarray, credits: np.ndarray, window: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Pairs debits with credits of the same amount that are at most `window` seconds apart, with a sorted merge.
+
+    Both sides are sorted by (amount, time) and only the amounts present on both sides are kept, so every
+    debit is only compared with the few credits of its own amount: O(n log n) overall instead of a nested loop
+    over both tables. Within an amount, debits are taken in time order and each one gets the earliest unused
+    credit in its window that is not on the same account.
+
+    :return: The matched (debit, credit) rows.
+    """
+    debits = debits[np.lexsort((debits[:, 2], debits[:, 3]))]
+    credits = credits[np.lexsort((credits[:, 2], credits[:, 3]))]
+    shared = np.intersect1d(debits[:, 3], credits[:, 3])
+    debit_rows = np.flatnonzero(np.isin(debits[:, 3], shared))
+    credit_rows = np.flatnonzero(np.isin(credits[:, 3], shared))
+
+    pairs = []
+    d_bounds = np.searchsorted(debits[debit_rows, 3], shared, side='right')
+    c_bounds = np.searchsorted(credits[credit_rows, 3], shared, side='right')
+    d_start = c_start = 0
+    for d_end, c_end in zip(d_bounds, c_bounds):
+        group = [int(row) for row in credit_rows[c_start:c_end]]
+        used = set()
+        lo = 0
+        for d_row in debit_rows[d_start:d_end]:
+            _, owner, ts, *_ = debits[d_row]
+            # Debits come in time order, so credits too early for this one are too early for the next ones
+            while lo < len(group) and credits[group[lo], 2] < ts - window:
+                lo += 1
+            for c_row in group[lo:]:
+                if c_row in used:
+                    continue
+                if credits[c_row, 2] > ts + window:
+                    break
+                if credits[c_row, 5] == BANK and credits[c_row, 1] == owner:
+                    continue
+                used.add(c_row)
+                pairs.append((int(d_row), c_row))
+                break
+        d_start, c_start = d_end, c_end
+    return [(debits[d_row], credits[c_row]) for d_row, c_row in pairs]
+
+
+def match_transfers(user, start: datetime = None, end: datetime = None, src_file: FileAudit = None) -> int:
+    """
+    Links the user's unlinked bank debits with the matching credits on their other accounts and cards.
+
+    :param user: The user whose transactions are matched.
+    :param start: Only match transactions from this date, less the matching window.
+    :param end: Only match transactions up to this date, plus the matching window.
+    :param src_file: Only create links with a leg loaded from this file. Used after an upload so that only
+        the new rows are matched, within the span of the file.
+    :return: The number of links created.
+    """
+    window = timedelta(days=window_days())
+    if src_file:
+        span = (src_file.transactions if src_file.op_desc == 'ACC_TXN_UPLOAD' else src_file.credit_transactions
+                ).aggregate(start=Min('txn_date'), end=Max('txn_date'))
+        if span['start'] is None:
+            return 0
+        start, end = span['start'], span['end']
+
+    dates = Q()
+    if start:
+        dates &= Q(txn_date__gte=start - window)
+    if end:
+        dates &= Q(txn_date__lte=end + window)
+
+    bank = Transaction.objects.filter(dates, account__user=user)
+    debits = load_legs(bank.filter(dbt_amount__gt=0, transfer_out__isnull=True), 'dbt_amount', BANK)
+    credits = np.concatenate([
+        load_legs(bank.filter(cr_amount__gt=0, transfer_in__isnull=True), 'cr_amount', BANK),
+        load_legs(CreditTransaction.objects.filter(dates, credit_card__user=user, is_credit=True,
+                                                   card_payment__isnull=True), 'amt', CARD),
+    ])
+
+    links = []
+    for debit, credit in merge_legs(debits, credits, int(window.total_seconds())):
+        if src_file and src_file.id not in (debit[4], credit[4]):
+            continue
+        links.append(TransferLink(
+            user=user,
+            kind=TransferLink.TRANSFER if credit[5] == BANK else TransferLink.CARD_PAYMENT,
+            debit_txn_id=int(debit[0]),
+            credit_txn_id=int(credit[0]) if credit[5] == BANK else None,
+            card_txn_id=int(credit[0]) if credit[5] == CARD else None,
+            amount=Decimal(int(debit[3])).scaleb(-2),
+        ))
+    return len(TransferLink.objects.bulk_create(links, ignore_conflicts=True))
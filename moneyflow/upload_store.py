@@ -0,0 +1,79 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BufferedReader
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import FileAudit
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file) -> str:
+    """
+    The SHA-256 of a file's content, read in chunks. The file is rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def blob_path(sha256: str) -> Path:
+    return Path(settings.USER_SETTINGS.get('Uploads', 'store_dir'), sha256[:2], sha256)
+
+
+def store_blob(sha256: str, file) -> bool:
+    """
+    Stores the content of a file as the blob of the hash, unless a blob is stored under it already. The blob
+    is written to a temporary file renamed into place, so concurrent uploads of the same file never see a
+    partly written blob. The file is rewound afterwards.
+
+    Blobs are named by the hash of the file as uploaded, which is what uploads are matched on, so the blob of
+    a password protected file holds its decrypted content under the hash of the encrypted one.
+
+    :param sha256: The hash of the uploaded file, see `file_sha256`.
+    :param file: The content to store, which is the decrypted upload for password protected files.
+    :return: Whether the blob was written.
+    """
+    path = blob_path(sha256)
+    if path.exists():
+        return False
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as blob:
+        shutil.copyfileobj(file, blob, CHUNK_SIZE)
+    os.replace(blob.name, path)
+    file.seek(0)
+    return True
+
+
+def open_blob(sha256: str) -> BufferedReader:
+    """
+    Opens a stored blob for reading.
+
+    :raises FileNotFoundError: When no blob is stored under the hash.
+    """
+    return open(blob_path(sha256), 'rb')
+
+
+def release_blob(sha256: str) -> bool:
+    """
+    Deletes a stored blob once no file can be reprocessed from it anymore, i.e. every file uploaded with the
+    hash is deleted, or being deleted. Decrypted copies of password protected files don't outlive their files.
+
+    :return: Whether the blob was deleted.
+    """
+    if FileAudit.objects.filter(sha256=sha256).exclude(status__in=['DELETING', 'DELETED']).exists():
+        return False
+    try:
+        blob_path(sha256).unlink()
+    except FileNotFoundError:
+        return False
+    return True
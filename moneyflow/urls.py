@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework_nested.routers import DefaultRouter, NestedDefaultRouter
 
-from .views import common, account, creditcard
+from .views import common, account, creditcard, asynchronous, feed
 
 # Account Router
 acc_router = DefaultRouter()
@@ -20,9 +20,28 @@ cc_transaction_router.register('transactions', creditcard.TransactionViewSet, 'c
 # Audit File Router
 af_router = DefaultRouter()
 af_router.register('files', common.FileAuditViewSet, basename='files')
+af_router.register('transfers', common.TransferLinkViewSet, basename='transfers')
+af_router.register('recurring', common.RecurringSeriesViewSet, basename='recurring')
+af_router.register('anomalies', common.AnomalyViewSet, basename='anomalies')
+af_router.register('categories', common.CategoryViewSet, basename='categories')
+
+# Async variants of the high traffic read endpoints, for ASGI deployments
+async_urlpatterns = [
+    path('parsers/', asynchronous.parsers, name='async_parsers'),
+    path('files/', asynchronous.files, name='async_files'),
+    path('accounts/all-txns/', asynchronous.account_all_transactions, name='async_acct_all'),
+    path('accounts/summary/', asynchronous.account_summary, name='async_acct_summary'),
+    path('accounts/<int:acc_pk>/transactions/', asynchronous.account_transactions, name='async_acc_transactions'),
+    path('creditcards/all-txns/', asynchronous.card_all_transactions, name='async_cct_all'),
+    path('creditcards/summary/', asynchronous.card_summary, name='async_cct_summary'),
+    path('creditcards/<int:cc_pk>/transactions/', asynchronous.card_transactions, name='async_cc_transactions'),
+]
 
 urlpatterns = [
     path('parsers/', common.get_parsers, name='get_parsers'),
+    path('metrics/', common.metrics, name='metrics'),
+    path('feed/', feed.FeedViewSet.as_view({'get': 'list'}), name='feed'),
+    path('async/', include(async_urlpatterns)),
     path('', include(acc_router.urls)),
     path('', include(cc_router.urls)),
     path('', include(acc_transaction.urls)),
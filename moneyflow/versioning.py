@@ -0,0 +1,70 @@
+import hashlib
+import json
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.request import Request
+
+from .models import DataVersion
+
+
+def bump_data_version(user) -> None:
+    """
+    Marks the user's transaction data as changed. Must be called by every write path that adds,
+    edits or removes transactions so conditional GETs and cached responses are invalidated.
+    """
+    now = timezone.now()
+    if DataVersion.objects.filter(user=user).update(version=F('version') + 1, updt_dt=now):
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(user=user, version=1, updt_dt=now)
+    except IntegrityError:
+        # Created concurrently by another request
+        DataVersion.objects.filter(user=user).update(version=F('version') + 1, updt_dt=now)
+
+
+def get_data_version(request: Request) -> DataVersion:
+    """
+    Returns the data version of the requesting user, loaded at most once per request. Users that never
+    wrote anything get an unsaved version 0.
+    """
+    if not hasattr(request, '_data_version'):
+        request._data_version = (DataVersion.objects.filter(user=request.user).first()
+                                 or DataVersion(user=request.user, version=0, updt_dt=None))
+    return request._data_version
+
+
+async def aget_data_version(request: Request) -> DataVersion:
+    """
+    Async variant of `get_data_version` loading the version with the async ORM, for the async read views.
+    """
+    if not hasattr(request, '_data_version'):
+        request._data_version = (await DataVersion.objects.filter(user=request.user).afirst()
+                                 or DataVersion(user=request.user, version=0, updt_dt=None))
+    return request._data_version
+
+
+def request_fingerprint(request: Request) -> list:
+    """
+    Everything besides the user's data version that changes the content of a read response.
+    """
+    return [request.path, sorted(request.query_params.lists()), request.data.get('file_ids'),
+            request.accepted_renderer.format]
+
+
+def data_etag(request: Request, *args, **kwargs) -> str | None:
+    if not request.user.is_authenticated:
+        return None
+    key = json.dumps([request.user.pk, get_data_version(request).version, *request_fingerprint(request)],
+                     default=str)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+# Adds an ETag header to read responses of transaction data and answers matching conditional requests with
+# 304 Not Modified without running the view. Last-Modified is left out, its one-second resolution would answer
+# 304 for a change made within the second of the previous read.
+conditional_on_data_version = method_decorator(condition(etag_func=data_etag))
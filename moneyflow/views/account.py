@@ -1,8 +1,10 @@
-import json
+from csv import DictReader
 from datetime import datetime
+from typing import Iterator
 
 from django.db import transaction
-from django.db.models import QuerySet
+from django.db.models import Count, ProtectedError, QuerySet, Sum
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
@@ -13,18 +15,36 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
-from ..file_actions import get_reader, get_group
+from core.metrics import UPLOADS, UPLOAD_ROWS, UPLOAD_SECONDS
+from tags.rules import RuleMatcher
+from tags.views import BulkTagMixin
+from ..anomalies import refresh_anomalies, update_anomalies
+from ..balances import balance_history, downsample
+from ..caching import cache_response
+from ..columnar import summarize
+from ..deletion import FileDeletion
+from ..file_actions import StageTimer, count_renders, get_reader, get_group
 from ..filters import AccTransactionFilter, AccSearchFilter
+from ..locking import ingestion_lock
 from ..models import FileAudit
 from ..pagination import DefaultPagination
+from ..preview import preview_rows
+from ..reconciliation import reconcile_account, reconcile_file
 from ..serializers.account_serializers import *
+from ..recurring import refresh_series, update_series
+from ..transfers import match_transfers
+from ..upload_store import file_sha256, open_blob
+from ..versioning import bump_data_version, conditional_on_data_version
+from .analytics import CategoryRollupMixin, ColumnarAnalyticsMixin
+from .bulk import BulkGroupUpdateMixin
 
 
-class AccountViewSet(ModelViewSet):
+class AccountViewSet(CategoryRollupMixin, ColumnarAnalyticsMixin, ModelViewSet):
     serializer_class = AccountSerializer
 
     filter_backends = [AccSearchFilter]
     filterset_class = AccTransactionFilter
+    columnar_source = 'ACC'
     ordering_fields = ['txn_date', 'txn_desc', 'grp_name', 'opr_dt', 'dbt_amount', 'cr_amount', 'cf_amt']
 
     def get_queryset(self) -> QuerySet:
@@ -44,6 +64,12 @@ class AccountViewSet(ModelViewSet):
             return Response({'error': 'Account is accosiated with transactions!'}, status=status.HTTP_400_BAD_REQUEST)
         return super().destroy(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        # Balance thresholds and names show up in the cached reads of the transaction data
+        with transaction.atomic():
+            serializer.save()
+            bump_data_version(self.request.user)
+
     @action(detail=True, methods=['post'], url_path='upload')
     def upload_transaction_file(self, request: Request, pk: int) -> Response:
         """
@@ -53,13 +79,14 @@ class AccountViewSet(ModelViewSet):
 
         :param request: The HTTP request containing the uploaded file and additional upload
             parameters such as date format, parser selection, and grouping strategy.
-            Should be of type Request.
+            Should be of type Request. With `preview`, only the first `preview_rows` rows are
+            parsed and returned normalized with the issues found in them, without saving anything.
         :param pk: The primary key of the account for which the transactions are being uploaded.
             Should be of type int.
         :return: A Response containing details of the uploaded file, the number of transactions
             created, or an error message in case of failure. Possible statuses include
-            HTTP_201_CREATED for success, HTTP_422_UNPROCESSABLE_ENTITY for unmet conditions,
-            and HTTP_500_INTERNAL_SERVER_ERROR for unexpected failures.
+            HTTP_201_CREATED for success, HTTP_200_OK for previews, HTTP_422_UNPROCESSABLE_ENTITY
+            for unmet conditions, and HTTP_500_INTERNAL_SERVER_ERROR for unexpected failures.
         """
         acc = self.get_object()
 
@@ -76,6 +103,32 @@ class AccountViewSet(ModelViewSet):
         if uploaded_file is None:
             return Response({'error': 'No file provided!'}, status=status.HTTP_400_BAD_REQUEST)
 
+        if serializer.validated_data['preview']:
+            timer = StageTimer()
+            latest_txn = Transaction.objects.filter(account=acc).order_by(
+                '-txn_date', '-id').first() if is_future_only else None
+            try:
+                reader = get_reader(uploaded_file, parser, pw, timer, lazy=True)
+            except Exception as e:
+                return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+            preview = preview_rows(reader, 'ACC', serializer.validated_data['preview_rows'], dt_format,
+                                   serializer.validated_data['grouper'], timer, latest_txn, is_strict_future)
+            return Response({'file': uploaded_file.name, 'parser': parser, 'dt_format': dt_format, **preview,
+                             'timings_ms': timer.summary()['timings_ms']}, status=status.HTTP_200_OK)
+
+        timer = StageTimer()
+        with timer.stage('store'):
+            sha256 = file_sha256(uploaded_file)
+        # The same file loaded before is only loaded again once its transactions are deleted
+        loaded = FileAudit.objects.filter(op_desc='ACC_TXN_UPLOAD', user=request.user, to_id=acc.id, sha256=sha256,
+                                          status='LOADED').first()
+        if loaded:
+            return Response({
+                'file': loaded.file_name,
+                'id': loaded.id,
+                'message': "File already uploaded, reprocess it to load it with other options"
+            }, status=status.HTTP_200_OK)
+
         txns = []
         op_json = {"dt_format": dt_format, "parser": parser}
 
@@ -84,96 +137,278 @@ class AccountViewSet(ModelViewSet):
         else:
             op_json["grouper"] = None
 
-        op_json = json.dumps(op_json)
-
         audit_log = FileAudit.objects.create(
             file_name=uploaded_file.name,
             to_id=acc.id,
             op_desc='ACC_TXN_UPLOAD',
             status='LOADING',
             op_args=op_json,
+            sha256=sha256,
             user=request.user
         )
 
+        rows_read = 0
+        reconciliation = None
+        transfers = 0
+        recurring = 0
+        anomalies = 0
+        tagged = 0
         try:
-            reader = get_reader(uploaded_file, parser, pw)
-            latest_txn = Transaction.objects.filter(account=acc).order_by(
-                '-txn_date', '-id').first() if is_future_only else None
-            found_match = False
-
-            with transaction.atomic():
-                for row in reader:
-                    this_txn = Transaction(
-                        account=acc,
-                        txn_date=timezone.make_aware(datetime.strptime(row['txn_date'], dt_format),
-                                                     ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz"))),
-                        txn_desc=row['txn_desc'],
-                        grp_name=get_group(serializer.validated_data['grouper'], row['txn_desc']),
-                        opr_dt=timezone.make_aware(datetime.strptime(row['opr_dt'], dt_format),
-                                                   ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz"))),
-                        dbt_amount=row['dbt_amount'],
-                        cr_amount=row['cr_amount'],
-                        ref_num=row['ref_num'],
-                        cf_amt=row['cf_amt'],
-                        src_file=audit_log
-                    )
-
-                    # If user requested validation run tests until first match
-                    if latest_txn and (not found_match):
-                        if is_strict_future:  # Only insert the transactions after finding the latest uploaded transaction
-                            found_match = (
-                                    this_txn.cf_amt == str(latest_txn.cf_amt) and
-                                    this_txn.txn_date == latest_txn.txn_date and
-                                    this_txn.txn_desc == latest_txn.txn_desc
-                            )
-                            continue
-                        elif is_future_only:  # Only insert transactions that are after the latest uploaded transaction
-                            if this_txn.txn_date < latest_txn.txn_date:
-                                continue
-                            found_match = True
-                    txns.append(this_txn)
+            reader = get_reader(uploaded_file, parser, pw, timer, sha256=sha256)
+
+            with ingestion_lock(acc, timer) as lock_wait_ms:
+                # Read under the lock, so concurrent uploads see each other's transactions
+                if FileAudit.objects.filter(op_desc='ACC_TXN_UPLOAD', user=request.user, to_id=acc.id, sha256=sha256,
+                                            status='LOADED').exists():
+                    raise ValueError("File already uploaded")
+                latest_txn = Transaction.objects.filter(account=acc).order_by(
+                    '-txn_date', '-id').first() if is_future_only else None
+
+                for this_txn, insert in self.read_transactions(reader, acc, audit_log, serializer.validated_data,
+                                                               timer, latest_txn):
+                    rows_read += 1
+                    if insert:
+                        txns.append(this_txn)
                 if len(txns) != 0:
-                    Transaction.objects.bulk_create(txns)
+                    with timer.stage('tag'):
+                        matcher = RuleMatcher.for_owner(request.user, account_id=acc.id)
+                        matches = matcher.match(txns)
+                    with timer.stage('insert'):
+                        Transaction.objects.bulk_create(txns)
+                    with timer.stage('tag'):
+                        tagged = matcher.tag(txns, matches)
+                    with timer.stage('match'):
+                        transfers = match_transfers(request.user, src_file=audit_log)
+                    with timer.stage('recurring'):
+                        recurring = update_series(audit_log)
+                    with timer.stage('anomalies'):
+                        anomalies = update_anomalies(audit_log)
+                    bump_data_version(request.user)
                     audit_log.status = 'LOADED'
+                    audit_log.record_totals(txns)
                     audit_log.save()
                 else:
-                    op_add_txt = {"system_message": "File did not meet conditions"}
                     audit_log.status = 'NO TXNS'
-                    audit_log.op_add_txt = json.dumps(op_add_txt)
+                    audit_log.op_add_txt = {"system_message": "File did not meet conditions"}
                     audit_log.save()
 
             if len(txns) != 0:
+                # Only reads the balance chain of the account, so other uploads needn't wait for it
+                with timer.stage('reconcile'):
+                    reconciliation = reconcile_file(audit_log)
                 return Response({
                     'file': audit_log.file_name,
                     'id': audit_log.id,
-                    'txns': len(txns)
+                    'txns': len(txns),
+                    'transfers': transfers,
+                    'recurring': recurring,
+                    'anomalies': anomalies,
+                    'tagged': tagged,
+                    'reconciliation': reconciliation,
+                    'lock_wait_ms': lock_wait_ms
                 }, status=status.HTTP_201_CREATED)
             else:
-                return Response({'message': "File did not meet conditions"},
+                return Response({'message': "File did not meet conditions", 'lock_wait_ms': lock_wait_ms},
                                 status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         except ValueError as e:
             audit_log.status = 'ERROR'
-            audit_log.op_add_txt = json.dumps({'error': f"{e.__class__.__name__}: {e}"})
+            audit_log.op_add_txt = {'error': f"{e.__class__.__name__}: {e}", 'error_class': e.__class__.__name__}
             audit_log.save()
             return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             audit_log.status = 'ERROR'
-            audit_log.op_add_txt = json.dumps({'error': f"{e.__class__.__name__}: {e}"})
+            audit_log.op_add_txt = {'error': f"{e.__class__.__name__}: {e}", 'error_class': e.__class__.__name__}
             audit_log.save()
             return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            audit_log.op_stats = timer.summary(parser=parser, bytes=uploaded_file.size, rows_read=rows_read,
+                                               rows_inserted=len(txns) if audit_log.status == 'LOADED' else 0)
+            if reconciliation:
+                audit_log.op_stats['reconciliation'] = reconciliation['counts']
+            audit_log.save(update_fields=['op_stats'])
+
+            UPLOADS.inc(parser=parser, status=audit_log.status)
+            UPLOAD_ROWS.inc(audit_log.op_stats['rows_inserted'], parser=parser)
+            UPLOAD_SECONDS.inc(audit_log.op_stats['timings_ms']['total'] / 1000, parser=parser)
+            count_renders(serializer.validated_data['grouper'], rows_read)
+
+    @staticmethod
+    def read_transactions(reader: DictReader, acc: Account, audit_log: FileAudit, options: dict, timer: StageTimer,
+                          latest_txn: Transaction = None) -> Iterator[tuple[Transaction, bool]]:
+        """
+        Builds the transactions of the rows of an uploaded file.
 
-    @action(detail=False, methods=['get'], url_path='all-txns', url_name='acct-all')
-    def all_transactions(self, request: Request) -> Response:
+        :param options: The validated upload options, giving the date format, the grouper, and with
+            `is_strict_future` to only insert the transactions after the one matching `latest_txn`.
+        :param latest_txn: The latest transaction of the account, when uploading with `is_future_only`.
+        :return: An iterator over the transaction of every row, and whether it is to be inserted.
         """
-        Retrieve and filter all transactions for the authenticated user. This view provides support
-        for search, filter, and ordering backends. Optionally, transactions can be filtered
-        by associated file IDs.
+        found_match = False
+        for row in reader:
+            with timer.stage('dates'):
+                txn_date = timezone.make_aware(datetime.strptime(row['txn_date'], options['dt_format']),
+                                               ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz")))
+                opr_dt = timezone.make_aware(datetime.strptime(row['opr_dt'], options['dt_format']),
+                                             ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz")))
+            with timer.stage('group'):
+                grp_name = get_group(options['grouper'], row['txn_desc'])
+
+            this_txn = Transaction(
+                account=acc,
+                txn_date=txn_date,
+                txn_desc=row['txn_desc'],
+                grp_name=grp_name,
+                opr_dt=opr_dt,
+                dbt_amount=row['dbt_amount'],
+                cr_amount=row['cr_amount'],
+                ref_num=row['ref_num'],
+                cf_amt=row['cf_amt'],
+                src_file=audit_log
+            )
+
+            # If user requested validation run tests until first match
+            if latest_txn and (not found_match):
+                # Only insert the transactions after finding the latest uploaded transaction
+                if options['is_strict_future']:
+                    found_match = (
+                            this_txn.cf_amt == str(latest_txn.cf_amt) and
+                            this_txn.txn_date == latest_txn.txn_date and
+                            this_txn.txn_desc == latest_txn.txn_desc
+                    )
+                    yield this_txn, False
+                    continue
+                # Only insert transactions that are after the latest uploaded transaction
+                elif options['is_future_only']:
+                    if this_txn.txn_date < latest_txn.txn_date:
+                        yield this_txn, False
+                        continue
+                    found_match = True
+            yield this_txn, True
+
+    @action(detail=True, methods=['post'], url_path='reprocess', url_name='acc-reprocess')
+    def reprocess_file(self, request: Request, pk: int) -> Response:
+        """
+        Loads an uploaded file again from the upload store with other upload options, so that changing
+        the parser, date format or grouper of a file needs no new upload. The transactions of the file
+        are replaced by the new ones in a single database transaction.
+
+        :param request: The HTTP request containing the `file_id` of the file and the upload options,
+            as for uploads but without the file and its password.
+        :param pk: The primary key of the account the file was uploaded to.
+        :return: A Response containing the number of transactions replaced and loaded, or an error
+            message in case of failure. Possible statuses include HTTP_200_OK for success,
+            HTTP_404_NOT_FOUND for unknown files or files not in the store, HTTP_422_UNPROCESSABLE_ENTITY
+            for unmet conditions, in which case the file keeps its transactions, and
+            HTTP_500_INTERNAL_SERVER_ERROR for unexpected failures.
+        """
+        acc = self.get_object()
 
-        :param request: The incoming HTTP request containing any filtering and search criteria
-            including optional `file_ids` in the request data for filtering transactions by files.
+        serializer = TransactionFileReprocessSerializer(data=request.data, context={'request': request, 'acc': acc})
+        serializer.is_valid(raise_exception=True)
 
-        :return: A paginated response with serialized transaction data or a full
-            response containing all matched transactions if no pagination is applied.
+        dt_format = serializer.validated_data['dt_format']
+        parser = serializer.validated_data['parser']
+        is_future_only = serializer.validated_data['is_future_only']
+
+        audit_log = (FileAudit.objects.filter(op_desc='ACC_TXN_UPLOAD', user=request.user, to_id=acc.id,
+                                              pk=serializer.validated_data['file_id'], sha256__isnull=False)
+                     .exclude(status__in=['LOADING', 'DELETING', 'DELETED']).first())
+        if audit_log is None:
+            return Response({'error': "File not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        txns = []
+        op_json = {"dt_format": dt_format, "parser": parser}
+
+        if serializer.validated_data["grouper"]:
+            op_json["grouper"] = serializer.validated_data["grouper"].name[2:-3]
+        else:
+            op_json["grouper"] = None
+
+        timer = StageTimer()
+        rows_read = 0
+        deletion = FileDeletion([audit_log], request.user)
+        try:
+            deletion.check()
+            with open_blob(audit_log.sha256) as blob:
+                reader = get_reader(blob, parser, timer=timer)
+
+            with ingestion_lock(acc, timer) as lock_wait_ms:
+                latest_txn = Transaction.objects.filter(account=acc).exclude(src_file=audit_log).order_by(
+                    '-txn_date', '-id').first() if is_future_only else None
+                model, bounds = deletion.plan(audit_log)
+                groups = set(audit_log.transactions.order_by().values_list('grp_name', flat=True).distinct())
+                for _ in deletion.delete_transactions(audit_log, model, bounds):
+                    pass
+
+                for this_txn, insert in self.read_transactions(reader, acc, audit_log, serializer.validated_data,
+                                                               timer, latest_txn):
+                    rows_read += 1
+                    if insert:
+                        txns.append(this_txn)
+                count_renders(serializer.validated_data['grouper'], rows_read)
+                if len(txns) == 0:
+                    # Keep the transactions of the file
+                    transaction.set_rollback(True)
+                else:
+                    with timer.stage('tag'):
+                        matcher = RuleMatcher.for_owner(request.user, account_id=acc.id)
+                        matches = matcher.match(txns)
+                    with timer.stage('insert'):
+                        Transaction.objects.bulk_create(txns)
+                    with timer.stage('tag'):
+                        tagged = matcher.tag(txns, matches)
+                    with timer.stage('match'):
+                        transfers = match_transfers(request.user, src_file=audit_log)
+                    # The series and anomalies the old transactions were part of are detected again without them
+                    with timer.stage('recurring'):
+                        recurring = refresh_series(request.user, account_id=acc.id)
+                    with timer.stage('anomalies'):
+                        anomalies = refresh_anomalies(request.user, 'ACC',
+                                                      sorted(groups | {txn.grp_name for txn in txns}))
+                    bump_data_version(request.user)
+
+                    audit_log.status = 'LOADED'
+                    audit_log.op_add_txt = {'reprocessed_from': audit_log.op_args}
+                    audit_log.op_args = op_json
+                    audit_log.record_totals(txns)
+                    audit_log.save()
+
+            if len(txns) == 0:
+                return Response({'message': "File did not meet conditions", 'lock_wait_ms': lock_wait_ms},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+            # Only reads the balance chain of the account, so other uploads needn't wait for it
+            with timer.stage('reconcile'):
+                reconciliation = reconcile_file(audit_log)
+            audit_log.op_stats = timer.summary(parser=parser, bytes=audit_log.op_stats.get('bytes'),
+                                               rows_read=rows_read, rows_inserted=len(txns),
+                                               rows_deleted=bounds['rows'], reconciliation=reconciliation['counts'])
+            audit_log.save(update_fields=['op_stats'])
+            return Response({
+                'file': audit_log.file_name,
+                'id': audit_log.id,
+                'replaced_txns': bounds['rows'],
+                'txns': len(txns),
+                'transfers': transfers,
+                'recurring': recurring,
+                'anomalies': anomalies,
+                'tagged': tagged,
+                'reconciliation': reconciliation,
+                'lock_wait_ms': lock_wait_ms
+            }, status=status.HTTP_200_OK)
+        except FileNotFoundError:
+            return Response({'error': "File not found in the upload store"}, status=status.HTTP_404_NOT_FOUND)
+        except ProtectedError as e:
+            return Response({'error': e.args[0]}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def filter_transactions(self, request: Request) -> QuerySet:
+        """
+        Builds the queryset of the authenticated user's transactions with the search, filter and
+        ordering backends applied, optionally restricted to the `file_ids` in the request data.
         """
         queryset = Transaction.objects.filter(src_file__user=request.user).order_by('-txn_date', '-id')
 
@@ -188,6 +423,25 @@ class AccountViewSet(ModelViewSet):
         if request.data.get("file_ids", None):
             queryset = queryset.filter(src_file_id__in=request.data["file_ids"])
 
+        return queryset
+
+    @action(detail=False, methods=['get'], url_path='all-txns', url_name='acct-all')
+    @conditional_on_data_version
+    @cache_response
+    def all_transactions(self, request: Request) -> Response:
+        """
+        Retrieve and filter all transactions for the authenticated user. This view provides support
+        for search, filter, and ordering backends. Optionally, transactions can be filtered
+        by associated file IDs.
+
+        :param request: The incoming HTTP request containing any filtering and search criteria
+            including optional `file_ids` in the request data for filtering transactions by files.
+
+        :return: A paginated response with serialized transaction data or a full
+            response containing all matched transactions if no pagination is applied.
+        """
+        queryset = self.filter_transactions(request)
+
         queryset = queryset.select_related('src_file')
         queryset = self.filter_queryset(queryset)
         paginator = DefaultPagination()
@@ -200,6 +454,87 @@ class AccountViewSet(ModelViewSet):
         serializer = TransactionSerializer(queryset, many=True)
         return Response(serializer.data)
 
+    def summary_aggregates(self) -> dict:
+        return {
+            'txns': Count('id'),
+            'dbt_amount': Sum('dbt_amount', default=0),
+            'cr_amount': Sum('cr_amount', default=0),
+        }
+
+    @action(detail=False, methods=['get'], url_path='summary', url_name='acct-summary')
+    @conditional_on_data_version
+    @cache_response
+    def summary(self, request: Request) -> Response:
+        """
+        Summarize the authenticated user's transactions per group. The same search and filters
+        as `all-txns` apply, so any listed selection can be totalled.
+
+        :param request: The incoming HTTP request containing any filtering and search criteria.
+        :return: A response with the overall transaction count and debit/credit totals, and the
+            same figures for each group ordered by the amount debited. With `categories` or a `category`,
+            also the same figures for each child category.
+        """
+        selection = self.columnar_selection(request, cached_only=True)
+        if selection:
+            return Response(self.with_rollup(request, summarize(*selection)))
+
+        queryset = self.filter_transactions(request).order_by()
+        aggregates = self.summary_aggregates()
+
+        totals = queryset.aggregate(**aggregates)
+        groups = queryset.values('grp_name').annotate(**aggregates).order_by('-dbt_amount', 'grp_name')
+
+        return Response(self.with_rollup(request, {**totals, 'groups': list(groups)}))
+
+    @action(detail=True, methods=['get'], url_path='balance-history')
+    @conditional_on_data_version
+    @cache_response
+    def balance_history(self, request: Request, pk: int) -> Response:
+        """
+        Returns the closing balance of the account per day, week or month over an optional date
+        range, computed in SQL from the running balance (`cf_amt`) of the latest transaction in
+        each period, with flags for periods where the balance dipped below the minimum or
+        desired balance.
+
+        :param request: The HTTP request with optional `from_date`, `to_date`, `interval`
+            (day, week or month) and `points` query parameters. When `points` is given, the
+            history is downsampled to at most that many points for charting.
+        :param pk: The primary key of the account.
+        :return: A response containing the account balance thresholds and the balance points.
+        """
+        acc = self.get_object()
+
+        serializer = BalanceHistorySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        points = balance_history(acc, serializer.validated_data.get('from_date'),
+                                 serializer.validated_data.get('to_date'), serializer.validated_data['interval'])
+        if serializer.validated_data.get('points'):
+            points = downsample(points, serializer.validated_data['points'])
+
+        return Response({
+            'account': acc.id,
+            'interval': serializer.validated_data['interval'],
+            'min_bal': acc.min_bal,
+            'dis_bal': acc.dis_bal,
+            'points': points,
+        })
+
+    @action(detail=True, methods=['get'], url_path='reconciliation')
+    @conditional_on_data_version
+    @cache_response
+    def reconciliation(self, request: Request, pk: int) -> Response:
+        """
+        Verifies the running balance (`cf_amt`) chain over the entire transaction history of the
+        account, reporting duplicate rows, breaks within a file and gaps between consecutive files.
+
+        :param request: The HTTP request.
+        :param pk: The primary key of the account.
+        :return: A response containing the issue counts and the first issues of each kind.
+        """
+        acc = self.get_object()
+        return Response({'account': acc.id, **reconcile_account(acc)})
+
     @action(detail=True, methods=['post'], url_path='regroup')
     def rerun_grouper(self, request: Request, pk: int) -> Response:
         """
@@ -231,11 +566,13 @@ class AccountViewSet(ModelViewSet):
             with transaction.atomic():
                 txns = queryset.iterator(chunk_size=100)
                 updated_txns = 0
+                renders = 0
                 while True:
                     batch = []
                     try:
                         for _ in range(100):
                             txn = next(txns)
+                            renders += 1
                             new_group = get_group(serializer.validated_data['grouper'], txn.txn_desc)
                             if new_group != txn.grp_name:
                                 txn.grp_name = new_group
@@ -246,32 +583,35 @@ class AccountViewSet(ModelViewSet):
                         break
                     if batch:
                         updated_txns += Transaction.objects.bulk_update(batch, ['grp_name'])
+                count_renders(serializer.validated_data['grouper'], renders)
                 if updated_txns > 0:
+                    refresh_anomalies(request.user, 'ACC')
+                    bump_data_version(request.user)
                     for audit_file in files:
-                        op_json: dict = json.loads(audit_file.op_add_txt if audit_file.op_add_txt else "{}")
                         if serializer.validated_data['grouper']:
-                            op_json['regroup'] = serializer.validated_data['grouper'].name[2:-3]
+                            audit_file.op_add_txt['regroup'] = serializer.validated_data['grouper'].name[2:-3]
                         else:
-                            op_json['regroup'] = None
-                        audit_file.op_add_txt = json.dumps(op_json)
+                            audit_file.op_add_txt['regroup'] = None
                         audit_file.save()
             return Response({'updated_txns': updated_txns})
         except Exception as e:
             return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=['post'], url_path='delete-txn-files', url_name='acct-delete-by-files')
-    def delete_file(self, request: Request, pk: int) -> Response:
+    def delete_file(self, request: Request, pk: int) -> Response | StreamingHttpResponse:
         """
-        Deletes transaction files associated with a specific account if matching file IDs are provided.
+        Deletes the transactions of transaction files associated with a specific account if matching
+        file IDs are provided.
 
         This method processes the deletion of transaction files that are audited as part of the
-        `ACC_TXN_UPLOAD` operation. It ensures transactional integrity during the deletion process
-        to prevent partial updates and validates whether the specified file IDs exist before
-        proceeding with deletion.
+        `ACC_TXN_UPLOAD` operation. The transactions are removed in chunks with raw deletes rather
+        than being loaded through Django's deletion collector, and the files are kept as the audit
+        trail with the status `DELETED`.
 
         :param request: The HTTP request object containing the necessary data for file deletion.
             It must include `file_ids` as part of the request payload to specify the files
-            that should be deleted.
+            that should be deleted. When `progress` is true, the progress is streamed back as
+            newline delimited JSON while the deletion runs.
         :param pk: The primary key of the account object whose transaction files will be checked
             and deleted.
         :return: An HTTP response object indicating the status of the operation:
@@ -279,8 +619,10 @@ class AccountViewSet(ModelViewSet):
               with an appropriate error message.
             - If no files matching the provided IDs are found, a 404 Not Found response
               is returned with an error message.
+            - If rows of other models protect transactions of the files, a 409 Conflict
+              response is returned before anything is deleted.
             - On successful deletion, a 200 OK response is returned with the number of
-              entries deleted and details of the deleted entries.
+              entries deleted per model and the IDs of the deleted files.
         """
         acc = self.get_object()
 
@@ -289,21 +631,26 @@ class AccountViewSet(ModelViewSet):
         else:
             return Response({'error': "File IDs not specified"}, status=status.HTTP_400_BAD_REQUEST)
 
-        queryset = FileAudit.objects.filter(op_desc='ACC_TXN_UPLOAD', to_id=acc.id, pk__in=file_ids)
+        audit_files = list(FileAudit.objects.filter(op_desc='ACC_TXN_UPLOAD', to_id=acc.id, pk__in=file_ids)
+                           .exclude(status='DELETED'))
 
-        if queryset.count() == 0:
+        if len(audit_files) == 0:
             return Response({'error': "No transaction file found"}, status=status.HTTP_404_NOT_FOUND)
 
-        with transaction.atomic():
-            deleted_count, deleted_details = queryset.delete()
+        deletion = FileDeletion(audit_files, request.user)
+        try:
+            deletion.check()
+        except ProtectedError as e:
+            return Response({'error': e.args[0]}, status=status.HTTP_409_CONFLICT)
 
-        return Response({
-            "message": f"Successfully deleted {deleted_count} entries(s).",
-            "details": deleted_details
-        }, status=status.HTTP_200_OK)
+        if request.data.get("progress"):
+            return StreamingHttpResponse(deletion.stream(), content_type='application/x-ndjson')
+
+        return Response(deletion.run(), status=status.HTTP_200_OK)
 
 
-class TransactionViewSet(RetrieveModelMixin, UpdateModelMixin, ListModelMixin, GenericViewSet):
+class TransactionViewSet(BulkGroupUpdateMixin, BulkTagMixin, RetrieveModelMixin, UpdateModelMixin, ListModelMixin,
+                         GenericViewSet):
     serializer_class = TransactionSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     pagination_class = DefaultPagination
@@ -317,3 +664,19 @@ class TransactionViewSet(RetrieveModelMixin, UpdateModelMixin, ListModelMixin, G
             account__id=self.kwargs['acc_pk'],
             src_file__user=self.request.user
         ).select_related('src_file', 'account').order_by('-txn_date', 'id')
+
+    @conditional_on_data_version
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_on_data_version
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            old_group = serializer.instance.grp_name
+            txn = serializer.save()
+            refresh_anomalies(self.request.user, 'ACC', sorted({old_group, txn.grp_name}))
+            bump_data_version(self.request.user)
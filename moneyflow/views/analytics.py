@@ -0,0 +1,95 @@
+import numpy as np
+from rest_framework.decorators import action
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from ..caching import cache_response
+from ..categories import rollup
+from ..columnar import MEASURES, SOURCE_MODELS, TABLES, ColumnarTable, columnar_cache_enabled, load_table, \
+    percentiles, top_groups
+from ..filters import NON_COLUMNAR_FILTERS
+from ..serializers.common_serializers import CategoryRollupSerializer, PercentilesSerializer, TopGroupsSerializer
+from ..versioning import conditional_on_data_version, get_data_version
+
+
+class ColumnarAnalyticsMixin:
+    """
+    Analytics of the account and card viewsets computed over the NumPy columns of `moneyflow.columnar` instead
+    of SQL aggregates. With `[Analytics] columnar_cache` on, the user's columns stay in memory between requests
+    until their data version changes, and the filters are evaluated on them directly.
+    """
+    columnar_source: str = None
+
+    def columnar_selection(self, request: Request,
+                           cached_only: bool = False) -> tuple[ColumnarTable, np.ndarray] | None:
+        """
+        The columns and the mask of the transactions selected by the filters of the request. Searches, tags and
+        categories can't be evaluated on the columns, so those selections, and all of them without the cache,
+        are loaded from the filtered queryset instead.
+
+        :param request: The HTTP request with the filters in its query parameters.
+        :param cached_only: Return None rather than loading the selection from the database.
+        """
+        non_columnar = (api_settings.SEARCH_PARAM, *NON_COLUMNAR_FILTERS)
+        if columnar_cache_enabled() and not any(request.query_params.get(param) for param in non_columnar):
+            filterset = self.filterset_class(request.query_params, request=request,
+                                             queryset=SOURCE_MODELS[self.columnar_source].objects.none())
+            if filterset.is_valid():
+                table = TABLES.get(request.user, self.columnar_source, get_data_version(request).version)
+                return table, table.mask(filterset.form.cleaned_data, request.data.get('file_ids'))
+        if cached_only:
+            return None
+
+        table = load_table(request.user, self.filter_transactions(request), self.columnar_source)
+        return table, np.ones(len(table), dtype=bool)
+
+    @action(detail=False, methods=['get'], url_path='percentiles')
+    @conditional_on_data_version
+    @cache_response
+    def percentiles(self, request: Request) -> Response:
+        """
+        Percentiles of the debit or credit amounts of the user's transactions, overall and optionally per group.
+        The same search and filters as `all-txns` apply.
+
+        :param request: The HTTP request with the filters, the comma separated percentiles `q`, the `measure`
+            (debit or credit) and `by_group`.
+        :return: A Response containing the count of amounts and their percentiles.
+        """
+        serializer = PercentilesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        return Response(percentiles(*self.columnar_selection(request), **serializer.validated_data))
+
+    @action(detail=False, methods=['get'], url_path='top-groups')
+    @conditional_on_data_version
+    @cache_response
+    def top_groups(self, request: Request) -> Response:
+        """
+        The groups with the largest debit or credit totals or transaction counts. The same search and filters
+        as `all-txns` apply.
+
+        :param request: The HTTP request with the filters, the number of groups `n` and what to rank them `by`.
+        :return: A Response containing the top groups with their totals.
+        """
+        serializer = TopGroupsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        return Response({'groups': top_groups(*self.columnar_selection(request), **serializer.validated_data)})
+
+
+class CategoryRollupMixin:
+    """
+    Category drill-down of the account and card summaries: with `categories`, or a `category` to drill into,
+    the per group totals of the summary are also rolled up to the child categories.
+    """
+    columnar_source: str = None
+
+    def with_rollup(self, request: Request, summary: dict) -> dict:
+        serializer = CategoryRollupSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        category_id = serializer.validated_data.get('category')
+        if not (serializer.validated_data['categories'] or category_id):
+            return summary
+        return {**summary, **rollup(request.user, summary['groups'], MEASURES[self.columnar_source], category_id)}
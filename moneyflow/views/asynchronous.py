@@ -0,0 +1,224 @@
+from functools import wraps
+from math import ceil
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.http import Http404, HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import Serializer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from core.authentication import CachedJWTAuthentication
+from core.metrics import RESPONSE_CACHE
+from ..caching import response_cache_key
+from ..columnar import MEASURES, summarize
+from ..pagination import DefaultPagination
+from ..parsers import SUPPORTED_PARSERS
+from ..serializers import account_serializers, creditcard_serializers
+from ..serializers.common_serializers import FileAuditSerializer
+from ..versioning import aget_data_version, data_etag
+from . import account, common, creditcard
+
+RENDERER = JSONRenderer()
+JWT_AUTH = CachedJWTAuthentication()
+
+
+async def authenticate(request: HttpRequest):
+    """
+    Authenticates the request like the API's JWT and session authentication, resolving the token's user from
+    the token user cache.
+
+    :return: The user, or None when the request carries no credentials.
+    :raises AuthenticationFailed: When the token is invalid, or its user is unknown or inactive.
+    """
+    header = JWT_AUTH.get_header(request)
+    if header is None:
+        user = await request.auser()
+        return user if user.is_authenticated else None
+
+    raw_token = JWT_AUTH.get_raw_token(header)
+    if raw_token is None:
+        return None
+    return await JWT_AUTH.aget_user(JWT_AUTH.get_validated_token(raw_token))
+
+
+def render(data, status: int = 200, headers: dict = None) -> HttpResponse:
+    return HttpResponse(RENDERER.render(data), content_type=RENDERER.media_type, status=status, headers=headers)
+
+
+def error_response(exc: exceptions.APIException) -> HttpResponse:
+    """
+    The response DRF's exception handler gives for the exception.
+    """
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    headers = {'WWW-Authenticate': JWT_AUTH.authenticate_header(None)} \
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)) else None
+    return render(data, exc.status_code, headers)
+
+
+def async_read(viewset: type, action: str, conditional: bool = True):
+    """
+    Turns a coroutine computing the data of a read endpoint into an async view. The request is authenticated
+    and wrapped for DRF with the viewset's parsers, so the viewset of the sync endpoint can build its querysets
+    and read `file_ids` from the body, and with `conditional` gets the same ETag, 304 and response caching as
+    the sync endpoint.
+
+    :param viewset: The viewset of the sync endpoint, passed to the coroutine with the request set.
+    :param action: The action of the viewset the endpoint mirrors.
+    :param conditional: Whether the data depends on the user's data version.
+    """
+
+    def decorator(handler):
+        @require_safe
+        @wraps(handler)
+        async def view(request: HttpRequest, **kwargs) -> HttpResponse:
+            try:
+                user = await authenticate(request)
+                if user is None:
+                    raise exceptions.NotAuthenticated()
+
+                drf_request = Request(request, parsers=[parser() for parser in viewset.parser_classes])
+                drf_request.user = user
+                drf_request.accepted_renderer = RENDERER
+                drf_request.accepted_media_type = RENDERER.media_type
+                instance = viewset(request=drf_request, args=(), kwargs=kwargs, action=action, format_kwarg=None)
+                if not conditional:
+                    return render(await handler(instance, drf_request, **kwargs))
+
+                await aget_data_version(drf_request)
+                etag = quote_etag(data_etag(drf_request))
+
+                response = get_conditional_response(request, etag=etag)
+                if response is None:
+                    key = response_cache_key(drf_request)
+                    data = await cache.aget(key)
+                    RESPONSE_CACHE.inc(view=request.resolver_match.view_name,
+                                       result='miss' if data is None else 'hit')
+                    if data is None:
+                        data = await handler(instance, drf_request, **kwargs)
+                        await cache.aset(key, data)
+                        response = render(data, headers={'X-Cache': 'MISS'})
+                    else:
+                        response = render(data, headers={'X-Cache': 'HIT'})
+
+                response.headers.setdefault('ETag', etag)
+                return response
+            except Http404:
+                return error_response(exceptions.NotFound())
+            except exceptions.APIException as exc:
+                return error_response(exc)
+
+        return view
+
+    return decorator
+
+
+async def paginate(request: Request, queryset: QuerySet, serializer_class: type[Serializer]) -> dict:
+    """
+    A page of the queryset as `DefaultPagination` returns it, counted and fetched with the async ORM.
+    """
+    paginator = DefaultPagination()
+    page_size = paginator.get_page_size(request)
+    count = await queryset.acount()
+    last = max(ceil(count / page_size), 1)
+
+    number = request.query_params.get(paginator.page_query_param, 1)
+    try:
+        number = last if number in paginator.last_page_strings else int(number)
+    except ValueError:
+        number = 0
+    if not 1 <= number <= last:
+        raise exceptions.NotFound(paginator.invalid_page_message)
+
+    rows = [row async for row in queryset[(number - 1) * page_size:number * page_size]]
+    url = request.build_absolute_uri()
+    previous = None
+    if number == 2:
+        previous = remove_query_param(url, paginator.page_query_param)
+    elif number > 2:
+        previous = replace_query_param(url, paginator.page_query_param, number - 1)
+    return {
+        'count': count,
+        'next': replace_query_param(url, paginator.page_query_param, number + 1) if number < last else None,
+        'previous': previous,
+        'results': serializer_class(rows, many=True).data,
+    }
+
+
+def transaction_list(viewset: type, serializer_class: type[Serializer]):
+    """
+    The async list of an account's or card's transactions, with the filters of the viewset.
+    """
+
+    @async_read(viewset, 'list')
+    async def view(instance, request: Request, **kwargs) -> dict:
+        queryset = await sync_to_async(instance.filter_queryset)(instance.get_queryset())
+        return await paginate(request, queryset, serializer_class)
+
+    return view
+
+
+def all_transactions(viewset: type, serializer_class: type[Serializer]):
+    """
+    The async `all-txns` of the user's account or card transactions.
+    """
+
+    def filtered(instance, request: Request) -> QuerySet:
+        return instance.filter_queryset(instance.filter_transactions(request).select_related('src_file'))
+
+    @async_read(viewset, 'all_transactions')
+    async def view(instance, request: Request) -> dict:
+        return await paginate(request, await sync_to_async(filtered)(instance, request), serializer_class)
+
+    return view
+
+
+def summary(viewset: type):
+    """
+    The async `summary` of the user's account or card transactions. Selections the columnar cache holds are
+    summarized from it, the others with two aggregate queries run through the async ORM.
+    """
+
+    def cached_summary(instance, request: Request) -> dict | None:
+        selection = instance.columnar_selection(request, cached_only=True)
+        return summarize(*selection) if selection else None
+
+    @async_read(viewset, 'summary')
+    async def view(instance, request: Request) -> dict:
+        data = await sync_to_async(cached_summary)(instance, request)
+        if data is None:
+            queryset = (await sync_to_async(instance.filter_transactions)(request)).order_by()
+            aggregates = instance.summary_aggregates()
+            totals = await queryset.aaggregate(**aggregates)
+            groups = queryset.values('grp_name').annotate(**aggregates).order_by(
+                f'-{MEASURES[instance.columnar_source][0]}', 'grp_name')
+            data = {**totals, 'groups': [group async for group in groups]}
+        return await sync_to_async(instance.with_rollup)(request, data)
+
+    return view
+
+
+@async_read(common.FileAuditViewSet, 'list', conditional=False)
+async def files(instance, request: Request) -> dict:
+    queryset = await sync_to_async(instance.filter_queryset)(instance.get_queryset())
+    return await paginate(request, queryset, FileAuditSerializer)
+
+
+@require_safe
+async def parsers(_request: HttpRequest) -> HttpResponse:
+    return render(SUPPORTED_PARSERS)
+
+
+account_transactions = transaction_list(account.TransactionViewSet, account_serializers.TransactionSerializer)
+account_all_transactions = all_transactions(account.AccountViewSet, account_serializers.TransactionSerializer)
+account_summary = summary(account.AccountViewSet)
+
+card_transactions = transaction_list(creditcard.TransactionViewSet, creditcard_serializers.TransactionSerializer)
+card_all_transactions = all_transactions(creditcard.CreditCardViewSet, creditcard_serializers.TransactionSerializer)
+card_summary = summary(creditcard.CreditCardViewSet)
@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from ..anomalies import refresh_anomalies
+from ..columnar import SOURCE_MODELS
+from ..filters import has_filters
+from ..serializers.common_serializers import GroupRenameSerializer, SetGroupByFilterSerializer, SetGroupSerializer
+from ..versioning import bump_data_version
+
+
+class BulkGroupUpdateMixin:
+    """
+    Bulk recategorisation actions for the nested transaction viewsets. Every action updates `grp_name` with a
+    single set-based `UPDATE` over the viewset's queryset instead of one request and lookup per transaction.
+    The anomalies of the groups the transactions leave and join are scored again.
+    """
+
+    def update_group(self, queryset: QuerySet, grp_name: str) -> Response:
+        with transaction.atomic():
+            groups = set(queryset.order_by().values_list('grp_name', flat=True).distinct())
+            updated_txns = queryset.update(grp_name=grp_name)
+            if updated_txns > 0:
+                refresh_anomalies(self.request.user, 'ACC' if queryset.model is SOURCE_MODELS['ACC'] else 'CC',
+                                  sorted(groups | {grp_name}))
+                bump_data_version(self.request.user)
+        return Response({'updated_txns': updated_txns})
+
+    @action(detail=False, methods=['post'], url_path='set-group')
+    def set_group(self, request: Request, **kwargs) -> Response:
+        """
+        Sets the group of the transactions with the given IDs.
+
+        :param request: The HTTP request containing `ids` and the new `grp_name`.
+        :return: A Response containing the count of updated transactions.
+        """
+        serializer = SetGroupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        return self.update_group(self.get_queryset().filter(id__in=serializer.validated_data['ids']),
+                                 serializer.validated_data['grp_name'])
+
+    @action(detail=False, methods=['post'], url_path='rename-group')
+    def rename_group(self, request: Request, **kwargs) -> Response:
+        """
+        Renames a group across all the transactions of the account or card.
+
+        :param request: The HTTP request containing the current `from_grp_name` and the new `grp_name`.
+        :return: A Response containing the count of updated transactions.
+        """
+        serializer = GroupRenameSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        return self.update_group(self.get_queryset().filter(grp_name=serializer.validated_data['from_grp_name']),
+                                 serializer.validated_data['grp_name'])
+
+    @action(detail=False, methods=['post'], url_path='set-group-by-filter')
+    def set_group_by_filter(self, request: Request, **kwargs) -> Response:
+        """
+        Sets the group of every transaction matching the filters and search given as query parameters,
+        the same ones accepted when listing the transactions.
+
+        :param request: The HTTP request with the filters in its query parameters and the new `grp_name`
+            in its data.
+        :return: A Response containing the count of updated transactions, or a 400 Bad Request when no
+            filter is given.
+        """
+        serializer = SetGroupByFilterSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if not has_filters(self, request):
+            return Response({'error': "No filters specified"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.update_group(self.filter_queryset(self.get_queryset()), serializer.validated_data['grp_name'])
@@ -1,20 +1,41 @@
-import json
+from datetime import datetime, time
+from functools import partial
+from zoneinfo import ZoneInfo
 
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Avg, Count, FloatField, IntegerField, ProtectedError, Sum
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast
+from django.http import Http404, HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.filters import SearchFilter
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin, DestroyModelMixin, UpdateModelMixin
 from rest_framework.permissions import AllowAny
 from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework.viewsets import GenericViewSet
+from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
-from ..filters import AuditFileFilter
-from ..models import FileAudit
+from core.metrics import REGISTRY, format_gauge
+from ..anomalies import refresh_anomalies
+from ..caching import cache_response
+from ..categories import assign_groups, insert_node, move_node
+from ..deletion import TXN_MODELS, FileDeletion
+from ..file_actions import INGEST_STAGES
+from ..filters import AnomalyFilter, AuditFileFilter
+from ..models import Anomaly, Category, CategoryGroup, FileAudit, RecurringSeries, TransferLink
 from ..pagination import DefaultPagination
 from ..parsers import SUPPORTED_PARSERS
-from ..serializers.common_serializers import FileAuditSerializer
+from ..reconciliation import reconcile_file
+from ..recurring import refresh_series
+from ..serializers.common_serializers import AnomalySerializer, CategoryGroupsSerializer, CategorySerializer, \
+    FileAuditSerializer, MatchTransfersSerializer, RecurringSeriesSerializer, TransferLinkSerializer
+from ..transfers import match_transfers
+from ..upload_store import release_blob
+from ..versioning import bump_data_version, conditional_on_data_version
 
 
 class FileAuditViewSet(ListModelMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, GenericViewSet):
@@ -36,6 +57,21 @@ class FileAuditViewSet(ListModelMixin, RetrieveModelMixin, UpdateModelMixin, Des
     def get_serializer_context(self):
         return {'request': self.request}
 
+    def destroy(self, request, *args, **kwargs) -> Response:
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except ProtectedError as e:
+            return Response({'error': e.args[0]}, status=status.HTTP_409_CONFLICT)
+
+    def perform_destroy(self, instance):
+        if instance.op_desc in TXN_MODELS:
+            FileDeletion([instance], self.request.user).run()
+        with transaction.atomic():
+            instance.delete()
+            bump_data_version(self.request.user)
+            if instance.sha256:
+                transaction.on_commit(partial(release_blob, instance.sha256))
+
     def partial_update(self, request, *args, **kwargs) -> Response:
         return Response({"detail": "Method \"PATCH\" not allowed."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
@@ -46,7 +82,7 @@ class FileAuditViewSet(ListModelMixin, RetrieveModelMixin, UpdateModelMixin, Des
     def add_message(self, request: Request, pk: int) -> Response:
         """
         Add a user message to the file audit object. The custom message is
-        stored in JSON format within the `op_add_txt` field.
+        stored as the `user_message` key of the `op_add_txt` JSON field.
 
         :param request: The HTTP request containing the data to update the
             `op_add_txt` field. Expected to include a `message` key in the request
@@ -57,13 +93,236 @@ class FileAuditViewSet(ListModelMixin, RetrieveModelMixin, UpdateModelMixin, Des
         """
         audit_file: FileAudit = self.get_queryset().get(pk=pk)
         message = request.data.get('message', '')
-        op_add_txt: dict = json.loads(audit_file.op_add_txt if audit_file.op_add_txt else "{}")
-        op_add_txt['user_message'] = message
-        audit_file.op_add_txt = json.dumps(op_add_txt)
+        audit_file.op_add_txt['user_message'] = message
         audit_file.save()
 
         return Response(request.data)
 
+    @action(detail=True, methods=['get'], url_path='reconciliation')
+    def reconciliation(self, request: Request, pk: int) -> Response:
+        """
+        Verifies the running balance chain of the transactions loaded from an account statement,
+        including the transactions right before and after it from other files, reporting
+        duplicates, breaks within the file and gaps to the neighbouring files.
+
+        :param request: The HTTP request object.
+        :param pk: The primary key of the `FileAudit` object to reconcile.
+        :return: A Response containing the issue counts and the first issues of each kind.
+        """
+        audit_file: FileAudit = self.get_object()
+        if audit_file.op_desc != 'ACC_TXN_UPLOAD':
+            return Response({'error': 'Only account statements carry a running balance!'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'file': audit_file.id, **reconcile_file(audit_file)})
+
+    @action(detail=False, methods=['get'], url_path='stats')
+    def ingest_stats(self, request: Request) -> Response:
+        """
+        Aggregates the ingestion statistics recorded on uploaded files per parser, giving the
+        number of uploads, rows and bytes processed, the throughput and the average time spent
+        in each ingestion stage. The usual file filters and search apply.
+
+        :param request: The HTTP request object, optionally carrying file filters.
+        :return: A Response containing one entry per parser.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).filter(op_stats__has_key='parser')
+
+        stage_avgs = {
+            f'avg_{stage}_ms': Avg(Cast(KT(f'op_stats__timings_ms__{stage}'), FloatField()))
+            for stage in INGEST_STAGES
+        }
+        stats = list(queryset.order_by()
+                     .values('parser')
+                     .annotate(uploads=Count('id'),
+                               rows=Sum(Cast(KT('op_stats__rows_inserted'), IntegerField())),
+                               bytes=Sum(Cast(KT('op_stats__bytes'), IntegerField())),
+                               total_ms=Sum(Cast(KT('op_stats__timings_ms__total'), FloatField())),
+                               **stage_avgs)
+                     .order_by('parser'))
+
+        for row in stats:
+            row['rows_per_sec'] = round(row['rows'] / row['total_ms'] * 1000, 1) if row['total_ms'] else None
+
+        return Response(stats)
+
+
+class TransferLinkViewSet(ListModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
+    serializer_class = TransferLinkSerializer
+    pagination_class = DefaultPagination
+
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['kind']
+
+    def get_queryset(self):
+        return TransferLink.objects.filter(user=self.request.user).order_by('-debit_txn__txn_date', '-id')
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            bump_data_version(self.request.user)
+
+    @action(detail=False, methods=['post'], url_path='match')
+    def match(self, request: Request) -> Response:
+        """
+        Runs the transfer matching over all the user's transactions, or those between `from_date` and
+        `to_date`, linking the debits and credits not linked yet. Uploads already match their new rows.
+
+        :param request: The HTTP request, optionally carrying `from_date` and `to_date`.
+        :return: A Response containing the number of links created.
+        """
+        serializer = MatchTransfersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        home_tz = ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz"))
+        from_date, to_date = serializer.validated_data.get('from_date'), serializer.validated_data.get('to_date')
+        with transaction.atomic():
+            links = match_transfers(request.user,
+                                    datetime.combine(from_date, time.min, home_tz) if from_date else None,
+                                    datetime.combine(to_date, time.max, home_tz) if to_date else None)
+            if links > 0:
+                bump_data_version(request.user)
+
+        return Response({'links': links})
+
+
+class RecurringSeriesViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
+    serializer_class = RecurringSeriesSerializer
+    pagination_class = DefaultPagination
+
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['account', 'credit_card', 'direction']
+
+    def get_queryset(self):
+        return RecurringSeries.objects.filter(user=self.request.user, is_recurring=True).order_by('next_date', 'id')
+
+    @conditional_on_data_version
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'], url_path='refresh')
+    def refresh(self, request: Request) -> Response:
+        """
+        Detects the recurring series over all the user's transactions again, e.g. after changing the
+        `[Recurring]` settings. Uploads and file deletions keep the series up to date on their own.
+
+        :param request: The HTTP request.
+        :return: A Response containing the number of recurring series found.
+        """
+        with transaction.atomic():
+            recurring = refresh_series(request.user)
+            bump_data_version(request.user)
+
+        return Response({'recurring': recurring})
+
+
+class AnomalyViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
+    serializer_class = AnomalySerializer
+    pagination_class = DefaultPagination
+
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = AnomalyFilter
+
+    def get_queryset(self):
+        return Anomaly.objects.filter(user=self.request.user).select_related('txn', 'card_txn').order_by(
+            '-txn_date', '-id')
+
+    @conditional_on_data_version
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'], url_path='refresh')
+    def refresh(self, request: Request) -> Response:
+        """
+        Scores all the user's debits for anomalies again, e.g. after changing the `[Anomalies]` settings.
+        Uploads, group changes and file deletions keep the anomalies up to date on their own.
+
+        :param request: The HTTP request.
+        :return: A Response containing the number of anomalies found.
+        """
+        with transaction.atomic():
+            anomalies = refresh_anomalies(request.user)
+            bump_data_version(request.user)
+
+        return Response({'anomalies': anomalies})
+
+
+class CategoryViewSet(ModelViewSet):
+    serializer_class = CategorySerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return Category.objects.filter(user=self.request.user).order_by('parent_id', 'name')
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            insert_node(serializer.save(user=self.request.user))
+            bump_data_version(self.request.user)
+
+    def update(self, request, *args, **kwargs) -> Response:
+        try:
+            return super().update(request, *args, **kwargs)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            category = serializer.instance
+            parent = serializer.validated_data.pop('parent', category.parent)
+            if parent != category.parent:
+                move_node(category, parent)
+            serializer.save()
+            bump_data_version(self.request.user)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            bump_data_version(self.request.user)
+
+    @action(detail=True, methods=['get', 'post'], url_path='groups')
+    def groups(self, request: Request, pk: int) -> Response:
+        """
+        Lists the groups assigned to the category, or assigns the `grp_names` in the request data to it,
+        moving them from the category they were assigned to.
+
+        :param request: The HTTP request, carrying `grp_names` when assigning.
+        :param pk: The primary key of the category.
+        :return: A Response containing the groups of the category, or the number of groups assigned.
+        """
+        category = self.get_object()
+        if request.method == 'GET':
+            return Response({'grp_names': list(category.groups.order_by('grp_name').values_list('grp_name',
+                                                                                                flat=True))})
+
+        serializer = CategoryGroupsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            assigned = assign_groups(request.user, category, serializer.validated_data['grp_names'])
+            bump_data_version(request.user)
+
+        return Response({'assigned': assigned})
+
+    @action(detail=True, methods=['post'], url_path='remove-groups')
+    def remove_groups(self, request: Request, pk: int) -> Response:
+        """
+        Unassigns the `grp_names` in the request data from the category.
+
+        :param request: The HTTP request containing `grp_names`.
+        :param pk: The primary key of the category.
+        :return: A Response containing the number of groups unassigned.
+        """
+        category = self.get_object()
+        serializer = CategoryGroupsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            removed, _ = CategoryGroup.objects.filter(category=category,
+                                                      grp_name__in=serializer.validated_data['grp_names']).delete()
+            bump_data_version(request.user)
+
+        return Response({'removed': removed})
+
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -76,3 +335,42 @@ def get_parsers(_request: Request) -> Response:
     :return: A response object containing the list of supported parsers.
     """
     return Response(SUPPORTED_PARSERS)
+
+
+def db_connection_samples() -> list[tuple[dict, int]]:
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT state, count(*) FROM pg_stat_activity "
+                           "WHERE datname = current_database() GROUP BY state")
+            return [({'state': state or 'unknown'}, count) for state, count in cursor.fetchall()]
+    # Other backends have no server-side view, report the connections held by the scraping process instead
+    return [({'state': 'open'}, sum(1 for conn in connections.all() if conn.connection is not None))]
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def metrics(request: Request) -> HttpResponse:
+    """
+    Exposes request, ingestion and grouper metrics collected by all worker processes in the
+    Prometheus text format, along with database connection and file status gauges computed at
+    scrape time. The gauges span all users, so the endpoint is off unless `[Metrics] endpoint`
+    is on, and then only answers the `[Metrics] allowed_ips` when given.
+
+    :param request: The incoming HTTP request from the scraper.
+    :return: A plain text response in the Prometheus exposition format.
+    """
+    if not settings.USER_SETTINGS.getboolean('Metrics', 'endpoint'):
+        raise Http404()
+    allowed_ips = [ip.strip() for ip in settings.USER_SETTINGS.get('Metrics', 'allowed_ips').split(',') if ip.strip()]
+    if allowed_ips and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        raise PermissionDenied()
+
+    file_counts = FileAudit.objects.values('op_desc', 'status').annotate(count=Count('id')).order_by()
+
+    body = REGISTRY.render()
+    body += format_gauge('moneyflow_files', "Audited files by operation and status.",
+                         [({'op_desc': row['op_desc'], 'status': row['status']}, row['count'])
+                          for row in file_counts])
+    body += format_gauge('moneyflow_db_connections', "Database connections by state.", db_connection_samples())
+
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
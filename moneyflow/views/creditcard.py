@@ -1,8 +1,10 @@
-import json
+from csv import DictReader
 from datetime import datetime
+from typing import Iterator
 
 from django.db import transaction
-from django.db.models import QuerySet
+from django.db.models import Count, ProtectedError, Q, QuerySet, Sum
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
@@ -13,19 +15,35 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
-from ..file_actions import get_reader, get_group
+from core.metrics import UPLOADS, UPLOAD_ROWS, UPLOAD_SECONDS
+from tags.rules import RuleMatcher
+from tags.views import BulkTagMixin
+from ..anomalies import refresh_anomalies, update_anomalies
+from ..caching import cache_response
+from ..columnar import summarize
+from ..deletion import FileDeletion
+from ..file_actions import StageTimer, count_renders, get_reader, get_group
 from ..filters import CreditTransactionFilter, CreditSearchFilter
+from ..locking import ingestion_lock
 from ..models import FileAudit
 from ..pagination import DefaultPagination
+from ..preview import preview_rows
 from ..serializers.creditcard_serializers import *
+from ..recurring import refresh_series, update_series
+from ..transfers import match_transfers
+from ..upload_store import file_sha256, open_blob
+from ..versioning import bump_data_version, conditional_on_data_version
+from .analytics import CategoryRollupMixin, ColumnarAnalyticsMixin
+from .bulk import BulkGroupUpdateMixin
 
 
-class CreditCardViewSet(ModelViewSet):
+class CreditCardViewSet(CategoryRollupMixin, ColumnarAnalyticsMixin, ModelViewSet):
     serializer_class = CreditCardSerializer
     pagination_class = None
 
     filter_backends = [CreditSearchFilter]
     filterset_class = CreditTransactionFilter
+    columnar_source = 'CC'
     ordering_fields = ['txn_date', 'grp_name', 'amt', 'is_credit']
 
     def get_queryset(self) -> QuerySet:
@@ -45,17 +63,16 @@ class CreditCardViewSet(ModelViewSet):
             return Response({'error': 'Card is accosiated with transactions!'}, status=status.HTTP_400_BAD_REQUEST)
         return super().destroy(request, *args, **kwargs)
 
-    @action(detail=False, methods=['get'], url_path='all-txns', url_name='cct-all')
-    def all_transactions(self, request: Request) -> Response:
-        """
-        Handles the retrieval of all credit transactions associated with the authenticated user. The method
-        applies search, filtering, and ordering to the transactions based on the provided request parameters.
-        It retrieves user-specific transactions, optionally filters them by file IDs, and prepares the
-        resulting queryset for paginated or non-paginated response in case of problems with pagination.
+    def perform_update(self, serializer):
+        # Balance thresholds and names show up in the cached reads of the transaction data
+        with transaction.atomic():
+            serializer.save()
+            bump_data_version(self.request.user)
 
-        :param request: The HTTP request object containing user authentication, filters, and optional file IDs.
-        :return: A paginated or complete response containing serialized transaction data matching the user's
-                 query and filters.
+    def filter_transactions(self, request: Request) -> QuerySet:
+        """
+        Builds the queryset of the authenticated user's credit transactions with the search, filter and
+        ordering backends applied, optionally restricted to the `file_ids` in the request data.
         """
         queryset = CreditTransaction.objects.filter(src_file__user=request.user).order_by('-txn_date', '-id')
 
@@ -70,6 +87,24 @@ class CreditCardViewSet(ModelViewSet):
         if request.data.get("file_ids", None):
             queryset = queryset.filter(src_file_id__in=request.data["file_ids"])
 
+        return queryset
+
+    @action(detail=False, methods=['get'], url_path='all-txns', url_name='cct-all')
+    @conditional_on_data_version
+    @cache_response
+    def all_transactions(self, request: Request) -> Response:
+        """
+        Handles the retrieval of all credit transactions associated with the authenticated user. The method
+        applies search, filtering, and ordering to the transactions based on the provided request parameters.
+        It retrieves user-specific transactions, optionally filters them by file IDs, and prepares the
+        resulting queryset for paginated or non-paginated response in case of problems with pagination.
+
+        :param request: The HTTP request object containing user authentication, filters, and optional file IDs.
+        :return: A paginated or complete response containing serialized transaction data matching the user's
+                 query and filters.
+        """
+        queryset = self.filter_transactions(request)
+
         queryset = queryset.select_related('src_file')
         queryset = self.filter_queryset(queryset)
         paginator = DefaultPagination()
@@ -82,6 +117,38 @@ class CreditCardViewSet(ModelViewSet):
         serializer = TransactionSerializer(queryset, many=True)
         return Response(serializer.data)
 
+    def summary_aggregates(self) -> dict:
+        return {
+            'txns': Count('id'),
+            'debit': Sum('amt', filter=Q(is_credit=False), default=0),
+            'credit': Sum('amt', filter=Q(is_credit=True), default=0),
+        }
+
+    @action(detail=False, methods=['get'], url_path='summary', url_name='cct-summary')
+    @conditional_on_data_version
+    @cache_response
+    def summary(self, request: Request) -> Response:
+        """
+        Summarize the authenticated user's credit transactions per group. The same search and filters
+        as `all-txns` apply, so any listed selection can be totalled.
+
+        :param request: The HTTP request object containing user authentication and filters.
+        :return: A response with the overall transaction count and debit/credit totals, and the same
+            figures for each group ordered by the amount spent. With `categories` or a `category`, also the
+            same figures for each child category.
+        """
+        selection = self.columnar_selection(request, cached_only=True)
+        if selection:
+            return Response(self.with_rollup(request, summarize(*selection)))
+
+        queryset = self.filter_transactions(request).order_by()
+        aggregates = self.summary_aggregates()
+
+        totals = queryset.aggregate(**aggregates)
+        groups = queryset.values('grp_name').annotate(**aggregates).order_by('-debit', 'grp_name')
+
+        return Response(self.with_rollup(request, {**totals, 'groups': list(groups)}))
+
     @action(detail=True, methods=['post'], url_path='upload')
     def upload_transaction_file(self, request: Request, pk: int) -> Response:
         """
@@ -91,7 +158,9 @@ class CreditCardViewSet(ModelViewSet):
         status updates.
 
         :param request: The HTTP request object containing the uploaded file and additional
-            parameters for file processing, such as date format and parser choice.
+            parameters for file processing, such as date format and parser choice. With `preview`,
+            only the first `preview_rows` rows are parsed and returned normalized with the issues
+            found in them, without saving anything.
 
         :param pk: The primary key identifying the credit card account to which transactions
             relate.
@@ -109,6 +178,30 @@ class CreditCardViewSet(ModelViewSet):
 
         uploaded_file = request.FILES.get('file')
 
+        if serializer.validated_data['preview']:
+            timer = StageTimer()
+            try:
+                reader = get_reader(uploaded_file, parser, timer=timer, lazy=True)
+            except Exception as e:
+                return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+            preview = preview_rows(reader, 'CC', serializer.validated_data['preview_rows'], dt_format,
+                                   serializer.validated_data['grouper'], timer)
+            return Response({'file': uploaded_file.name, 'parser': parser, 'dt_format': dt_format, **preview,
+                             'timings_ms': timer.summary()['timings_ms']}, status=status.HTTP_200_OK)
+
+        timer = StageTimer()
+        with timer.stage('store'):
+            sha256 = file_sha256(uploaded_file)
+        # The same file loaded before is only loaded again once its transactions are deleted
+        loaded = FileAudit.objects.filter(op_desc='CC_TXN_UPLOAD', user=request.user, to_id=cc.id, sha256=sha256,
+                                          status='LOADED').first()
+        if loaded:
+            return Response({
+                'file': loaded.file_name,
+                'id': loaded.id,
+                'message': "File already uploaded, reprocess it to load it with other options"
+            }, status=status.HTTP_200_OK)
+
         txns = []
         op_json = {"dt_format": dt_format, "parser": parser}
 
@@ -117,59 +210,219 @@ class CreditCardViewSet(ModelViewSet):
         else:
             op_json["grouper"] = None
 
-        op_json = json.dumps(op_json)
-
         audit_log = FileAudit.objects.create(
             file_name=uploaded_file.name,
             to_id=cc.id,
             op_desc='CC_TXN_UPLOAD',
             status='LOADING',
             op_args=op_json,
+            sha256=sha256,
             user=request.user
         )
 
+        rows_read = 0
+        transfers = 0
+        recurring = 0
+        anomalies = 0
+        tagged = 0
         try:
-            reader = get_reader(uploaded_file, parser)
-            with transaction.atomic():
-                for row in reader:
-                    txns.append(CreditTransaction(
-                        credit_card=cc,
-                        txn_date=timezone.make_aware(datetime.strptime(row['txn_date'], dt_format),
-                                                     ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz"))),
-                        txn_desc=row['txn_desc'],
-                        grp_name=get_group(serializer.validated_data['grouper'], row['txn_desc']),
-                        amt=row['amt'],
-                        is_credit=row['is_credit'] == 'Y',
-                        src_file=audit_log
-                    ))
-                CreditTransaction.objects.bulk_create(txns)
+            reader = get_reader(uploaded_file, parser, timer=timer, sha256=sha256)
+            with ingestion_lock(cc, timer) as lock_wait_ms:
+                # Checked under the lock, so concurrent uploads of the same file load it once
+                if FileAudit.objects.filter(op_desc='CC_TXN_UPLOAD', user=request.user, to_id=cc.id, sha256=sha256,
+                                            status='LOADED').exists():
+                    raise ValueError("File already uploaded")
+
+                for this_txn in self.read_transactions(reader, cc, audit_log, serializer.validated_data, timer):
+                    rows_read += 1
+                    txns.append(this_txn)
+                with timer.stage('tag'):
+                    matcher = RuleMatcher.for_owner(request.user, credit_card_id=cc.id)
+                    matches = matcher.match(txns)
+                with timer.stage('insert'):
+                    CreditTransaction.objects.bulk_create(txns)
+                with timer.stage('tag'):
+                    tagged = matcher.tag(txns, matches)
+                with timer.stage('match'):
+                    transfers = match_transfers(request.user, src_file=audit_log)
+                with timer.stage('recurring'):
+                    recurring = update_series(audit_log)
+                with timer.stage('anomalies'):
+                    anomalies = update_anomalies(audit_log)
+                bump_data_version(request.user)
                 audit_log.status = 'LOADED'
+                audit_log.record_totals(txns)
                 audit_log.save()
             return Response({
                 'file': audit_log.file_name,
                 'id': audit_log.id,
+                'transfers': transfers,
+                'recurring': recurring,
+                'anomalies': anomalies,
+                'tagged': tagged,
+                'lock_wait_ms': lock_wait_ms,
             }, status=status.HTTP_201_CREATED)
         except ValueError as e:
             audit_log.status = 'ERROR'
-            audit_log.op_add_txt = json.dumps({'error': f"{e.__class__.__name__}: {e}"})
+            audit_log.op_add_txt = {'error': f"{e.__class__.__name__}: {e}", 'error_class': e.__class__.__name__}
             audit_log.save()
             return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             audit_log.status = 'ERROR'
-            audit_log.op_add_txt = json.dumps({'error': f"{e.__class__.__name__}: {e}"})
+            audit_log.op_add_txt = {'error': f"{e.__class__.__name__}: {e}", 'error_class': e.__class__.__name__}
             audit_log.save()
             return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            audit_log.op_stats = timer.summary(parser=parser, bytes=uploaded_file.size, rows_read=rows_read,
+                                               rows_inserted=len(txns) if audit_log.status == 'LOADED' else 0)
+            audit_log.save(update_fields=['op_stats'])
+
+            UPLOADS.inc(parser=parser, status=audit_log.status)
+            UPLOAD_ROWS.inc(audit_log.op_stats['rows_inserted'], parser=parser)
+            UPLOAD_SECONDS.inc(audit_log.op_stats['timings_ms']['total'] / 1000, parser=parser)
+            count_renders(serializer.validated_data['grouper'], rows_read)
+
+    @staticmethod
+    def read_transactions(reader: DictReader, cc: CreditCard, audit_log: FileAudit, options: dict,
+                          timer: StageTimer) -> Iterator[CreditTransaction]:
+        """
+        Builds the transactions of the rows of an uploaded file.
+
+        :param options: The validated upload options, giving the date format and the grouper.
+        :return: An iterator over the transaction of every row.
+        """
+        for row in reader:
+            with timer.stage('dates'):
+                txn_date = timezone.make_aware(datetime.strptime(row['txn_date'], options['dt_format']),
+                                               ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz")))
+            with timer.stage('group'):
+                grp_name = get_group(options['grouper'], row['txn_desc'])
+
+            yield CreditTransaction(
+                credit_card=cc,
+                txn_date=txn_date,
+                txn_desc=row['txn_desc'],
+                grp_name=grp_name,
+                amt=row['amt'],
+                is_credit=row['is_credit'] == 'Y',
+                src_file=audit_log
+            )
+
+    @action(detail=True, methods=['post'], url_path='reprocess', url_name='cc-reprocess')
+    def reprocess_file(self, request: Request, pk: int) -> Response:
+        """
+        Loads an uploaded file again from the upload store with other upload options, so that changing
+        the parser, date format or grouper of a file needs no new upload. The transactions of the file
+        are replaced by the new ones in a single database transaction.
+
+        :param request: The HTTP request containing the `file_id` of the file and the upload options,
+            as for uploads but without the file.
+        :param pk: The primary key of the credit card the file was uploaded to.
+        :return: Response containing the number of transactions replaced and loaded, or an error
+            message in case of failure. Files not found in the store are answered with
+            HTTP_404_NOT_FOUND, and files without rows with HTTP_422_UNPROCESSABLE_ENTITY, in which
+            case the file keeps its transactions.
+        """
+        cc = self.get_object()
+
+        serializer = TransactionFileReprocessSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        dt_format = serializer.validated_data['dt_format']
+        parser = serializer.validated_data['parser']
+
+        audit_log = (FileAudit.objects.filter(op_desc='CC_TXN_UPLOAD', user=request.user, to_id=cc.id,
+                                              pk=serializer.validated_data['file_id'], sha256__isnull=False)
+                     .exclude(status__in=['LOADING', 'DELETING', 'DELETED']).first())
+        if audit_log is None:
+            return Response({'error': "File not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        op_json = {"dt_format": dt_format, "parser": parser}
+
+        if serializer.validated_data["grouper"]:
+            op_json["grouper"] = serializer.validated_data["grouper"].name[2:-3]
+        else:
+            op_json["grouper"] = None
+
+        timer = StageTimer()
+        deletion = FileDeletion([audit_log], request.user)
+        try:
+            deletion.check()
+            with open_blob(audit_log.sha256) as blob:
+                reader = get_reader(blob, parser, timer=timer)
+
+            with ingestion_lock(cc, timer) as lock_wait_ms:
+                model, bounds = deletion.plan(audit_log)
+                groups = set(audit_log.credit_transactions.order_by().values_list('grp_name', flat=True).distinct())
+                for _ in deletion.delete_transactions(audit_log, model, bounds):
+                    pass
+
+                txns = list(self.read_transactions(reader, cc, audit_log, serializer.validated_data, timer))
+                count_renders(serializer.validated_data['grouper'], len(txns))
+                if len(txns) == 0:
+                    # Keep the transactions of the file
+                    transaction.set_rollback(True)
+                else:
+                    with timer.stage('tag'):
+                        matcher = RuleMatcher.for_owner(request.user, credit_card_id=cc.id)
+                        matches = matcher.match(txns)
+                    with timer.stage('insert'):
+                        CreditTransaction.objects.bulk_create(txns)
+                    with timer.stage('tag'):
+                        tagged = matcher.tag(txns, matches)
+                    with timer.stage('match'):
+                        transfers = match_transfers(request.user, src_file=audit_log)
+                    # The series and anomalies the old transactions were part of are detected again without them
+                    with timer.stage('recurring'):
+                        recurring = refresh_series(request.user, credit_card_id=cc.id)
+                    with timer.stage('anomalies'):
+                        anomalies = refresh_anomalies(request.user, 'CC',
+                                                      sorted(groups | {txn.grp_name for txn in txns}))
+                    bump_data_version(request.user)
+
+                    audit_log.status = 'LOADED'
+                    audit_log.op_add_txt = {'reprocessed_from': audit_log.op_args}
+                    audit_log.op_args = op_json
+                    audit_log.op_stats = timer.summary(parser=parser, bytes=audit_log.op_stats.get('bytes'),
+                                                       rows_read=len(txns), rows_inserted=len(txns),
+                                                       rows_deleted=bounds['rows'])
+                    audit_log.record_totals(txns)
+                    audit_log.save()
+
+            if len(txns) == 0:
+                return Response({'message': "File did not meet conditions", 'lock_wait_ms': lock_wait_ms},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            return Response({
+                'file': audit_log.file_name,
+                'id': audit_log.id,
+                'replaced_txns': bounds['rows'],
+                'txns': len(txns),
+                'transfers': transfers,
+                'recurring': recurring,
+                'anomalies': anomalies,
+                'tagged': tagged,
+                'lock_wait_ms': lock_wait_ms,
+            }, status=status.HTTP_200_OK)
+        except FileNotFoundError:
+            return Response({'error': "File not found in the upload store"}, status=status.HTTP_404_NOT_FOUND)
+        except ProtectedError as e:
+            return Response({'error': e.args[0]}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({'error': f"{e.__class__.__name__}: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=['post'], url_path='delete-txn-files', url_name='cct-delete-by-files')
-    def delete_file(self, request: Request, pk: int) -> Response:
+    def delete_file(self, request: Request, pk: int) -> Response | StreamingHttpResponse:
         """
-        Handles the deletion of specific transaction files related to a given object.
+        Handles the deletion of the transactions of specific transaction files related to a given object.
 
-        The method retrieves the associated object and deletes the specified files
-        based on their IDs. The operation is atomic, ensuring that the database state
-        is not partially updated if an error occurs during execution.
+        The method retrieves the associated object and deletes the transactions of the specified
+        files based on their IDs, in chunks with raw deletes rather than through Django's deletion
+        collector. The files are kept as the audit trail with the status `DELETED`.
 
-        :param request: The HTTP request containing the file IDs to delete in the payload.
+        :param request: The HTTP request containing the file IDs to delete in the payload, and
+            optionally `progress` to stream the progress back as newline delimited JSON.
         :param pk: The primary key of the credit card to which the transaction files are tied.
         :return: A Response containing the deletion status and details of the deleted files,
             or an error message with the respective status code.
@@ -181,20 +434,26 @@ class CreditCardViewSet(ModelViewSet):
         else:
             return Response({'error': "File IDs not specified"}, status=status.HTTP_400_BAD_REQUEST)
 
-        with transaction.atomic():
-            queryset = FileAudit.objects.filter(op_desc='CC_TXN_UPLOAD', to_id=cc.id, pk__in=file_ids)
+        audit_files = list(FileAudit.objects.filter(op_desc='CC_TXN_UPLOAD', to_id=cc.id, pk__in=file_ids)
+                           .exclude(status='DELETED'))
 
-            if queryset.count() == 0:
-                return Response({'error': "File not found"}, status=status.HTTP_404_NOT_FOUND)
+        if len(audit_files) == 0:
+            return Response({'error': "File not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            deleted_count, deleted_details = queryset.delete()
-            return Response({
-                "message": f"Successfully deleted {deleted_count} entries(s).",
-                "details": deleted_details
-            }, status=status.HTTP_200_OK)
+        deletion = FileDeletion(audit_files, request.user)
+        try:
+            deletion.check()
+        except ProtectedError as e:
+            return Response({'error': e.args[0]}, status=status.HTTP_409_CONFLICT)
+
+        if request.data.get("progress"):
+            return StreamingHttpResponse(deletion.stream(), content_type='application/x-ndjson')
+
+        return Response(deletion.run(), status=status.HTTP_200_OK)
 
 
-class TransactionViewSet(RetrieveModelMixin, UpdateModelMixin, ListModelMixin, GenericViewSet):
+class TransactionViewSet(BulkGroupUpdateMixin, BulkTagMixin, RetrieveModelMixin, UpdateModelMixin, ListModelMixin,
+                         GenericViewSet):
     serializer_class = TransactionSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     pagination_class = DefaultPagination
@@ -207,3 +466,19 @@ class TransactionViewSet(RetrieveModelMixin, UpdateModelMixin, ListModelMixin, G
         return CreditTransaction.objects.filter(credit_card__id=self.kwargs['cc_pk'],
                                                 src_file__user=self.request.user
                                                 ).select_related('src_file', 'credit_card').order_by('-txn_date', 'id')
+
+    @conditional_on_data_version
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_on_data_version
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            old_group = serializer.instance.grp_name
+            txn = serializer.save()
+            refresh_anomalies(self.request.user, 'CC', sorted({old_group, txn.grp_name}))
+            bump_data_version(self.request.user)
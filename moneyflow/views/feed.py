@@ -0,0 +1,50 @@
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.viewsets import GenericViewSet
+
+from ..caching import cache_response
+from ..feed import encode_cursor, feed_page
+from ..serializers.common_serializers import FeedSerializer
+from ..versioning import conditional_on_data_version
+
+
+class FeedViewSet(GenericViewSet):
+    @conditional_on_data_version
+    @cache_response
+    def list(self, request: Request) -> Response:
+        """
+        Lists the user's bank and card transactions merged into a single timeline, newest first, with
+        keyset pagination. Amounts are signed, positive for money coming in.
+
+        :param request: The HTTP request with the optional `cursor` and `page_size` and the feed filters:
+            `source` (ACC or CC), `account__in`, `credit_card__in`, `txn_date__gte`, `txn_date__lte`,
+            `amount__gte`, `amount__lte`, `grp_name` and `search`.
+        :return: A Response containing the page of transactions and the link to the next page.
+        """
+        serializer = FeedSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        rows, has_more = feed_page(request.user, serializer.validated_data, serializer.validated_data['page_size'],
+                                   serializer.validated_data.get('cursor'))
+
+        home_tz = ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz"))
+        results = [{
+            'source': row['source'],
+            'source_id': row['source_id'],
+            'id': row['id'],
+            'txn_date': row['txn_date'].astimezone(home_tz).isoformat(),
+            'txn_desc': row['txn_desc'],
+            'grp_name': row['grp_name'],
+            'amount': row['amount'],
+            'src_file': row['src_file_id'],
+        } for row in rows]
+
+        next_url = None
+        if has_more:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_cursor(rows[-1]))
+
+        return Response({'next': next_url, 'results': results})
@@ -0,0 +1,57 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def delete_unowned_tags(apps, schema_editor):
+    # Tags had no owner and no API before, so none of them can be attributed to a user
+    apps.get_model('tags', 'Tag').objects.filter(user__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('tags', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tags',
+                                    to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(delete_unowned_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags',
+                                    to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='taggeditem',
+            name='object_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='taggeditem',
+            name='tag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items',
+                                    to='tags.tag'),
+        ),
+        migrations.AddIndex(
+            model_name='taggeditem',
+            index=models.Index(fields=['content_type', 'object_id'], name='tagged_item_object_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='tag_user_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='taggeditem',
+            constraint=models.UniqueConstraint(fields=('tag', 'content_type', 'object_id'),
+                                               name='tagged_item_unique'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.1.2 on 2026-10-19 18:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moneyflow', '0008_anomaly'),
+        ('tags', '0002_tag_user_taggeditem_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pattern', models.CharField(blank=True, default='', max_length=255, verbose_name='Description Pattern')),
+                ('grp_name', models.CharField(blank=True, default='', max_length=1024, verbose_name='Group Name')),
+                ('min_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=16, null=True, verbose_name='Minimum Amount')),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=16, null=True, verbose_name='Maximum Amount')),
+                ('is_active', models.BooleanField(default=True)),
+                ('isrt_dt', models.DateTimeField(auto_now_add=True, verbose_name='Inserted Date')),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tag_rules', to='moneyflow.account')),
+                ('credit_card', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tag_rules', to='moneyflow.creditcard')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='tags.tag')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_rules', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.CheckConstraint(condition=models.Q(('account__isnull', True), ('credit_card__isnull', True), _connector='OR'), name='tag_rule_one_owner')],
+            },
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
@@ -5,10 +6,62 @@ from django.db import models
 
 class Tag(models.Model):
     name = models.CharField(max_length=100)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='tags')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='tag_user_name'),
+        ]
+
+    def __str__(self) -> str:
+        return self.name
 
 
 class TaggedItem(models.Model):
-    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    """
+    A tag on an object. The unique (tag, content_type, object_id) constraint doubles as the index of the objects
+    carrying a tag, and the (content_type, object_id) index as the one of the tags of an object.
+    """
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='items')
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
-    object_id = models.PositiveIntegerField()
+    object_id = models.PositiveBigIntegerField()
     content_object = GenericForeignKey()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'content_type', 'object_id'], name='tagged_item_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['content_type', 'object_id'], name='tagged_item_object_idx'),
+        ]
+
+
+class TagRule(models.Model):
+    """
+    Tags the transactions matching every condition it sets as they are loaded: a case insensitive description
+    pattern, a group name, an amount range, and the account or card the transactions belong to. Rules set on
+    neither an account nor a card apply to both.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='tag_rules')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='rules')
+    pattern = models.CharField(max_length=255, blank=True, default='', verbose_name="Description Pattern")
+    grp_name = models.CharField(max_length=1024, blank=True, default='', verbose_name="Group Name")
+    min_amount = models.DecimalField(max_digits=16, decimal_places=2, null=True, blank=True,
+                                     verbose_name="Minimum Amount")
+    max_amount = models.DecimalField(max_digits=16, decimal_places=2, null=True, blank=True,
+                                     verbose_name="Maximum Amount")
+    account = models.ForeignKey('moneyflow.Account', on_delete=models.CASCADE, null=True, blank=True,
+                                related_name='tag_rules')
+    credit_card = models.ForeignKey('moneyflow.CreditCard', on_delete=models.CASCADE, null=True, blank=True,
+                                    related_name='tag_rules')
+    is_active = models.BooleanField(default=True)
+    isrt_dt = models.DateTimeField(auto_now_add=True, verbose_name="Inserted Date")
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=models.Q(account__isnull=True) | models.Q(credit_card__isnull=True),
+                                   name='tag_rule_one_owner'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.tag}: {self.pattern or self.grp_name}"
@@ -0,0 +1,181 @@
+import re
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F, Model, Q, QuerySet
+
+from moneyflow.models import CreditTransaction, Transaction
+from .models import TaggedItem, TagRule
+from .tagging import tag_objects
+
+# A back reference, which points to another pattern's group once patterns are combined
+BACK_REFERENCE = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]')
+# The (?...) groups PostgreSQL reads the same as Python, flags and named groups aren't among them
+SHARED_GROUPS = ('(?:', '(?=', '(?!', '(?<=', '(?<!')
+
+
+def cents(amount) -> int:
+    return int(Decimal(str(amount)) * 100)
+
+
+def check_pattern(pattern: str) -> None:
+    """
+    Checks a rule's pattern keeps to the syntax Python's ``re`` and PostgreSQL's regular expressions read
+    alike, as rules match with the former while files are loaded and with the database's ``__iregex`` when
+    applied over the history.
+
+    :raises ValueError: When the pattern doesn't compile, or uses syntax the two read differently: word
+        boundaries, flags, named or atomic groups, possessive quantifiers and POSIX character classes.
+    """
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        raise ValueError(f"Invalid pattern: {e}") from e
+
+    # The index of the first character of the character class being read, if any
+    index, class_start = 0, None
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\':
+            if class_start is None and pattern[index + 1] in 'bB':
+                raise ValueError(f"\\{pattern[index + 1]} is not supported, word boundaries differ by database")
+            index += 2
+            continue
+        if class_start is not None:
+            if pattern.startswith(('[:', '[=', '[.'), index):
+                raise ValueError("POSIX character classes are not supported")
+            # A ] first in the class is one of its characters
+            if char == ']' and index > class_start:
+                class_start = None
+        elif char == '[':
+            class_start = index + 2 if pattern.startswith('[^', index) else index + 1
+        elif pattern.startswith('(?', index) and not pattern.startswith(SHARED_GROUPS, index):
+            raise ValueError("Only (?:...) groups, lookaheads and lookbehinds are supported")
+        elif char in '*+?}' and pattern[index + 1:index + 2] == '+':
+            raise ValueError("Possessive quantifiers are not supported")
+        index += 1
+
+
+class RuleMatcher:
+    """
+    The active tagging rules of an account's or card's transactions, compiled to be evaluated over a whole
+    batch of transactions at once. Amounts, groups and owners are compared as NumPy columns, and descriptions
+    are first screened with a single alternation of every pattern, so that each rule's own pattern only runs
+    over the distinct descriptions matching one of them. Patterns with back references, which would point to
+    the wrong group once combined, and patterns that can't be combined skip the screen, each rule's pattern
+    then runs over every description.
+    """
+
+    def __init__(self, rules: list[TagRule], source: str):
+        self.rules = rules
+        self.source = source
+        self.patterns = {rule.pk: re.compile(rule.pattern, re.IGNORECASE) for rule in rules if rule.pattern}
+        self.screen = None
+        if self.patterns and not any(BACK_REFERENCE.search(rule.pattern) for rule in rules):
+            try:
+                self.screen = re.compile('|'.join(f'(?:{rule.pattern})' for rule in rules if rule.pattern),
+                                         re.IGNORECASE)
+            except re.error:
+                # Such as two patterns naming a group the same
+                pass
+
+    @classmethod
+    def for_owner(cls, user, account_id: int = None, credit_card_id: int = None) -> 'RuleMatcher':
+        """
+        The matcher of the user's active rules applying to the transactions of the account or card.
+        """
+        rules = TagRule.objects.filter(user=user, is_active=True)
+        if account_id:
+            rules = rules.filter(Q(account_id=account_id) | Q(account__isnull=True), credit_card__isnull=True)
+        else:
+            rules = rules.filter(Q(credit_card_id=credit_card_id) | Q(credit_card__isnull=True), account__isnull=True)
+        return cls(list(rules.order_by('id')), 'ACC' if account_id else 'CC')
+
+    def match(self, txns: list[Transaction | CreditTransaction]) -> list[tuple[int, int]]:
+        """
+        Evaluates every rule over the transactions.
+
+        :param txns: The transactions, grouped but not necessarily saved yet.
+        :return: The distinct (index of the transaction, tag ID) pairs matched.
+        """
+        if not self.rules or not txns:
+            return []
+
+        if self.source == 'ACC':
+            amounts = np.array([cents(txn.dbt_amount) + cents(txn.cr_amount) for txn in txns], dtype=np.int64)
+        else:
+            amounts = np.array([cents(txn.amt) for txn in txns], dtype=np.int64)
+        groups = np.array([txn.grp_name for txn in txns], dtype=object)
+
+        descriptions = {}
+        desc_codes = np.fromiter((descriptions.setdefault(txn.txn_desc, len(descriptions)) for txn in txns),
+                                 dtype=np.int64, count=len(txns))
+        screened = [(code, txn_desc) for txn_desc, code in descriptions.items()
+                    if self.screen is None or self.screen.search(txn_desc)]
+
+        matches = set()
+        for rule in self.rules:
+            mask = np.ones(len(txns), dtype=bool)
+            if rule.min_amount is not None:
+                mask &= amounts >= cents(rule.min_amount)
+            if rule.max_amount is not None:
+                mask &= amounts <= cents(rule.max_amount)
+            if rule.grp_name:
+                mask &= groups == rule.grp_name
+            if rule.pk in self.patterns:
+                hits = np.zeros(len(descriptions), dtype=bool)
+                hits[[code for code, txn_desc in screened if self.patterns[rule.pk].search(txn_desc)]] = True
+                mask &= hits[desc_codes]
+            matches.update((int(index), rule.tag_id) for index in np.flatnonzero(mask))
+        return sorted(matches)
+
+    def tag(self, txns: list[Transaction | CreditTransaction], matches: list[tuple[int, int]]) -> int:
+        """
+        Writes the tags matched on the saved transactions with one bulk insert.
+
+        :return: The number of tags added.
+        """
+        content_type = ContentType.objects.get_for_model(txns[0]) if txns else None
+        items = TaggedItem.objects.bulk_create([
+            TaggedItem(tag_id=tag_id, content_type=content_type, object_id=txns[index].pk)
+            for index, tag_id in matches
+        ], batch_size=1000)
+        return len(items)
+
+
+def rule_queryset(rule: TagRule, model: type[Model]) -> QuerySet:
+    """
+    The user's transactions of the model matching the rule, as a single filtered queryset.
+    """
+    if model is Transaction:
+        queryset = Transaction.objects.filter(account__user=rule.user).annotate(
+            amount=F('dbt_amount') + F('cr_amount'))
+        if rule.account_id:
+            queryset = queryset.filter(account_id=rule.account_id)
+    else:
+        queryset = CreditTransaction.objects.filter(credit_card__user=rule.user).annotate(amount=F('amt'))
+        if rule.credit_card_id:
+            queryset = queryset.filter(credit_card_id=rule.credit_card_id)
+
+    if rule.pattern:
+        queryset = queryset.filter(txn_desc__iregex=rule.pattern)
+    if rule.grp_name:
+        queryset = queryset.filter(grp_name=rule.grp_name)
+    if rule.min_amount is not None:
+        queryset = queryset.filter(amount__gte=rule.min_amount)
+    if rule.max_amount is not None:
+        queryset = queryset.filter(amount__lte=rule.max_amount)
+    return queryset
+
+
+def apply_rule(rule: TagRule) -> int:
+    """
+    Applies the rule over the whole history with one ``INSERT ... SELECT`` per source it covers, skipping the
+    transactions already carrying its tag.
+
+    :return: The number of tags added.
+    """
+    models = [Transaction] if rule.account_id else [CreditTransaction] if rule.credit_card_id else \
+        [Transaction, CreditTransaction]
+    return sum(tag_objects([rule.tag], rule_queryset(rule, model)) for model in models)
@@ -0,0 +1,84 @@
+from rest_framework import serializers
+
+from moneyflow.models import Account, CreditCard
+from .models import Tag, TagRule
+from .rules import check_pattern
+
+
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ['id', 'name']
+
+    def validate_name(self, value):
+        tags = Tag.objects.filter(user=self.context['request'].user, name=value)
+        if self.instance is not None:
+            tags = tags.exclude(pk=self.instance.pk)
+        if tags.exists():
+            raise serializers.ValidationError("A tag with this name already exists")
+
+        return value
+
+
+class TagByFilterSerializer(serializers.Serializer):
+    tags = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+    def validate_tags(self, value):
+        tags = list(Tag.objects.filter(user=self.context['request'].user, pk__in=value))
+        if len(tags) != len(set(value)):
+            raise serializers.ValidationError("Unknown tags")
+
+        return tags
+
+
+class TagIdsSerializer(TagByFilterSerializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class TagSummarySerializer(serializers.Serializer):
+    from_date = serializers.DateField(required=False)
+    to_date = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get('from_date') and attrs.get('to_date') and attrs['from_date'] > attrs['to_date']:
+            raise serializers.ValidationError("From Date must be before To Date")
+
+        return attrs
+
+
+class TagRuleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TagRule
+        fields = ['id', 'tag', 'pattern', 'grp_name', 'min_amount', 'max_amount', 'account', 'credit_card',
+                  'is_active', 'isrt_dt']
+        read_only_fields = ['id', 'isrt_dt']
+
+    def get_fields(self):
+        fields = super().get_fields()
+        user = self.context['request'].user
+        fields['tag'].queryset = Tag.objects.filter(user=user)
+        fields['account'].queryset = Account.objects.filter(user=user)
+        fields['credit_card'].queryset = CreditCard.objects.filter(user=user)
+        return fields
+
+    def validate_pattern(self, value):
+        try:
+            check_pattern(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+        return value
+
+    def validate(self, attrs):
+        rule = {**({field: getattr(self.instance, field) for field in self.fields} if self.instance else {}),
+                **attrs}
+        if rule.get('account') and rule.get('credit_card'):
+            raise serializers.ValidationError("A rule can only apply to an account or a card")
+        if rule.get('min_amount') is not None and rule.get('max_amount') is not None \
+                and rule['min_amount'] > rule['max_amount']:
+            raise serializers.ValidationError("Minimum Amount must not exceed Maximum Amount")
+        if not (rule.get('pattern') or rule.get('grp_name') or rule.get('min_amount') is not None
+                or rule.get('max_amount') is not None):
+            raise serializers.ValidationError("A rule needs a pattern, a group name or an amount range")
+
+        return attrs
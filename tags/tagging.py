@@ -0,0 +1,59 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.db.models import F, QuerySet
+
+from .models import Tag, TaggedItem
+
+
+def tag_objects(tags: list[Tag], queryset: QuerySet) -> int:
+    """
+    Tags every object of the queryset with each of the tags, skipping the ones already tagged. Each tag is
+    applied with a single ``INSERT ... SELECT`` over the queryset, so the objects never leave the database.
+
+    :param tags: The tags to apply.
+    :param queryset: The objects to tag.
+    :return: The number of tags added.
+    """
+    content_type = ContentType.objects.get_for_model(queryset.model)
+    objects_sql, objects_params = queryset.order_by().annotate(object_pk=F('pk')).values(
+        'object_pk').query.sql_with_params()
+
+    qn = connections[queryset.db].ops.quote_name
+    meta = TaggedItem._meta
+    columns = [qn(meta.get_field(name).column) for name in ('tag', 'content_type', 'object_id')]
+    sql = (
+        "INSERT INTO {table} ({tag}, {content_type}, {object_id}) SELECT %s, %s, obj.{pk} FROM ({objects}) obj "
+        "WHERE NOT EXISTS (SELECT 1 FROM {table} item WHERE item.{tag} = %s AND item.{content_type} = %s "
+        "AND item.{object_id} = obj.{pk})"
+    ).format(table=qn(meta.db_table), tag=columns[0], content_type=columns[1], object_id=columns[2],
+             pk=qn('object_pk'), objects=objects_sql)
+
+    added = 0
+    with connections[queryset.db].cursor() as cursor:
+        for tag in tags:
+            cursor.execute(sql, [tag.pk, content_type.pk, *objects_params, tag.pk, content_type.pk])
+            added += cursor.rowcount
+    return added
+
+
+def untag_objects(tags: list[Tag], queryset: QuerySet) -> int:
+    """
+    Removes the tags from every object of the queryset with a single ``DELETE`` over a subquery.
+
+    :return: The number of tags removed.
+    """
+    deleted, _ = TaggedItem.objects.filter(
+        tag__in=tags, content_type=ContentType.objects.get_for_model(queryset.model),
+        object_id__in=queryset.order_by().values('pk'),
+    ).delete()
+    return deleted
+
+
+def filter_tagged(queryset: QuerySet, tag_ids: list[int]) -> QuerySet:
+    """
+    Restricts the queryset to the objects carrying any of the tags, as a semi-join on the tagged items index
+    that can't duplicate objects carrying several of them.
+    """
+    return queryset.filter(pk__in=TaggedItem.objects.filter(
+        tag_id__in=tag_ids, content_type=ContentType.objects.get_for_model(queryset.model),
+    ).values('object_id'))
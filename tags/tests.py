@@ -1,3 +1,87 @@
-from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
 
-# Create your tests here.
+from moneyflow.models import Transaction
+from moneyflow.tests import MoneyFlowTestCase
+from .models import Tag, TaggedItem, TagRule
+from .rules import RuleMatcher
+
+
+class BulkTagTests(MoneyFlowTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tag = Tag.objects.create(name="Monthly", user=cls.user)
+
+    def url(self, query: str) -> str:
+        return reverse('acc_transaction-tag', kwargs={'acc_pk': self.account.id}) + query
+
+    def tagged(self) -> list[str]:
+        return list(Transaction.objects.filter(tagged_items__tag=self.tag).order_by('txn_date')
+                    .values_list('txn_desc', flat=True))
+
+    def test_tag_by_ids(self):
+        txn = Transaction.objects.get(txn_desc="NEFT-RENT")
+        response = self.client.post(self.url(''), {'tags': [self.tag.id], 'ids': [txn.id]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.tagged(), ["NEFT-RENT"])
+
+    def test_tag_by_filter(self):
+        response = self.client.post(self.url('?search=RENT'), {'tags': [self.tag.id]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['tagged'], 1)
+        self.assertEqual(self.tagged(), ["NEFT-RENT"])
+
+    def test_non_filter_params_are_rejected(self):
+        for query in ('', '?page=2', '?ordering=txn_date', '?junk=1'):
+            with self.subTest(query=query):
+                response = self.client.post(self.url(query), {'tags': [self.tag.id]}, format='json')
+
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertFalse(TaggedItem.objects.exists())
+
+
+class TagListTests(MoneyFlowTestCase):
+    def test_created_tag_is_listed(self):
+        response = self.client.get(reverse('tags-list'))
+        self.assertEqual(response.data, [])
+        etag = response.headers['ETag']
+
+        response = self.client.post(reverse('tags-list'), {'name': "Monthly"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+        response = self.client.get(reverse('tags-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([tag['name'] for tag in response.data], ["Monthly"])
+
+
+class TagRuleTests(MoneyFlowTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.tag = Tag.objects.create(name="Monthly", user=cls.user)
+
+    def test_patterns_read_differently_by_the_database_are_rejected(self):
+        for pattern in (r'\bRENT', '(?i)rent', '(?P<kind>RENT)', 'REN+T++', '[[:alpha:]]', 'RENT('):
+            with self.subTest(pattern=pattern):
+                response = self.client.post(reverse('tag-rules-list'), {'tag': self.tag.id, 'pattern': pattern},
+                                            format='json')
+
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('pattern', response.data)
+
+        response = self.client.post(reverse('tag-rules-list'), {'tag': self.tag.id, 'pattern': r'[]\[^]-(?:RENT)'},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+    def test_patterns_with_back_references_skip_the_screen(self):
+        rules = [TagRule.objects.create(user=self.user, tag=self.tag, pattern=pattern)
+                 for pattern in ('(NEFT)', r'(R).*\1')]
+        txns = list(Transaction.objects.order_by('txn_date'))
+
+        matcher = RuleMatcher(rules, 'ACC')
+
+        self.assertIsNone(matcher.screen)
+        self.assertEqual(matcher.match(txns), [(0, self.tag.id), (1, self.tag.id), (2, self.tag.id)])
@@ -1,6 +1,12 @@
-from django.urls import path
+from django.urls import path, include
+from rest_framework.routers import SimpleRouter
+
 from . import views
 
+router = SimpleRouter()
+router.register('rules', views.TagRuleViewSet, basename='tag-rules')
+router.register('', views.TagViewSet, basename='tags')
+
 urlpatterns = [
-    # path('', views.say_hello, name='First!'),
+    path('', include(router.urls)),
 ]
@@ -1,3 +1,181 @@
-from django.shortcuts import render
+from datetime import datetime, time
+from zoneinfo import ZoneInfo
 
-# Create your views here.
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, QuerySet, Sum
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.viewsets import ModelViewSet
+
+from moneyflow.caching import cache_response
+from moneyflow.filters import has_filters
+from moneyflow.models import CreditTransaction, Transaction
+from moneyflow.versioning import bump_data_version, conditional_on_data_version
+from .models import Tag, TagRule
+from .rules import apply_rule
+from .serializers import TagByFilterSerializer, TagIdsSerializer, TagRuleSerializer, TagSerializer, \
+    TagSummarySerializer
+from .tagging import tag_objects, untag_objects
+
+
+class BulkTagMixin:
+    """
+    Bulk tagging actions for the nested transaction viewsets. Every action adds or removes the tags of all the
+    selected transactions with one set-based statement per tag, instead of one request per transaction.
+    """
+
+    def update_tags(self, request: Request, queryset: QuerySet, untag: bool = False) -> Response:
+        serializer = (TagIdsSerializer if 'ids' in request.data else TagByFilterSerializer)(
+            data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        if 'ids' in serializer.validated_data:
+            queryset = queryset.filter(id__in=serializer.validated_data['ids'])
+        elif not has_filters(self, request):
+            return Response({'error': "No ids or filters specified"}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            if untag:
+                updated = untag_objects(serializer.validated_data['tags'], queryset)
+            else:
+                updated = tag_objects(serializer.validated_data['tags'], queryset)
+            if updated > 0:
+                bump_data_version(request.user)
+        return Response({'untagged' if untag else 'tagged': updated})
+
+    @action(detail=False, methods=['post'], url_path='tag')
+    def tag(self, request: Request, **kwargs) -> Response:
+        """
+        Tags the transactions with the given `ids`, or without ids every transaction matching the filters and
+        search given as query parameters, the same ones accepted when listing the transactions.
+
+        :param request: The HTTP request containing the `tags` IDs and optionally the transaction `ids`.
+        :return: A Response containing the count of tags added.
+        """
+        return self.update_tags(request, self.filter_queryset(self.get_queryset()))
+
+    @action(detail=False, methods=['post'], url_path='untag')
+    def untag(self, request: Request, **kwargs) -> Response:
+        """
+        Removes tags from the transactions with the given `ids`, or from every transaction matching the filters
+        and search given as query parameters.
+
+        :param request: The HTTP request containing the `tags` IDs and optionally the transaction `ids`.
+        :return: A Response containing the count of tags removed.
+        """
+        return self.update_tags(request, self.filter_queryset(self.get_queryset()), untag=True)
+
+
+class TagViewSet(ModelViewSet):
+    serializer_class = TagSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return Tag.objects.filter(user=self.request.user).order_by('name')
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save(user=self.request.user)
+            bump_data_version(self.request.user)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+            bump_data_version(self.request.user)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            bump_data_version(self.request.user)
+
+    @conditional_on_data_version
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get'], url_path='summary')
+    @conditional_on_data_version
+    @cache_response
+    def summary(self, request: Request) -> Response:
+        """
+        Totals the transactions carrying each tag, for accounts and cards, optionally between `from_date` and
+        `to_date`. Each source is aggregated with one grouped query joining the tagged items.
+
+        :param request: The HTTP request, optionally carrying `from_date` and `to_date` as query parameters.
+        :return: A Response containing every tag with its transaction count and debit/credit totals.
+        """
+        serializer = TagSummarySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        home_tz = ZoneInfo(settings.USER_SETTINGS.get("Main", "home_tz"))
+        dates = Q()
+        if serializer.validated_data.get('from_date'):
+            dates &= Q(txn_date__gte=datetime.combine(serializer.validated_data['from_date'], time.min, home_tz))
+        if serializer.validated_data.get('to_date'):
+            dates &= Q(txn_date__lte=datetime.combine(serializer.validated_data['to_date'], time.max, home_tz))
+
+        accounts = Transaction.objects.filter(dates, account__user=request.user,
+                                              tagged_items__tag__user=request.user)
+        accounts = accounts.values(tag=F('tagged_items__tag')).annotate(
+            txns=Count('id'), dbt_amount=Sum('dbt_amount', default=0), cr_amount=Sum('cr_amount', default=0),
+        ).order_by()
+        cards = CreditTransaction.objects.filter(dates, credit_card__user=request.user,
+                                                 tagged_items__tag__user=request.user)
+        cards = cards.values(tag=F('tagged_items__tag')).annotate(
+            txns=Count('id'), debit=Sum('amt', filter=Q(is_credit=False), default=0),
+            credit=Sum('amt', filter=Q(is_credit=True), default=0),
+        ).order_by()
+
+        totals = {'ACC': {row.pop('tag'): row for row in accounts}, 'CC': {row.pop('tag'): row for row in cards}}
+        empty = {'ACC': {'txns': 0, 'dbt_amount': 0, 'cr_amount': 0}, 'CC': {'txns': 0, 'debit': 0, 'credit': 0}}
+        return Response({'tags': [
+            {'id': tag.id, 'name': tag.name, **{source: totals[source].get(tag.id, empty[source]) for source in totals}}
+            for tag in self.get_queryset()
+        ]})
+
+
+class TagRuleViewSet(ModelViewSet):
+    serializer_class = TagRuleSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return TagRule.objects.filter(user=self.request.user).select_related('tag').order_by('id')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(detail=True, methods=['post'], url_path='apply')
+    def apply(self, request: Request, pk: int) -> Response:
+        """
+        Applies the rule over all the user's transactions, e.g. after creating it. Uploads apply the active
+        rules to their new transactions on their own.
+
+        :param request: The HTTP request.
+        :param pk: The primary key of the rule.
+        :return: A Response containing the number of tags added.
+        """
+        rule = self.get_object()
+        with transaction.atomic():
+            tagged = apply_rule(rule)
+            if tagged > 0:
+                bump_data_version(request.user)
+
+        return Response({'tagged': tagged})
+
+    @action(detail=False, methods=['post'], url_path='apply')
+    def apply_all(self, request: Request) -> Response:
+        """
+        Applies every active rule over all the user's transactions, one set-based statement per rule and source.
+
+        :param request: The HTTP request.
+        :return: A Response containing the number of tags added per rule.
+        """
+        with transaction.atomic():
+            tagged = {rule.pk: apply_rule(rule) for rule in self.get_queryset().filter(is_active=True)}
+            if any(tagged.values()):
+                bump_data_version(request.user)
+
+        return Response({'tagged': sum(tagged.values()), 'rules': tagged})